@@ -0,0 +1,59 @@
+import functools
+import os
+import shutil
+import subprocess
+
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_binary():
+    """
+    The ffmpeg executable moviepy would pick (FFMPEG_BINARY, else imageio's
+    bundled one, else ffmpeg on PATH), resolved without importing moviepy, so
+    the subtitle and probe paths stay light.
+    """
+    binary = os.getenv("FFMPEG_BINARY", "ffmpeg-imageio")
+    if binary not in ("ffmpeg-imageio", "auto-detect"):
+        return binary
+    if binary == "ffmpeg-imageio":
+        try:
+            import imageio_ffmpeg
+            return imageio_ffmpeg.get_ffmpeg_exe()
+        except (ImportError, RuntimeError):
+            pass
+    return shutil.which("ffmpeg") or "ffmpeg"
+
+
+def stream_audio(path, rate=44100, channels=2, duration=None, loop=False, fade_out=0.0, block_sec=5.0):
+    """
+    Decode an audio file through ffmpeg and yield float32 (n, channels) blocks.
+    Only one block is held in memory at a time, whatever the file length.
+
+    loop      repeat the file until `duration` is reached (needs a duration)
+    fade_out  seconds of fade at the end of `duration`, applied inside ffmpeg
+    """
+    cmd = [ffmpeg_binary(), "-v", "error"]
+    if loop:
+        cmd += ["-stream_loop", "-1"]
+    cmd += ["-i", path]
+    if duration is not None:
+        cmd += ["-t", f"{duration:.3f}"]
+        if fade_out > 0:
+            fade_start = max(0.0, duration - fade_out)
+            cmd += ["-af", f"afade=t=out:st={fade_start:.3f}:d={fade_out:.3f}"]
+    cmd += ["-vn", "-f", "s16le", "-acodec", "pcm_s16le", "-ac", str(channels), "-ar", str(rate), "-"]
+
+    import numpy as np
+    block_bytes = int(block_sec * rate) * channels * 2
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            raw = proc.stdout.read(block_bytes)
+            if not raw:
+                break
+            samples = np.frombuffer(raw, dtype=np.int16).reshape(-1, channels)
+            yield samples.astype(np.float32) / 32768.0
+    finally:
+        proc.stdout.close()
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
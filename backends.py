@@ -0,0 +1,127 @@
+"""
+Backend registry: every pipeline stage names the function that implements it
+as "module:function", and the module is imported only when the stage runs.
+generate.py itself therefore starts without moviepy or any cloud SDK, and a
+--skip-tts render without --generate-images never touches google.cloud or openai.
+
+Usage:
+    python backends.py                 # list stages, backends and whether their modules are installed
+    python backends.py --cold-start    # measure generate.py startup in a fresh interpreter
+"""
+
+import argparse
+import importlib
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+
+# stage -> {backend name: "module:function"}
+BACKENDS = {
+    "tts": {"google": "tts_generator:generate_tts_for_script"},
+    "subtitles": {"srt": "subtitle_generator:generate_subtitles"},
+    "images": {"stability": "image_generator:generate_images_for_script"},
+    "renderer": {"moviepy": "video_builder:build_video"},
+}
+
+# Third-party packages each backend module needs, checked without importing them
+REQUIREMENTS = {
+    "tts_generator": ["google.cloud.texttospeech"],
+    "subtitle_generator": ["dotenv"],
+    "image_generator": ["openai", "requests"],
+    "video_builder": ["moviepy", "pydub", "scipy", "srt"],
+}
+
+# Overridable per stage, e.g. THINKTOK_TTS_BACKEND=google
+DEFAULT_BACKENDS = {stage: next(iter(names)) for stage, names in BACKENDS.items()}
+
+# Third-party packages the cold-start check must not find loaded after importing generate
+HEAVY_MODULES = ["moviepy", "google.cloud", "openai", "noisereduce", "scipy", "pydub"]
+COLD_START_TARGET_SEC = 0.5
+
+_loaded = {}
+
+
+def register_backend(stage, name, target):
+    """Add or replace a backend, e.g. register_backend("tts", "fake", "fake_services:fake_tts")."""
+    BACKENDS.setdefault(stage, {})[name] = target
+
+
+def backend_name(stage, name=None):
+    return name or os.getenv(f"THINKTOK_{stage.upper()}_BACKEND") or DEFAULT_BACKENDS[stage]
+
+
+def get_backend(stage, name=None):
+    """Import (once) and return the function for a stage."""
+    name = backend_name(stage, name)
+    try:
+        target = BACKENDS[stage][name]
+    except KeyError:
+        raise ValueError(f"Unknown {stage} backend '{name}' (choose from {', '.join(BACKENDS.get(stage, {}))})")
+    if target not in _loaded:
+        module_name, func_name = target.split(":")
+        _loaded[target] = getattr(importlib.import_module(module_name), func_name)
+    return _loaded[target]
+
+
+def missing_requirements(stage, name=None):
+    """Packages the backend needs that are not installed (found without importing them)."""
+    module_name = BACKENDS[stage][backend_name(stage, name)].split(":")[0]
+    missing = []
+    for package in [module_name] + REQUIREMENTS.get(module_name, []):
+        try:
+            found = importlib.util.find_spec(package) is not None
+        except ModuleNotFoundError:
+            found = False
+        if not found:
+            missing.append(package)
+    return missing
+
+
+def measure_cold_start(argv=("--help",)):
+    """
+    Time `import generate` plus argument parsing in a fresh interpreter, and list
+    which heavy modules that pulled in (there should be none).
+    """
+    probe = (
+        "import sys, time, json\n"
+        "t0 = time.perf_counter()\n"
+        "import generate\n"
+        "t1 = time.perf_counter()\n"
+        f"generate.build_parser().parse_known_args({list(argv)!r})\n"
+        "t2 = time.perf_counter()\n"
+        f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+        "print(json.dumps({'import_sec': t1 - t0, 'parse_sec': t2 - t1, 'heavy_modules': heavy}))\n"
+    )
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, env=env,
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode != 0:
+        raise RuntimeError(f"cold-start probe failed:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List pipeline backends or measure generate.py cold start")
+    parser.add_argument("--cold-start", action="store_true", help="Measure generate.py startup in a fresh interpreter")
+    parser.add_argument("--runs", type=int, default=5, help="Cold-start runs (the best is reported)")
+    args = parser.parse_args()
+
+    if args.cold_start:
+        results = [measure_cold_start(["--script", "scripts/test.txt", "--skip-tts"]) for _ in range(args.runs)]
+        best = min(results, key=lambda r: r["import_sec"] + r["parse_sec"])
+        total = best["import_sec"] + best["parse_sec"]
+        print(f"⏱️ generate.py cold start: {total * 1000:.0f} ms "
+              f"(import {best['import_sec'] * 1000:.0f} ms, argparse {best['parse_sec'] * 1000:.0f} ms)")
+        if best["heavy_modules"]:
+            print(f"❌ Heavy modules imported at startup: {', '.join(best['heavy_modules'])}")
+        status = "✅" if total < COLD_START_TARGET_SEC and not best["heavy_modules"] else "❌"
+        print(f"{status} Target: under {COLD_START_TARGET_SEC * 1000:.0f} ms with no heavy modules")
+        sys.exit(0 if status == "✅" else 1)
+
+    for stage, names in BACKENDS.items():
+        for name, target in names.items():
+            mark = "*" if name == backend_name(stage) else " "
+            missing = missing_requirements(stage, name)
+            print(f"{mark} {stage:<10}{name:<12}{target:<45}{'missing ' + ', '.join(missing) if missing else 'ok'}")
@@ -0,0 +1,292 @@
+"""
+Batch renderer: a persistent SQLite job queue worked by a pool of warm
+worker processes. Each worker imports moviepy/pydub, sets up the
+TTS client, decodes the SFX bank and touches the fonts once, then renders
+script after script. Jobs survive crashes: re-running picks up where it stopped.
+
+Usage:
+    python batch_render.py scripts/*.txt [--workers 4] [--timeout 900] [--db batch.sqlite]
+        [--retry-failed] [--force] [-- <generate.py options, e.g. --skip-tts --encoding preview>]
+
+Examples:
+    python batch_render.py scripts/*.txt -- --skip-tts
+    python batch_render.py --resume           # only process what is left in the queue
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+import traceback
+from multiprocessing.connection import wait
+
+DEFAULT_DB = "batch.sqlite"
+
+
+class JobQueue:
+    """Jobs table in SQLite. Only the coordinating process touches the database."""
+
+    def __init__(self, path=DEFAULT_DB):
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                script TEXT UNIQUE NOT NULL,
+                argv TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                started_at REAL,
+                finished_at REAL,
+                output TEXT,
+                error TEXT
+            )
+        """)
+        self.conn.commit()
+
+    def enqueue(self, script, argv, force=False):
+        """Add a script; an existing job keeps its status unless force re-queues it."""
+        existing = self.conn.execute("SELECT status FROM jobs WHERE script = ?", (script,)).fetchone()
+        if existing is None:
+            self.conn.execute("INSERT INTO jobs (script, argv) VALUES (?, ?)", (script, json.dumps(argv)))
+        elif force or existing[0] == "pending":
+            self.conn.execute("UPDATE jobs SET argv = ?, status = 'pending', error = NULL WHERE script = ?", (json.dumps(argv), script))
+        self.conn.commit()
+
+    def recover(self, retry_failed=False):
+        """Jobs left 'running' by a crashed batch go back to pending."""
+        statuses = ("running", "failed", "timeout") if retry_failed else ("running",)
+        placeholders = ",".join("?" for _ in statuses)
+        self.conn.execute(f"UPDATE jobs SET status = 'pending' WHERE status IN ({placeholders})", statuses)
+        self.conn.commit()
+
+    def claim(self):
+        row = self.conn.execute("SELECT id, script, argv FROM jobs WHERE status = 'pending' ORDER BY id LIMIT 1").fetchone()
+        if row is None:
+            return None
+        self.conn.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ? WHERE id = ?",
+            (time.time(), row[0]),
+        )
+        self.conn.commit()
+        return row[0], row[1], json.loads(row[2])
+
+    def release(self, job_id):
+        """Put a claimed job back as pending when it never reached a worker."""
+        self.conn.execute("UPDATE jobs SET status = 'pending', attempts = attempts - 1 WHERE id = ?", (job_id,))
+        self.conn.commit()
+
+    def finish(self, job_id, status, output=None, error=None):
+        self.conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, output = ?, error = ? WHERE id = ?",
+            (status, time.time(), output, error, job_id),
+        )
+        self.conn.commit()
+
+    def counts(self):
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def results(self, scripts):
+        """{script: (status, output)} for the given scripts."""
+        placeholders = ",".join("?" for _ in scripts)
+        rows = self.conn.execute(f"SELECT script, status, output FROM jobs WHERE script IN ({placeholders})", list(scripts))
+        return {script: (status, output) for script, status, output in rows}
+
+
+def warm_resources():
+    """Everything a render needs that does not depend on the script."""
+    import backends
+    import tts_generator
+    import video_builder
+    # Stage modules are imported lazily by generate.py; workers import them up front
+    for stage in ("subtitles", "renderer"):
+        backends.get_backend(stage)
+    video_builder.preload_sfx()
+    # The default layout is compiled once and shared by every job of the worker
+    plan = video_builder.get_plan()
+    try:
+        tts_generator.get_tts_client()
+    except Exception as e:
+        # --skip-tts batches run without cloud credentials
+        print(f"⚠️ TTS client not available in worker: {e}")
+    # Render one glyph per font so ImageMagick's font cache and the font files are hot
+    for font in plan.fonts:
+        if os.path.exists(font):
+            try:
+                video_builder.TextClip("가", font=font, fontsize=20, color="white", method="label")
+            except Exception as e:
+                print(f"⚠️ Could not warm font {font}: {e}")
+
+
+def check_job_options(args):
+    """
+    Options a queued job may not use. --stream-to starts a command and writes to
+    the worker's stdout, which only makes sense for an interactive generate.py run.
+    """
+    if args.stream_to is not None:
+        raise ValueError("--stream-to is not available for batch or daemon jobs")
+
+
+def worker_main(conn):
+    warm_resources()
+    from generate import build_parser, run_pipeline
+    conn.send(("ready", None, None, None))
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        job_id, argv = message
+        try:
+            args = build_parser().parse_args(argv)
+            check_job_options(args)
+            output = run_pipeline(args)
+            conn.send(("done", job_id, output, None))
+        except (Exception, SystemExit):
+            # SystemExit: argparse rejected the job's options; the worker stays up
+            conn.send(("failed", job_id, None, traceback.format_exc()))
+
+
+class Worker:
+    def __init__(self, context=None):
+        # context: a multiprocessing start method context (default: the platform's)
+        self.context = context or multiprocessing.get_context()
+        self.conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(target=worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        self.ready = False
+        self.job = None          # (job_id, script, started_at)
+
+    def start_job(self, job_id, argv):
+        """Hand a job to the worker; False if its process has gone away in the meantime."""
+        try:
+            self.conn.send((job_id, argv))
+            return True
+        except (BrokenPipeError, OSError):
+            return False
+
+    def respawn(self):
+        """A fresh warm worker in place of this one, which is killed if it is still around."""
+        self.stop(kill=True)
+        return Worker(self.context)
+
+    def stop(self, kill=False):
+        if kill:
+            self.process.terminate()
+        else:
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        self.process.join(timeout=10)
+
+
+def run_batch(queue, n_workers, timeout):
+    """Hand pending jobs to idle warm workers until the queue is empty; returns the number rendered."""
+    started = time.time()
+    workers = [Worker() for _ in range(n_workers)]
+    rendered = 0
+    try:
+        while True:
+            # Assign work to every ready, idle worker
+            for i, worker in enumerate(workers):
+                if worker.ready and worker.job is None:
+                    job = queue.claim()
+                    if job is None:
+                        break
+                    job_id, script, argv = job
+                    if not worker.start_job(job_id, argv):
+                        # The worker died while idle: the job goes back to the queue
+                        print(f"⚠️ Worker {worker.process.pid} is gone, re-queueing [{job_id}] {script}")
+                        queue.release(job_id)
+                        workers[i] = worker.respawn()
+                        continue
+                    worker.job = (job_id, script, time.time())
+                    print(f"▶ [{job_id}] {script} → worker {worker.process.pid}")
+
+            busy = [w for w in workers if w.job is not None or not w.ready]
+            if not busy:
+                break
+
+            # Idle workers are watched too, so one that dies between jobs is replaced
+            for conn in wait([w.conn for w in workers], timeout=1.0):
+                worker = next(w for w in workers if w.conn is conn)
+                died = False
+                try:
+                    status, job_id, output, error = conn.recv()
+                except EOFError:
+                    died = True
+                    status, job_id, output, error = "failed", worker.job[0] if worker.job else None, None, "worker process died"
+                if status == "ready":
+                    worker.ready = True
+                    continue
+                if not worker.ready:
+                    raise RuntimeError("Batch worker died while warming up; run generate.py once to see the error.")
+                if job_id is not None:
+                    queue.finish(job_id, status, output, error)
+                    elapsed = time.time() - worker.job[2]
+                    if status == "done":
+                        rendered += 1
+                        print(f"✅ [{job_id}] {worker.job[1]} in {elapsed:.1f}s")
+                    else:
+                        print(f"❌ [{job_id}] {worker.job[1]} failed:\n{error}")
+                worker.job = None
+                # After EOF the process may not be reaped yet, so is_alive() alone is not enough
+                if died or not worker.process.is_alive():
+                    workers[workers.index(worker)] = worker.respawn()
+
+            # Per-job timeout: kill the worker and start a fresh warm one in its place
+            for i, worker in enumerate(workers):
+                if worker.job and time.time() - worker.job[2] > timeout:
+                    job_id, script, _ = worker.job
+                    print(f"⏱️ [{job_id}] {script} exceeded {timeout}s, restarting worker")
+                    worker.stop(kill=True)
+                    queue.finish(job_id, "timeout", error=f"exceeded {timeout}s")
+                    workers[i] = Worker()
+    finally:
+        for worker in workers:
+            worker.stop(kill=worker.job is not None)
+
+    elapsed = time.time() - started
+    per_hour = rendered / elapsed * 3600 if elapsed > 0 else 0.0
+    print(f"📊 {rendered} reels in {elapsed:.1f}s with {n_workers} workers → {per_hour:.1f} reels/hour")
+    print(f"   Queue: {queue.counts()}")
+    return rendered
+
+
+def main():
+    argv = sys.argv[1:]
+    # Everything after "--" is passed to generate.py for every job
+    generate_argv = []
+    if "--" in argv:
+        split = argv.index("--")
+        argv, generate_argv = argv[:split], argv[split + 1:]
+
+    parser = argparse.ArgumentParser(description="Render many scripts with a pool of warm workers")
+    parser.add_argument("scripts", nargs="*", help="Script files to enqueue")
+    parser.add_argument("--db", default=DEFAULT_DB, help="SQLite job database")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="Worker processes")
+    parser.add_argument("--timeout", type=float, default=900, help="Seconds before a job is killed")
+    parser.add_argument("--retry-failed", action="store_true", help="Re-queue failed and timed-out jobs")
+    parser.add_argument("--force", action="store_true", help="Re-queue scripts that already rendered")
+    parser.add_argument("--resume", action="store_true", help="Only process jobs already in the queue")
+    args = parser.parse_args(argv)
+    if generate_argv:
+        from generate import build_parser
+        try:
+            check_job_options(build_parser().parse_args(["--script", "-", *generate_argv]))
+        except ValueError as e:
+            parser.error(str(e))
+
+    queue = JobQueue(args.db)
+    queue.recover(retry_failed=args.retry_failed)
+    if not args.resume:
+        for script in args.scripts:
+            queue.enqueue(script, ["--script", script, *generate_argv], force=args.force)
+    run_batch(queue, args.workers, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Lightweight onset / beat detection for background music, used to land scene
+cuts and transition SFX on the beat. Replaces the (disabled) librosa beat
+tracker: a NumPy spectral-flux envelope on 11 kHz mono audio, a tempo estimate
+from its autocorrelation and a fixed beat grid aligned to the strongest phase.
+Results are cached per music file hash, so each track is analysed once.
+
+Usage:
+    python beat_detector.py music/angry_1.mp3
+"""
+
+import argparse
+import time
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from audio_stream import stream_audio
+from cache_utils import JsonCache, file_digest
+
+ANALYSIS_RATE = 11025
+FRAME_SIZE = 1024
+HOP_SIZE = 256
+MIN_BPM = 70.0
+MAX_BPM = 180.0
+PREFERRED_BPM = 120.0        # tempo prior centre (log-Gaussian, one octave wide)
+BEAT_SNAP_MAX_SEC = 0.35     # furthest a cut or SFX may move to reach a beat
+
+_beat_cache = JsonCache("beats")
+
+
+def onset_envelope(samples):
+    """Half-wave rectified spectral flux of the log-magnitude spectrogram, one value per hop."""
+    if len(samples) < FRAME_SIZE:
+        return np.zeros(0)
+    frames = sliding_window_view(samples, FRAME_SIZE)[::HOP_SIZE]
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(FRAME_SIZE), axis=1))
+    log_spec = np.log1p(100.0 * spectrum)
+    flux = np.maximum(0.0, np.diff(log_spec, axis=0)).sum(axis=1)
+    flux = np.concatenate([[0.0], flux])
+    # Remove the slowly varying part so quiet and loud sections weigh the same
+    local_mean = np.convolve(flux, np.ones(16) / 16, mode="same")
+    envelope = np.maximum(0.0, flux - local_mean)
+    peak = envelope.max()
+    return envelope / peak if peak > 0 else envelope
+
+
+def estimate_tempo(envelope, frame_rate):
+    """Beat period in frames from the autocorrelation of the onset envelope."""
+    n = len(envelope)
+    centered = envelope - envelope.mean()
+    spectrum = np.fft.rfft(centered, 2 * n)
+    autocorr = np.fft.irfft(spectrum * np.conj(spectrum))[:n]
+    min_lag = max(1, int(frame_rate * 60.0 / MAX_BPM))
+    max_lag = min(n - 1, int(frame_rate * 60.0 / MIN_BPM))
+    if max_lag <= min_lag:
+        return None
+    lags = np.arange(min_lag, max_lag + 1)
+    bpm = 60.0 * frame_rate / lags
+    prior = np.exp(-0.5 * (np.log2(bpm / PREFERRED_BPM)) ** 2)
+    return int(lags[np.argmax(autocorr[lags] * prior)])
+
+
+def track_beats(envelope, period):
+    """
+    Fit a constant-tempo grid: search fractional periods around the estimate
+    and every phase for the grid with the most onset energy (an integer period
+    would drift off the beat within a minute), then let every beat settle on
+    the strongest envelope frame within ±10% of a period.
+    Returns (beat_frames, refined_period).
+    """
+    n = len(envelope)
+    best_score, best_period, best_grid = -1.0, float(period), None
+    for candidate in np.arange(period - 1.0, period + 1.0, 0.02):
+        beats = np.arange(int(n / candidate) + 1) * candidate
+        grids = np.round(np.arange(0.0, candidate, 1.0)[:, None] + beats[None, :]).astype(int)
+        scores = np.where(grids < n, envelope[np.minimum(grids, n - 1)], 0.0).sum(axis=1)
+        phase = int(np.argmax(scores))
+        if scores[phase] > best_score:
+            best_score, best_period, best_grid = scores[phase], candidate, grids[phase]
+    grid = best_grid[best_grid < n]
+    radius = max(1, int(best_period) // 10)
+    offsets = np.arange(-radius, radius + 1)
+    candidates = np.clip(grid[:, None] + offsets[None, :], 0, n - 1)
+    return candidates[np.arange(len(grid)), np.argmax(envelope[candidates], axis=1)], best_period
+
+
+def pick_onsets(envelope, threshold=0.3):
+    """Frames that are local maxima of the envelope and above the threshold."""
+    if len(envelope) < 3:
+        return np.zeros(0, dtype=int)
+    mid = envelope[1:-1]
+    peaks = (mid > envelope[:-2]) & (mid >= envelope[2:]) & (mid > threshold)
+    return np.nonzero(peaks)[0] + 1
+
+
+def analyze_music(path):
+    """Tempo, beat and onset times (seconds) of a music file, cached by content hash."""
+    key = file_digest(path)
+    cached = _beat_cache.get(key)
+    if cached is not None:
+        return cached
+
+    started = time.time()
+    blocks = list(stream_audio(path, rate=ANALYSIS_RATE, channels=1, block_sec=30.0))
+    samples = np.concatenate(blocks)[:, 0] if blocks else np.zeros(0, dtype=np.float32)
+    envelope = onset_envelope(samples)
+    frame_rate = ANALYSIS_RATE / HOP_SIZE
+    period = estimate_tempo(envelope, frame_rate) if len(envelope) else None
+
+    beat_frames = []
+    if period:
+        beat_frames, period = track_beats(envelope, period)
+
+    def frame_time(f):
+        # Frames are stamped at their window centre
+        return round(float((f * HOP_SIZE + FRAME_SIZE / 2) / ANALYSIS_RATE), 4)
+
+    result = {
+        "duration": len(samples) / ANALYSIS_RATE,
+        "tempo": 60.0 * frame_rate / period if period else None,
+        "beats": [frame_time(f) for f in beat_frames],
+        "onsets": [frame_time(f) for f in pick_onsets(envelope)],
+    }
+    _beat_cache.set(key, result)
+    tempo = f"{result['tempo']:.1f} BPM" if result["tempo"] else "no tempo"
+    print(f"🥁 Beat analysis: {tempo}, {len(result['beats'])} beats in {time.time() - started:.2f}s")
+    return result
+
+
+def timeline_beats(analysis, duration):
+    """Beat times over a timeline of `duration` seconds, repeating them as the track loops."""
+    beats = np.asarray(analysis["beats"], dtype=float)
+    track_len = analysis["duration"]
+    if beats.size == 0 or track_len <= 0:
+        return beats
+    loops = int(np.ceil(duration / track_len))
+    tiled = (beats[None, :] + track_len * np.arange(loops)[:, None]).ravel()
+    return tiled[tiled <= duration]
+
+
+def next_beat(t, beats, max_shift=BEAT_SNAP_MAX_SEC):
+    """First beat at or after t if it is within max_shift, else t (a cut can only be delayed)."""
+    i = np.searchsorted(beats, t)
+    if i < len(beats) and beats[i] - t <= max_shift:
+        return float(beats[i])
+    return t
+
+
+def nearest_beat(t, beats, max_shift=BEAT_SNAP_MAX_SEC):
+    """Closest beat to t in either direction if it is within max_shift, else t."""
+    if len(beats) == 0:
+        return t
+    i = int(np.argmin(np.abs(beats - t)))
+    return float(beats[i]) if abs(beats[i] - t) <= max_shift else t
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detect tempo and beats of a music file")
+    parser.add_argument("path", help="Music file to analyse")
+    args = parser.parse_args()
+    analysis = analyze_music(args.path)
+    print(f"Tempo: {analysis['tempo']}, first beats: {analysis['beats'][:8]}")
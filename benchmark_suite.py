@@ -0,0 +1,327 @@
+"""
+Synthetic benchmark suite for the render pipeline. Projects are generated
+offline (script lines, sine/noise narration mp3s of controlled length, scene
+images of random shapes on a solid or gradient background, with a share of
+duplicates), then every stage and the full
+render run in a fresh process per measurement, with empty caches. Wall time, CPU
+time (including ffmpeg children) and peak RSS are appended to a JSON history and
+compared against a stored baseline.
+
+Usage:
+    python benchmark_suite.py [--sizes 10,40,200] [--stages subtitles,loudness,render]
+        [--line-sec 1.5] [--duplicates 0.3] [--audio sine|noise] [--images solid|gradient]
+        [--encoding draft] [--frame-mode dedup] [--repeat 1] [--tolerance 0.15]
+        [--save-baseline] [--bench-dir bench]
+
+Examples:
+    python benchmark_suite.py --sizes 10,40 --save-baseline     # record a baseline on the main branch
+    python benchmark_suite.py --sizes 10,40                     # on a branch: exits 1 on regressions
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import queue as queue_module
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+BENCH_DIR = "bench"
+STAGES = ("subtitles", "loudness", "render")
+# A stage regresses when it is this much slower/larger than the baseline and the
+# difference is above the noise floor
+NOISE_FLOOR = {"wall_sec": 0.05, "cpu_sec": 0.05, "peak_rss_mb": 5.0}
+IMAGE_SIZE = 1024
+# Bumped when synthetic images change; recorded in the results' params so runs
+# on older projects are not compared as like for like
+IMAGE_VERSION = 2
+SHAPES_PER_IMAGE = 6
+BENCHMARK_HEADER = "벤치마크\n합성 프로젝트"
+
+
+# --- Synthetic projects ---
+
+def _synth_audio(path, duration, kind, index):
+    from audio_stream import ffmpeg_binary
+    if kind == "noise":
+        source = f"anoisesrc=d={duration:.3f}:c=pink:a=0.1:r=44100:seed={index}"
+    else:
+        source = f"sine=frequency={220 + 20 * (index % 12)}:sample_rate=44100:duration={duration:.3f}"
+    subprocess.run(
+        [ffmpeg_binary(), "-y", "-loglevel", "error", "-f", "lavfi", "-i", source, "-ac", "2", "-b:a", "128k", path],
+        check=True,
+    )
+
+
+def _synth_image(path, kind, rng):
+    color = rng.integers(40, 230, size=3)
+    if kind == "gradient":
+        end = rng.integers(40, 230, size=3)
+        ramp = np.linspace(0.0, 1.0, IMAGE_SIZE)[:, None, None]
+        pixels = (color + (end - color) * ramp).astype(np.uint8)
+        pixels = np.broadcast_to(pixels, (IMAGE_SIZE, IMAGE_SIZE, 3))
+    else:
+        pixels = np.broadcast_to(color.astype(np.uint8), (IMAGE_SIZE, IMAGE_SIZE, 3))
+    image = Image.fromarray(np.ascontiguousarray(pixels))
+    # A flat or ramped background has (nearly) the same perceptual hash in every
+    # image; random shapes give each one its own structure, so only the copied
+    # duplicates merge into one scene
+    draw = ImageDraw.Draw(image)
+    for _ in range(SHAPES_PER_IMAGE):
+        w, h = rng.integers(IMAGE_SIZE // 8, IMAGE_SIZE // 2, size=2)
+        x, y = rng.integers(0, IMAGE_SIZE - w), rng.integers(0, IMAGE_SIZE - h)
+        fill = tuple(int(c) for c in rng.integers(0, 256, size=3))
+        shape = draw.ellipse if rng.random() < 0.5 else draw.rectangle
+        shape([int(x), int(y), int(x + w), int(y + h)], fill=fill)
+    image.save(path)
+
+
+def make_project(root, n_lines, line_sec=1.5, duplicates=0.3, audio="sine", images="solid", seed=0):
+    """
+    Write a synthetic project under root (reused if it already exists). Line
+    lengths vary ±30% around line_sec; `duplicates` is the share of lines that
+    reuse the previous line's image (byte-identical, so they merge into one scene).
+    """
+    name = f"{n_lines}l_{line_sec}s_{duplicates}d_{audio}_{images}_{seed}_v{IMAGE_VERSION}"
+    project = {
+        "name": name,
+        "script": os.path.join(root, name, "script.txt"),
+        "audio_dir": os.path.join(root, name, "audio"),
+        "image_dir": os.path.join(root, name, "images"),
+    }
+    marker = os.path.join(root, name, ".complete")
+    if os.path.exists(marker):
+        return project
+
+    rng = np.random.default_rng(seed)
+    os.makedirs(project["audio_dir"], exist_ok=True)
+    os.makedirs(project["image_dir"], exist_ok=True)
+    with open(project["script"], "w", encoding="utf-8") as f:
+        # Title and subtitle; script headers spell the line break as a literal \n (see timeline.read_script)
+        f.write("# " + BENCHMARK_HEADER.replace("\n", "\\n") + "\n")
+        for i in range(1, n_lines + 1):
+            f.write(f"벤치마크 문장 {i}번입니다.\n")
+
+    for i in range(1, n_lines + 1):
+        duration = line_sec * rng.uniform(0.7, 1.3)
+        _synth_audio(os.path.join(project["audio_dir"], f"line_{i:02}.mp3"), duration, audio, i)
+        image_path = os.path.join(project["image_dir"], f"line_{i:02}.png")
+        if i > 1 and rng.random() < duplicates:
+            shutil.copyfile(os.path.join(project["image_dir"], f"line_{i - 1:02}.png"), image_path)
+        else:
+            _synth_image(image_path, images, rng)
+
+    open(marker, "w").close()
+    return project
+
+
+# --- Stages ---
+
+def _stage_subtitles(project, work_dir, options):
+    from subtitle_generator import generate_subtitles
+    generate_subtitles(project["script"], audio_dir=project["audio_dir"], output_path=os.path.join(work_dir, "stage.srt"))
+
+
+def _stage_loudness(project, work_dir, options):
+    from loudness import narration_loudness
+    paths = sorted(os.path.join(project["audio_dir"], f) for f in os.listdir(project["audio_dir"]))
+    narration_loudness(paths)
+
+
+def _stage_render(project, work_dir, options):
+    from video_builder import build_video
+    build_video(
+        script_path=project["script"],
+        audio_dir=project["audio_dir"],
+        image_dir=project["image_dir"],
+        subtitle_path=os.path.join(work_dir, "render.srt"),
+        output_path=os.path.join(work_dir, "render.mp4"),
+        skip_tts=True,
+        music=False,
+        encoding=options["encoding"],
+        frame_mode=options["frame_mode"],
+    )
+
+
+STAGE_FUNCTIONS = {"subtitles": _stage_subtitles, "loudness": _stage_loudness, "render": _stage_render}
+
+
+def _measure_child(stage, project, options, cache_dir, queue):
+    # Runs in a spawned interpreter: caches are empty and imports happen before the clock starts
+    os.environ["THINKTOK_CACHE_DIR"] = cache_dir
+    random.seed(0)
+    import profiler
+    import subtitle_generator  # noqa: F401
+    import loudness  # noqa: F401
+    import video_builder  # noqa: F401
+    work_dir = tempfile.mkdtemp(prefix=f"bench_{stage}_")
+    try:
+        profiler.enable()
+        wall0, cpu0 = time.perf_counter(), os.times()
+        STAGE_FUNCTIONS[stage](project, work_dir, options)
+        wall1, cpu1 = time.perf_counter(), os.times()
+        spans = profiler.disable().summary()["spans"]
+        cpu = (cpu1.user - cpu0.user) + (cpu1.system - cpu0.system) + \
+              (cpu1.children_user - cpu0.children_user) + (cpu1.children_system - cpu0.children_system)
+        result = {"wall_sec": wall1 - wall0, "cpu_sec": cpu, "peak_rss_mb": None, "peak_child_rss_mb": None,
+                  "spans": {name: s["total_sec"] for name, s in spans.items()}}
+        if resource is not None:
+            # ru_maxrss is KiB on Linux, bytes on macOS
+            scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+            result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+            result["peak_child_rss_mb"] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+        queue.put(("ok", result))
+    except Exception as e:
+        queue.put(("error", repr(e)))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def measure(stage, project, options):
+    """One measurement in a fresh process with an empty cache directory."""
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    cache_dir = tempfile.mkdtemp(prefix="bench_cache_")
+    try:
+        process = ctx.Process(target=_measure_child, args=(stage, project, options, cache_dir, queue))
+        process.start()
+        while True:
+            try:
+                status, payload = queue.get(timeout=1.0)
+                break
+            except queue_module.Empty:
+                if not process.is_alive():
+                    status, payload = "error", f"process exited with code {process.exitcode}"
+                    break
+        process.join()
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    if status != "ok":
+        raise RuntimeError(f"{stage} failed on {project['name']}: {payload}")
+    return payload
+
+
+# --- History and baseline ---
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _key(result):
+    return f"{result['lines']}:{result['stage']}"
+
+
+def find_regressions(results, baseline, tolerance):
+    base = {_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        previous = base.get(_key(result))
+        if previous is None:
+            continue
+        for metric, floor in NOISE_FLOOR.items():
+            old, new = previous.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + tolerance) and new - old > floor:
+                regressions.append((result["lines"], result["stage"], metric, old, new))
+    return regressions
+
+
+def run_suite(sizes, stages, params, options, repeat=1, bench_dir=BENCH_DIR, tolerance=0.15, save_baseline=False):
+    projects_dir = os.path.join(bench_dir, "projects")
+    results = []
+    for n_lines in sizes:
+        print(f"▶ Preparing synthetic project with {n_lines} lines...")
+        project = make_project(projects_dir, n_lines, **params)
+        for stage in stages:
+            # The fastest of `repeat` runs is the least noisy estimate
+            runs = [measure(stage, project, options) for _ in range(repeat)]
+            best = min(runs, key=lambda r: r["wall_sec"])
+            results.append({"lines": n_lines, "stage": stage, **best})
+            rss = f"{best['peak_rss_mb']:.0f} MB" if best["peak_rss_mb"] is not None else "n/a"
+            print(f"   {stage:<10} wall {best['wall_sec']:7.2f}s  cpu {best['cpu_sec']:7.2f}s  peak RSS {rss}")
+
+    entry = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "params": {**params, "image_version": IMAGE_VERSION},
+        "options": options,
+        "results": results,
+    }
+    os.makedirs(bench_dir, exist_ok=True)
+    with open(os.path.join(bench_dir, "history.jsonl"), "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    print(f"\n{'lines':>6}  {'stage':<10}{'wall s':>9}{'cpu s':>9}{'RSS MB':>9}")
+    for r in results:
+        rss = f"{r['peak_rss_mb']:.0f}" if r["peak_rss_mb"] is not None else "n/a"
+        print(f"{r['lines']:>6}  {r['stage']:<10}{r['wall_sec']:>9.2f}{r['cpu_sec']:>9.2f}{rss:>9}")
+
+    baseline_path = os.path.join(bench_dir, "baseline.json")
+    if save_baseline:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False, indent=2)
+        print(f"✅ Baseline saved to {baseline_path}")
+        return []
+    if not os.path.exists(baseline_path):
+        print("⚠️ No baseline yet; run with --save-baseline to record one.")
+        return []
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("params") != entry["params"] or baseline.get("options") != options:
+        print("⚠️ Baseline was recorded with different project parameters or options; comparing anyway.")
+    regressions = find_regressions(results, baseline, tolerance)
+    for lines, stage, metric, old, new in regressions:
+        print(f"❌ Regression: {stage} @ {lines} lines {metric} {old:.2f} → {new:.2f} (+{100 * (new / old - 1):.0f}%)")
+    if not regressions:
+        print(f"✅ No regressions against baseline {baseline.get('commit') or ''} (tolerance {tolerance:.0%})")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic benchmark suite for the render pipeline")
+    parser.add_argument("--sizes", default="10,40,200", help="Comma-separated project sizes in script lines")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated stages ({', '.join(STAGES)})")
+    parser.add_argument("--line-sec", type=float, default=1.5, help="Mean narration length per line")
+    parser.add_argument("--duplicates", type=float, default=0.3, help="Share of lines reusing the previous image")
+    parser.add_argument("--audio", choices=["sine", "noise"], default="sine", help="Synthetic narration signal")
+    parser.add_argument("--images", choices=["solid", "gradient"], default="solid", help="Background of the synthetic scene images")
+    parser.add_argument("--encoding", default="draft", help="Encoding profile for the render stage")
+    parser.add_argument("--frame-mode", default="dedup", help="Frame mode for the render stage")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per measurement (the fastest is kept)")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed slowdown before flagging a regression")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--bench-dir", default=BENCH_DIR, help="Where projects, history and baseline live")
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGE_FUNCTIONS]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}")
+    regressions = run_suite(
+        sizes=[int(s) for s in args.sizes.split(",") if s.strip()],
+        stages=stages,
+        params={"line_sec": args.line_sec, "duplicates": args.duplicates, "audio": args.audio, "images": args.images},
+        options={"encoding": args.encoding, "frame_mode": args.frame_mode},
+        repeat=args.repeat,
+        bench_dir=args.bench_dir,
+        tolerance=args.tolerance,
+        save_baseline=args.save_baseline,
+    )
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,105 @@
+"""
+Background-music bed: streams a track from music/, loops or trims it to the
+timeline and ducks it under the narration.
+
+Usage:
+    python bgm.py --mood angry [--seed <script seed>]   # print which track would be picked and its loudness
+"""
+
+import argparse
+import os
+import numpy as np
+from scipy.ndimage import maximum_filter1d, uniform_filter1d
+from audio_stream import stream_audio
+from cache_utils import JsonCache, file_digest, seeded_choice
+from loudness import integrated_loudness_stream, db_to_gain
+
+MUSIC_DIR = "music"
+BGM_RELATIVE_LU = -18.0      # music bed loudness relative to the narration
+FADE_OUT_SEC = 2.0
+
+# Sidechain ducking
+ENVELOPE_SOURCE_FPS = 8000   # narration is rendered at this rate just for the envelope
+ENVELOPE_RATE = 100          # envelope frames per second
+VOICE_THRESHOLD_DB = -40.0   # RMS level above which narration counts as speech
+DUCK_DB = 10.0               # how far the music drops under speech
+DUCK_ATTACK_SEC = 0.1        # music starts dipping this long before speech
+DUCK_RELEASE_SEC = 0.4       # and stays down this long through pauses
+
+_music_loudness = JsonCache("music_loudness")
+
+
+def choose_music(mood, seed, music_dir=MUSIC_DIR):
+    """A <mood>*.mp3 track, the same one for the same seed (see timeline.script_seed)."""
+    if mood not in ("happy", "angry") or not os.path.isdir(music_dir):
+        return None
+    candidates = [os.path.join(music_dir, f) for f in os.listdir(music_dir) if f.startswith(mood) and f.endswith(".mp3")]
+    return seeded_choice(seed, f"music:{mood}", candidates)
+
+
+def music_loudness(path):
+    """Integrated loudness of a music file, streamed once and cached by content hash."""
+    key = file_digest(path)
+    cached = _music_loudness.get(key)
+    if cached is None:
+        cached = integrated_loudness_stream(stream_audio(path), 44100)
+        _music_loudness.set(key, cached)
+    return cached
+
+
+def ducking_curve(narration, rate):
+    """
+    Per-envelope-frame gain in dB (0 or down to -DUCK_DB) computed from a
+    downsampled narration render. Speech frames are detected on a 10ms RMS
+    envelope, widened by the attack/release windows and then ramped.
+    """
+    hop = max(1, rate // ENVELOPE_RATE)
+    n_frames = narration.shape[0] // hop
+    if n_frames == 0:
+        return np.zeros(0)
+    frames = np.asarray(narration[:n_frames * hop], dtype=np.float32).reshape(n_frames, hop, -1)
+    rms = np.sqrt(np.mean(frames ** 2, axis=(1, 2)))
+    speech = (20 * np.log10(np.maximum(rms, 1e-9)) > VOICE_THRESHOLD_DB).astype(np.float32)
+
+    attack = int(DUCK_ATTACK_SEC * ENVELOPE_RATE)
+    release = int(DUCK_RELEASE_SEC * ENVELOPE_RATE)
+    # Window covering [i - release, i + attack]: hold after speech, dip just before it
+    held = maximum_filter1d(speech, size=attack + release + 1, origin=(release - attack) // 2)
+    ramp = uniform_filter1d(held, size=2 * attack + 1)
+    return -DUCK_DB * ramp
+
+
+def add_music_bed(mix, rate, music_path, duck_db, narration_lufs, level_lu=BGM_RELATIVE_LU):
+    """
+    Mix the chosen track under `mix` in place, block by block. The track is
+    looped or trimmed to the mix length by ffmpeg, levelled against the
+    narration and shaped by the ducking curve interpolated to sample rate.
+    """
+    duration = mix.shape[0] / rate
+    track_lufs = music_loudness(music_path)
+    base_db = narration_lufs + level_lu - track_lufs if np.isfinite(track_lufs) else level_lu
+    env_times = np.arange(len(duck_db)) / ENVELOPE_RATE
+
+    print(f"🎵 Background music: {os.path.basename(music_path)} ({base_db:+.1f} dB, ducked {DUCK_DB:.0f} dB under narration)")
+    pos = 0
+    for block in stream_audio(music_path, rate=rate, channels=mix.shape[1], duration=duration, loop=True, fade_out=FADE_OUT_SEC):
+        n = min(block.shape[0], mix.shape[0] - pos)
+        if n <= 0:
+            break
+        t = (pos + np.arange(n)) / rate
+        gain_db = base_db + (np.interp(t, env_times, duck_db) if len(duck_db) else 0.0)
+        mix[pos:pos + n] += block[:n] * db_to_gain(gain_db)[:, None]
+        pos += n
+    return mix
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pick a background track for a mood and report its loudness")
+    parser.add_argument("--mood", choices=["happy", "angry"], default="angry", help="Background music mood")
+    parser.add_argument("--seed", default="", help="Script seed the track is picked with")
+    args = parser.parse_args()
+    path = choose_music(args.mood, args.seed)
+    if path is None:
+        print(f"⚠️ No {args.mood}*.mp3 tracks in {MUSIC_DIR}/")
+    else:
+        print(f"{path}: {music_loudness(path):.1f} LUFS")
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+# All derived data (loudness measurements, rasters, beat grids, ...) lives here.
+# Override with THINKTOK_CACHE_DIR to share one cache between checkouts.
+CACHE_DIR = os.getenv("THINKTOK_CACHE_DIR", ".cache")
+
+_digest_memo = {}
+
+
+def file_digest(path):
+    """
+    SHA-256 of a file's contents. Memoized on (path, size, mtime) so a batch
+    render hashes each source file only once per process.
+    """
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    digest = _digest_memo.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        _digest_memo[key] = digest
+    return digest
+
+
+def recipe_key(recipe):
+    """Stable hash of a JSON-serialisable description of how an artefact is made."""
+    return hashlib.sha256(json.dumps(recipe, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:32]
+
+
+def seeded_choice(seed, label, candidates):
+    """
+    Pick one of candidates as a function of (seed, label) alone. Renders of the
+    same script get the same track and SFX, so their audio recipes (and cached
+    mixes) stay identical from run to run.
+    """
+    candidates = sorted(candidates)
+    if not candidates:
+        return None
+    digest = hashlib.sha256(f"{seed}:{label}".encode("utf-8")).digest()
+    return candidates[int.from_bytes(digest[:8], "big") % len(candidates)]
+
+
+def publish(tmp_path, path):
+    """Move a finished file into the cache atomically (also from a scratch dir on another filesystem)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        staged = f"{path}.{os.getpid()}.tmp"
+        shutil.move(tmp_path, staged)
+        os.replace(staged, path)
+    return path
+
+
+class JsonCache:
+    """
+    A small JSON dictionary persisted under CACHE_DIR/<name>.json.
+    Writes go through a temp file + rename so a crashed render never leaves a
+    truncated cache behind.
+    """
+
+    def __init__(self, name):
+        self.path = os.path.join(CACHE_DIR, f"{name}.json")
+        self._data = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._data is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+        return self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._load().get(key, default)
+
+    def set(self, key, value):
+        with self._lock:
+            # Re-read so entries written meanwhile by other worker processes survive
+            self._data = None
+            data = self._load()
+            data[key] = value
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,17 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "cloud" calls Google TTS, OpenAI and Stability; "fake" sends every call to the
+# local stand-ins started with `python fake_services.py` (no network, no quota)
+SERVICES = os.getenv("THINKTOK_SERVICES", "cloud")
+FAKE_SERVICES_URL = os.getenv("THINKTOK_FAKE_SERVICES_URL", "http://127.0.0.1:8766")
+
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or (f"{FAKE_SERVICES_URL}/v1/" if SERVICES == "fake" else None)
+STABILITY_API_HOST = os.getenv("STABILITY_API_HOST") or (FAKE_SERVICES_URL if SERVICES == "fake" else "https://api.stability.ai")
+
+# Every outbound call is tried this many times, waiting API_BACKOFF_SEC and then
+# twice as long after each failure
+API_MAX_ATTEMPTS = int(os.getenv("THINKTOK_API_MAX_ATTEMPTS", "3"))
+API_BACKOFF_SEC = float(os.getenv("THINKTOK_API_BACKOFF_SEC", "1.0"))
@@ -0,0 +1,159 @@
+"""
+Named x264/AAC encoding profiles tuned for still-image reels, and a benchmark
+that compares them on a reference script.
+
+Usage:
+    python encoding_profiles.py --script scripts/test.txt
+        [--audio-dir audio/test] [--image-dir images/test]
+        [--profiles draft,preview,publish] [--json bench_output.json]
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from audio_stream import ffmpeg_binary
+
+# Reels are static images with text; x264's stillimage tune lowers deblocking
+# and psy strength for them. Keyframes are forced at scene cuts (and x264's own
+# scene detection is off), so every cut starts cleanly and GOPs can be long.
+ENCODING_PROFILES = {
+    # Script review: lowest fps, fastest preset, small audio
+    "draft": {
+        "fps": 12, "preset": "ultrafast", "crf": 30, "tune": "stillimage",
+        "gop_sec": 10, "audio_bitrate": "64k", "threads": 8,
+    },
+    # Sharing for sign-off: smooth fades, modest size
+    "preview": {
+        "fps": 24, "preset": "veryfast", "crf": 26, "tune": "stillimage",
+        "maxrate": "2M", "bufsize": "4M", "gop_sec": 5, "audio_bitrate": "96k",
+    },
+    # Upload master: platforms re-encode anyway, so spend bits on the first generation
+    "publish": {
+        "fps": 30, "preset": "medium", "crf": 20, "tune": "stillimage",
+        "maxrate": "8M", "bufsize": "16M", "gop_sec": 4, "audio_bitrate": "192k",
+    },
+    # Lossless intermediate used as the benchmark reference
+    "reference": {
+        "fps": 30, "preset": "ultrafast", "qp": 0, "gop_sec": 1, "audio_bitrate": "192k",
+    },
+}
+
+DEFAULT_ENCODING = "publish"
+
+
+def video_params(profile, cut_times=()):
+    """Extra x264 arguments for a profile; cut_times (seconds) become forced keyframes."""
+    params = []
+    if "qp" in profile:
+        params += ["-qp", str(profile["qp"])]
+    else:
+        params += ["-crf", str(profile["crf"])]
+    if profile.get("tune"):
+        params += ["-tune", profile["tune"]]
+    if profile.get("maxrate"):
+        params += ["-maxrate", profile["maxrate"], "-bufsize", profile["bufsize"]]
+    params += ["-g", str(int(profile["gop_sec"] * profile["fps"])), "-sc_threshold", "0"]
+    if cut_times:
+        params += ["-force_key_frames", ",".join(f"{t:.3f}" for t in cut_times)]
+    # No -movflags here: video-only intermediates skip the faststart rewrite, the final mux adds it
+    return params
+
+
+def encode_file(source_path, output_path, profile, cut_times=()):
+    """Re-encode a rendered video with a profile (used by the benchmark)."""
+    cmd = [
+        ffmpeg_binary(), "-y", "-loglevel", "error", "-i", source_path,
+        "-r", str(profile["fps"]), "-vcodec", "libx264", "-preset", profile["preset"], "-pix_fmt", "yuv420p",
+        *video_params(profile, cut_times),
+        "-acodec", "aac", "-b:a", profile["audio_bitrate"], "-movflags", "+faststart",
+    ]
+    if profile.get("threads"):
+        cmd += ["-threads", str(profile["threads"])]
+    cmd.append(output_path)
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+
+
+def ssim(distorted_path, reference_path):
+    """Mean SSIM (All) of a video against the reference, comparing at the reference frame rate."""
+    reference_fps = ENCODING_PROFILES["reference"]["fps"]
+    # Repeat distorted frames up to the reference rate, so low-fps profiles pay for choppy fades
+    cmd = [
+        ffmpeg_binary(), "-loglevel", "info", "-i", distorted_path, "-i", reference_path,
+        "-lavfi", f"[0:v]fps={reference_fps}[f];[f][1:v]scale2ref[d][r];[d][r]ssim",
+        "-f", "null", "-",
+    ]
+    probe = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    match = re.search(r"All:([0-9.]+)", probe.stderr.decode(errors="replace"))
+    return float(match.group(1)) if match else None
+
+
+def benchmark(script_path, audio_dir, image_dir, profile_names, json_path=None):
+    """
+    Render the script once losslessly, then encode that reference with every
+    profile and report encode time, file size and SSIM against the reference.
+    """
+    from video_builder import build_video
+
+    work_dir = tempfile.mkdtemp(prefix="encoding_bench_")
+    try:
+        reference_path = os.path.join(work_dir, "reference.mp4")
+        print("▶ Rendering lossless reference...")
+        summary = build_video(
+            script_path=script_path,
+            audio_dir=audio_dir,
+            image_dir=image_dir,
+            subtitle_path=os.path.join(work_dir, "reference.srt"),
+            output_path=reference_path,
+            encoding="reference",
+        )
+        cut_times = summary["scene_cuts"]
+
+        results = []
+        for name in profile_names:
+            profile = ENCODING_PROFILES[name]
+            output_path = os.path.join(work_dir, f"{name}.mp4")
+            started = time.time()
+            encode_file(reference_path, output_path, profile, cut_times)
+            elapsed = time.time() - started
+            results.append({
+                "profile": name,
+                "encode_sec": round(elapsed, 2),
+                "size_kb": round(os.path.getsize(output_path) / 1024, 1),
+                "ssim": ssim(output_path, reference_path),
+                "fps": profile["fps"],
+            })
+
+        print(f"\n{'profile':<10}{'encode s':>10}{'size KB':>10}{'SSIM':>9}{'fps':>5}")
+        for r in results:
+            quality = f"{r['ssim']:.4f}" if r["ssim"] is not None else "n/a"
+            print(f"{r['profile']:<10}{r['encode_sec']:>10.2f}{r['size_kb']:>10.1f}{quality:>9}{r['fps']:>5}")
+        if json_path:
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump({"script": script_path, "duration": summary["duration"], "results": results}, f, indent=2)
+            print(f"✅ Benchmark written to {json_path}")
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark encoding profiles on a reference script")
+    parser.add_argument("--script", required=True, help="Reference script text file")
+    parser.add_argument("--audio-dir", default=None, help="Narration directory (default audio/<script name>)")
+    parser.add_argument("--image-dir", default=None, help="Image directory (default images/<script name>)")
+    parser.add_argument("--profiles", default="draft,preview,publish", help="Comma-separated profiles to compare")
+    parser.add_argument("--json", default=None, help="Also write the results to this JSON file")
+    args = parser.parse_args()
+    name = os.path.splitext(os.path.basename(args.script))[0]
+    benchmark(
+        args.script,
+        args.audio_dir or os.path.join("audio", name),
+        args.image_dir or os.path.join("images", name),
+        [p.strip() for p in args.profiles.split(",") if p.strip()],
+        json_path=args.json,
+    )
@@ -0,0 +1,265 @@
+"""
+Golden-frame equivalence harness: renders one fixed fixture project through
+each render engine and checks that they produce the same reel as the reference
+engine (frame_mode="cfr", which composites every frame with moviepy).
+
+Frames are sampled just after every scene cut, at the midpoint of every
+subtitle fade, inside transitions and at seeded random timestamps, and compared
+by SSIM and the share of visibly changed pixels. The rewritten SRT timings and
+the audio loudness envelopes are compared as well. Renders are lossless
+(encoding "reference", or another profile with --encoding) at preview size, so
+the check takes seconds.
+
+Usage:
+    python equivalence_check.py [--engines cfr,dedup,vfr] [--reference cfr] [--lines 6]
+        [--transition crossfade] [--encoding reference] [--random-samples 8] [--min-ssim 0.995] [--keep <dir>]
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import srt
+from PIL import Image
+from scipy.ndimage import uniform_filter
+
+from audio_stream import ffmpeg_binary
+from benchmark_suite import make_project
+from cache_utils import CACHE_DIR
+from encoding_profiles import ENCODING_PROFILES
+from frame_schedule import SUBTITLE_FADE_SEC
+
+# Engine name -> build_video keyword arguments; add a faster renderer here to check it
+ENGINES = {
+    "cfr": {"frame_mode": "cfr"},
+    "dedup": {"frame_mode": "dedup"},
+    "vfr": {"frame_mode": "vfr"},
+}
+FIXTURE_DIR = os.path.join(CACHE_DIR, "fixtures")
+CHECK_PROFILE = "preview"
+CHECK_FPS = ENCODING_PROFILES["reference"]["fps"]
+
+# Pass thresholds
+MIN_SSIM = 0.995
+CHANGED_PIXEL_DELTA = 24        # luma difference that counts as a visible change
+MAX_CHANGED_FRACTION = 0.002
+SRT_TOLERANCE_SEC = 0.001
+ENVELOPE_RATE = 50              # Hz
+ENVELOPE_FLOOR_DB = -50.0       # quieter envelope points are not compared
+MAX_ENVELOPE_DIFF_DB = 1.0
+
+
+def _render_engine(engine, project, out_dir, transition, encoding):
+    """Child side of render(): build the reel and leave the summary next to it."""
+    from video_builder import build_video
+    summary = build_video(
+        script_path=project["script"],
+        audio_dir=project["audio_dir"],
+        image_dir=project["image_dir"],
+        subtitle_path=os.path.join(out_dir, "reel.srt"),
+        output_path=os.path.join(out_dir, "reel.mp4"),
+        skip_tts=True,
+        music=False,
+        output_profiles=[CHECK_PROFILE],
+        encoding=encoding,
+        transition=transition,
+        **ENGINES[engine],
+    )
+    with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f)
+
+
+def render(engine, project, work_dir, transition, encoding="reference"):
+    """
+    Render the fixture with one engine in a fresh interpreter with its own empty
+    cache directory, so no engine reuses another's cached AAC mix or video-only
+    streams (which would make the audio comparison trivially equal).
+    """
+    out_dir = os.path.join(work_dir, engine)
+    os.makedirs(out_dir, exist_ok=True)
+    cache_dir = tempfile.mkdtemp(prefix=f"equivalence_cache_{engine}_")
+    # The cache directory is read when cache_utils is imported, so it goes in through the environment
+    env = {**os.environ, "THINKTOK_CACHE_DIR": cache_dir}
+    code = (
+        f"import json, sys; sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r}); "
+        "import equivalence_check; equivalence_check._render_engine(*json.loads(sys.argv[1]))"
+    )
+    try:
+        subprocess.run([sys.executable, "-c", code, json.dumps([engine, project, out_dir, transition, encoding])], env=env, check=True)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    with open(os.path.join(out_dir, "summary.json"), "r", encoding="utf-8") as f:
+        summary = json.load(f)
+    return {"video": os.path.join(out_dir, "reel.mp4"), "srt": os.path.join(out_dir, "reel.srt"), "summary": summary}
+
+
+def sample_times(summary, subs, transition, n_random, seed=0):
+    """Timestamps worth comparing, each labelled with why it was picked."""
+    frame = 1.0 / CHECK_FPS
+    duration = summary["duration"]
+    times = []
+    for cut in summary["scene_cuts"]:
+        times.append((cut + frame, "cut"))
+        if transition != "cut":
+            times.append((cut, "transition"))
+    for sub in subs:
+        start, end = sub.start.total_seconds(), sub.end.total_seconds()
+        times += [(start + SUBTITLE_FADE_SEC / 2, "fade-in"), (end - SUBTITLE_FADE_SEC / 2, "fade-out")]
+    rng = random.Random(seed)
+    times += [(rng.uniform(0, duration), "random") for _ in range(n_random)]
+    # Snap to the frame grid and stay clear of the very end
+    snapped = {}
+    for t, why in times:
+        index = min(int(round(t * CHECK_FPS)), int(duration * CHECK_FPS) - 2)
+        snapped.setdefault(max(index, 0), why)
+    return sorted(snapped.items())
+
+
+def decode_frames(path, indices, size):
+    """Frames at CFR indices in one decode pass; VFR files are put on the same grid first."""
+    width, height = size
+    expr = "+".join(f"eq(n\\,{i})" for i in indices)
+    cmd = [
+        ffmpeg_binary(), "-loglevel", "error", "-i", path,
+        "-vf", f"fps={CHECK_FPS},select='{expr}'", "-fps_mode", "passthrough",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-",
+    ]
+    data = subprocess.run(cmd, capture_output=True, check=True).stdout
+    frames = np.frombuffer(data, dtype=np.uint8).reshape(-1, height, width, 3)
+    if len(frames) != len(indices):
+        raise RuntimeError(f"{path}: expected {len(indices)} sampled frames, decoded {len(frames)}")
+    return frames
+
+
+def _luma(frame):
+    return frame.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def ssim(a, b):
+    """Mean SSIM of the luma planes (7x7 uniform window)."""
+    x, y = _luma(a), _luma(b)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    mx, my = uniform_filter(x, 7), uniform_filter(y, 7)
+    vx = uniform_filter(x * x, 7) - mx * mx
+    vy = uniform_filter(y * y, 7) - my * my
+    cxy = uniform_filter(x * y, 7) - mx * my
+    s = ((2 * mx * my + c1) * (2 * cxy + c2)) / ((mx * mx + my * my + c1) * (vx + vy + c2))
+    return float(s.mean())
+
+
+def changed_fraction(a, b):
+    return float(np.mean(np.abs(_luma(a) - _luma(b)) > CHANGED_PIXEL_DELTA))
+
+
+def audio_envelope(path):
+    """RMS loudness envelope (dB) of the mixed-down audio track."""
+    rate = 8000
+    cmd = [ffmpeg_binary(), "-loglevel", "error", "-i", path, "-vn", "-ac", "1", "-ar", str(rate), "-f", "f32le", "-"]
+    samples = np.frombuffer(subprocess.run(cmd, capture_output=True, check=True).stdout, dtype=np.float32)
+    hop = rate // ENVELOPE_RATE
+    n = len(samples) // hop
+    rms = np.sqrt(np.mean(samples[:n * hop].reshape(n, hop) ** 2, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-6))
+
+
+def compare_srt(reference_path, candidate_path):
+    with open(reference_path, "r", encoding="utf-8") as f:
+        ref = list(srt.parse(f.read()))
+    with open(candidate_path, "r", encoding="utf-8") as f:
+        cand = list(srt.parse(f.read()))
+    if len(ref) != len(cand):
+        return [f"{len(cand)} subtitles instead of {len(ref)}"]
+    problems = []
+    for r, c in zip(ref, cand):
+        if r.content != c.content:
+            problems.append(f"#{r.index} text differs")
+        drift = max(abs((r.start - c.start).total_seconds()), abs((r.end - c.end).total_seconds()))
+        if drift > SRT_TOLERANCE_SEC:
+            problems.append(f"#{r.index} timing off by {drift * 1000:.1f} ms")
+    return problems
+
+
+def compare_audio(reference_path, candidate_path):
+    ref, cand = audio_envelope(reference_path), audio_envelope(candidate_path)
+    problems = []
+    if abs(len(ref) - len(cand)) > 2:
+        problems.append(f"audio length differs by {abs(len(ref) - len(cand)) / ENVELOPE_RATE:.2f}s")
+    n = min(len(ref), len(cand))
+    audible = ref[:n] > ENVELOPE_FLOOR_DB
+    if audible.any():
+        worst = float(np.max(np.abs(ref[:n][audible] - cand[:n][audible])))
+        if worst > MAX_ENVELOPE_DIFF_DB:
+            problems.append(f"audio envelope differs by up to {worst:.2f} dB")
+    return problems
+
+
+def check(engines, reference, lines=6, transition="crossfade", n_random=8, min_ssim=MIN_SSIM, keep_dir=None, encoding="reference"):
+    """Render every engine and compare it with the reference; returns {engine: [problems]}."""
+    from render_plan import get_plan
+    size = get_plan().profiles[CHECK_PROFILE]["size"]
+    project = make_project(FIXTURE_DIR, lines, line_sec=1.2, duplicates=0.3, images="gradient")
+    work_dir = keep_dir or tempfile.mkdtemp(prefix="equivalence_")
+    try:
+        renders = {}
+        for engine in [reference] + [e for e in engines if e != reference]:
+            print(f"▶ Rendering fixture with {engine}...")
+            renders[engine] = render(engine, project, work_dir, transition, encoding)
+
+        with open(renders[reference]["srt"], "r", encoding="utf-8") as f:
+            subs = list(srt.parse(f.read()))
+        samples = sample_times(renders[reference]["summary"], subs, transition, n_random)
+        indices = [i for i, _ in samples]
+        golden = decode_frames(renders[reference]["video"], indices, size)
+
+        results = {}
+        for engine in engines:
+            if engine == reference:
+                continue
+            problems = compare_srt(renders[reference]["srt"], renders[engine]["srt"])
+            problems += compare_audio(renders[reference]["video"], renders[engine]["video"])
+            frames = decode_frames(renders[engine]["video"], indices, size)
+            worst_ssim = 1.0
+            for (index, why), g, f in zip(samples, golden, frames):
+                score, changed = ssim(g, f), changed_fraction(g, f)
+                worst_ssim = min(worst_ssim, score)
+                if score < min_ssim or changed > MAX_CHANGED_FRACTION:
+                    problems.append(f"frame {index} ({why}, {index / CHECK_FPS:.2f}s): SSIM {score:.4f}, {changed:.2%} pixels changed")
+                    if keep_dir:
+                        Image.fromarray(np.concatenate([g, f], axis=1)).save(os.path.join(keep_dir, f"{engine}_{index:05d}.png"))
+            results[engine] = problems
+            mark = "✅" if not problems else "❌"
+            print(f"{mark} {engine} vs {reference}: {len(samples)} frames, worst SSIM {worst_ssim:.4f}, {len(problems)} problem(s)")
+            for problem in problems:
+                print(f"   - {problem}")
+        return results
+    finally:
+        if not keep_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that render engines produce the same reel")
+    parser.add_argument("--engines", default=",".join(ENGINES), help="Comma-separated engines to compare")
+    parser.add_argument("--reference", default="cfr", help="Engine whose output is the golden reel")
+    parser.add_argument("--lines", type=int, default=6, help="Fixture size in script lines")
+    parser.add_argument("--transition", default="crossfade", help="Transition used in the fixture render")
+    parser.add_argument("--encoding", default="reference", help="Encoding profile of the renders (lossy ones need a lower --min-ssim)")
+    parser.add_argument("--random-samples", type=int, default=8, help="Extra frames at seeded random times")
+    parser.add_argument("--min-ssim", type=float, default=MIN_SSIM, help="Lowest acceptable SSIM per frame")
+    parser.add_argument("--keep", default=None, help="Keep renders and side-by-side images of failing frames here")
+    args = parser.parse_args()
+
+    engines = [e.strip() for e in args.engines.split(",") if e.strip()]
+    unknown = [e for e in engines + [args.reference] if e not in ENGINES]
+    if unknown:
+        parser.error(f"unknown engine(s): {', '.join(unknown)}")
+    if args.keep:
+        os.makedirs(args.keep, exist_ok=True)
+    results = check(engines, args.reference, args.lines, args.transition, args.random_samples, args.min_ssim, args.keep, args.encoding)
+    sys.exit(1 if any(results.values()) else 0)
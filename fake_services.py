@@ -0,0 +1,329 @@
+"""
+Local stand-ins for the paid APIs, for load tests and for machines without
+network access. One HTTP server answers:
+
+    POST /v1/text:synthesize                         Google Text-to-Speech (REST shape), MP3 or LINEAR16 audio
+    POST /v1/chat/completions                        OpenAI chat completions
+    POST /v1/generation/<engine>/text-to-image       Stability text-to-image, PNG artifacts
+    GET  /stats                                      requests, injected errors and latency per service
+
+Latency follows a log-normal distribution per service, and 429/5xx responses
+are injected at configurable rates (or once a per-service concurrency quota is
+exceeded). Payloads are deterministic: the same text always gives the same
+audio and the same prompt the same image.
+
+Point the pipeline at it with THINKTOK_SERVICES=fake (see config.py); the TTS
+stage then uses the TextToSpeechClient below instead of google.cloud.
+
+Usage:
+    python fake_services.py [--port 8766] [--tts-latency 0.6] [--chat-latency 0.8] [--image-latency 4]
+        [--jitter 0.35] [--rate-429 0.05] [--rate-5xx 0.02] [--max-concurrent 0] [--seed 0]
+
+Examples:
+    python fake_services.py --rate-429 0.1 --max-concurrent 4 &
+    THINKTOK_SERVICES=fake python generate.py --script scripts/test.txt --generate-images
+"""
+
+import argparse
+import base64
+import hashlib
+import io
+import json
+import math
+import random
+import re
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from enum import Enum
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 8766
+SECONDS_PER_CHARACTER = 0.11     # synthetic speech length at speaking rate 1.0
+
+
+# --- Deterministic payloads ---
+
+def _digest(text):
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+@lru_cache(maxsize=256)
+def synthetic_speech(text, speaking_rate=1.0, encoding="MP3", sample_rate=24000):
+    """MP3 (or LINEAR16 WAV) bytes: a syllable-rate modulated tone whose length follows the text length."""
+    from audio_stream import ffmpeg_binary
+    digest = _digest(text)
+    duration = max(0.5, len(text) * SECONDS_PER_CHARACTER / max(speaking_rate, 0.25))
+    freq = 150 + digest[0] % 100
+    expr = f"0.3*sin(2*PI*{freq}*t)*(0.6+0.4*sin(2*PI*4*t))"
+    if encoding == "LINEAR16":
+        output = ["-c:a", "pcm_s16le", "-ar", str(sample_rate), "-f", "wav"]
+    else:
+        output = ["-b:a", "64k", "-f", "mp3"]
+    cmd = [
+        ffmpeg_binary(), "-loglevel", "error", "-f", "lavfi",
+        "-i", f"aevalsrc={expr}:s=24000:d={duration:.3f}", "-ac", "1", *output, "-",
+    ]
+    return subprocess.run(cmd, capture_output=True, check=True).stdout
+
+
+@lru_cache(maxsize=256)
+def synthetic_image(prompt, width=1024, height=1024):
+    """PNG bytes: a two-colour gradient with a disc, both chosen by the prompt."""
+    import numpy as np
+    from PIL import Image, ImageDraw
+    digest = _digest(prompt)
+    top, bottom = np.array(digest[0:3], dtype=np.float32), np.array(digest[3:6], dtype=np.float32)
+    ramp = np.linspace(0.0, 1.0, height, dtype=np.float32)[:, None, None]
+    pixels = np.broadcast_to(top + (bottom - top) * ramp, (height, width, 3)).astype(np.uint8)
+    image = Image.fromarray(np.ascontiguousarray(pixels))
+    radius = min(width, height) // 4
+    cx = radius + digest[6] * (width - 2 * radius) // 255
+    cy = radius + digest[7] * (height - 2 * radius) // 255
+    ImageDraw.Draw(image).ellipse((cx - radius, cy - radius, cx + radius, cy + radius), fill=tuple(digest[8:11]))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def synthetic_prompt(text):
+    words = ["cartoon", "office", "city", "chart", "coins", "house", "family", "market", "bank", "phone", "street", "desk"]
+    digest = _digest(text)
+    return f"A simple illustration of a {words[digest[0] % len(words)]} with a {words[digest[1] % len(words)]}"
+
+
+# --- Server ---
+
+class ServiceBehaviour:
+    """Latency, error injection and concurrency quota for one service, plus its counters."""
+
+    def __init__(self, median_latency, jitter, rate_429, rate_5xx, max_concurrent, rng):
+        self.median_latency = median_latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.max_concurrent = max_concurrent
+        self.rng = rng
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.stats = {"requests": 0, "ok": 0, "429": 0, "5xx": 0, "latency_sum": 0.0, "max_in_flight": 0}
+
+    def admit(self):
+        """Returns (status, latency): status None means serve the request normally."""
+        with self.lock:
+            self.stats["requests"] += 1
+            roll = self.rng.random()
+            latency = self.median_latency * math.exp(self.jitter * self.rng.gauss(0.0, 1.0))
+            if self.max_concurrent and self.in_flight >= self.max_concurrent:
+                status = 429
+            elif roll < self.rate_429:
+                status = 429
+            elif roll < self.rate_429 + self.rate_5xx:
+                status = 503
+            else:
+                status = None
+            if status is None:
+                self.in_flight += 1
+                self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.in_flight)
+            return status, latency
+
+    def release(self, status, latency):
+        with self.lock:
+            if status is None:
+                self.in_flight -= 1
+                self.stats["ok"] += 1
+            else:
+                self.stats["429" if status == 429 else "5xx"] += 1
+            self.stats["latency_sum"] += latency
+
+
+class FakeServicesHandler(BaseHTTPRequestHandler):
+    services = {}            # set by serve()
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # load tests make thousands of requests
+
+    def _send(self, code, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            return self._send(200, {name: dict(s.stats) for name, s in self.services.items()})
+        self._send(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send(400, {"error": {"message": "invalid JSON"}})
+
+        if self.path.startswith("/v1/text:synthesize"):
+            service, respond = "tts", self._synthesize
+        elif self.path.startswith("/v1/chat/completions"):
+            service, respond = "chat", self._chat
+        elif re.fullmatch(r"/v1/generation/[^/]+/text-to-image", self.path):
+            service, respond = "image", self._image
+        else:
+            return self._send(404, {"error": {"message": "not found"}})
+
+        behaviour = self.services[service]
+        status, latency = behaviour.admit()
+        try:
+            if status is not None:
+                # Errors come back quickly, like a real gateway
+                time.sleep(min(latency, 0.05))
+                message = "Rate limit exceeded" if status == 429 else "Service unavailable"
+                return self._send(status, {"error": {"code": status, "message": message}}, {"Retry-After": "1"})
+            time.sleep(latency)
+            try:
+                respond(payload)
+            except Exception as e:
+                self._send(500, {"error": {"code": 500, "message": f"stand-in failed: {e}"}})
+        finally:
+            behaviour.release(status, latency)
+
+    def _synthesize(self, payload):
+        text = payload.get("input", {}).get("text", "")
+        audio_config = payload.get("audioConfig", {})
+        rate = float(audio_config.get("speakingRate", 1.0) or 1.0)
+        audio = synthetic_speech(
+            text, rate, audio_config.get("audioEncoding", "MP3"), int(audio_config.get("sampleRateHertz") or 24000)
+        )
+        self._send(200, {"audioContent": base64.b64encode(audio).decode("ascii")})
+
+    def _chat(self, payload):
+        messages = payload.get("messages", [])
+        prompt = messages[-1].get("content", "") if messages else ""
+        content = synthetic_prompt(prompt)
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 3 + 1
+        self._send(200, {
+            "id": "chatcmpl-fake-" + _digest(prompt).hex()[:12],
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                      "total_tokens": prompt_tokens + len(content) // 4},
+        })
+
+    def _image(self, payload):
+        prompt = " ".join(p.get("text", "") for p in payload.get("text_prompts", []))
+        width, height = int(payload.get("width", 1024)), int(payload.get("height", 1024))
+        png = synthetic_image(prompt, width, height)
+        self._send(200, {"artifacts": [{"base64": base64.b64encode(png).decode("ascii"),
+                                        "seed": int.from_bytes(_digest(prompt)[:4], "big"),
+                                        "finishReason": "SUCCESS"}]})
+
+
+def serve(port=DEFAULT_PORT, latencies=None, jitter=0.35, rate_429=0.0, rate_5xx=0.0, max_concurrent=0, seed=0):
+    latencies = latencies or {"tts": 0.6, "chat": 0.8, "image": 4.0}
+    rng = random.Random(seed)
+    FakeServicesHandler.services = {
+        name: ServiceBehaviour(latency, jitter, rate_429, rate_5xx, max_concurrent, random.Random(rng.random()))
+        for name, latency in latencies.items()
+    }
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeServicesHandler)
+    print(f"🧪 Fake TTS/OpenAI/Stability services on http://127.0.0.1:{port} "
+          f"(429 {rate_429:.0%}, 5xx {rate_5xx:.0%}, max concurrent {max_concurrent or 'unlimited'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n⏹ Stopping fake services")
+        print(json.dumps({name: s.stats for name, s in FakeServicesHandler.services.items()}, indent=2))
+    finally:
+        server.server_close()
+
+
+# --- Client side: a drop-in for google.cloud.texttospeech ---
+
+class FakeServiceError(Exception):
+    """HTTP error from a stand-in service; status_code is what metering records."""
+
+    def __init__(self, status_code, message):
+        super().__init__(f"{status_code} {message}")
+        self.status_code = status_code
+
+
+class _Message:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class texttospeech:
+    """The subset of google.cloud.texttospeech that tts_generator uses."""
+
+    class SsmlVoiceGender(Enum):
+        NEUTRAL = "NEUTRAL"
+
+    class AudioEncoding(Enum):
+        MP3 = "MP3"
+        LINEAR16 = "LINEAR16"
+
+    class SynthesisInput(_Message):
+        pass
+
+    class VoiceSelectionParams(_Message):
+        pass
+
+    class AudioConfig(_Message):
+        pass
+
+    class TextToSpeechClient:
+        def __init__(self, base_url=None, timeout=60):
+            import config
+            self.base_url = (base_url or config.FAKE_SERVICES_URL).rstrip("/")
+            self.timeout = timeout
+
+        def synthesize_speech(self, input, voice, audio_config):
+            body = {
+                "input": {"text": input.text},
+                "voice": {"languageCode": voice.language_code, "name": voice.name, "ssmlGender": voice.ssml_gender.value},
+                "audioConfig": {"audioEncoding": audio_config.audio_encoding.value,
+                                "speakingRate": audio_config.speaking_rate, "pitch": audio_config.pitch,
+                                "sampleRateHertz": getattr(audio_config, "sample_rate_hertz", None)},
+            }
+            request = urllib.request.Request(
+                f"{self.base_url}/v1/text:synthesize", data=json.dumps(body).encode("utf-8"),
+                headers={"Content-Type": "application/json"}, method="POST",
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    data = json.loads(response.read())
+            except urllib.error.HTTPError as e:
+                raise FakeServiceError(e.code, e.reason)
+            return _Message(audio_content=base64.b64decode(data["audioContent"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-ins for Google TTS, OpenAI chat and Stability")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port on 127.0.0.1")
+    parser.add_argument("--tts-latency", type=float, default=0.6, help="Median TTS latency (s)")
+    parser.add_argument("--chat-latency", type=float, default=0.8, help="Median chat completion latency (s)")
+    parser.add_argument("--image-latency", type=float, default=4.0, help="Median image generation latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.35, help="Log-normal sigma of every latency")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Share of requests answered 429")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="Share of requests answered 503")
+    parser.add_argument("--max-concurrent", type=int, default=0, help="Per-service concurrency quota (0 = none)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for latency and error injection")
+    args = parser.parse_args()
+    serve(
+        port=args.port,
+        latencies={"tts": args.tts_latency, "chat": args.chat_latency, "image": args.image_latency},
+        jitter=args.jitter,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        max_concurrent=args.max_concurrent,
+        seed=args.seed,
+    )
@@ -0,0 +1,282 @@
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import numpy as np
+from PIL import Image
+from audio_stream import ffmpeg_binary
+
+
+# Fragmented MP4: a moov without samples up front, then one moof+mdat per
+# keyframe, so every fragment is playable/uploadable as soon as it is written
+FRAGMENT_MOVFLAGS = "+frag_keyframe+empty_moov+default_base_moof"
+
+
+def output_args(size, outputs, audio_input=None, codec="libx264", preset="medium", threads=None, ffmpeg_params=None, stream_first=False):
+    """
+    Filter graph and per-output arguments for encoding one frame stream (input 0)
+    to several outputs. The stream is split once and branches whose size differs
+    from the master are scaled; audio_input is the index of an AAC input to copy.
+    With stream_first the first output is written as fragmented MP4 to stdout.
+    """
+    args = []
+    labels = []
+    filters = []
+    if len(outputs) > 1:
+        filters.append(f"[0:v]split={len(outputs)}" + "".join(f"[s{i}]" for i in range(len(outputs))))
+    for i, (_, out_size) in enumerate(outputs):
+        source = f"[s{i}]" if len(outputs) > 1 else "[0:v]"
+        if tuple(out_size) != tuple(size):
+            filters.append(f"{source}scale={out_size[0]}:{out_size[1]}:flags=lanczos[o{i}]")
+            labels.append(f"[o{i}]")
+        else:
+            labels.append(source if len(outputs) > 1 else "0:v")
+    if filters:
+        args += ["-filter_complex", ";".join(filters)]
+
+    for i, ((path, _), label) in enumerate(zip(outputs, labels)):
+        args += ["-map", label]
+        if audio_input is not None:
+            args += ["-map", f"{audio_input}:a", "-c:a", "copy"]
+        args += ["-vcodec", codec, "-preset", preset, "-pix_fmt", "yuv420p"]
+        if threads is not None:
+            args += ["-threads", str(threads)]
+        params = list(ffmpeg_params or [])
+        if stream_first and i == 0:
+            args += params + ["-movflags", FRAGMENT_MOVFLAGS, "-f", "mp4", "pipe:1"]
+        elif audio_input is not None:
+            # Muxed here, so this is a final file: move the moov up front
+            args += params + ["-movflags", "+faststart", path]
+        else:
+            args += params + [path]
+    return args
+
+
+class FragmentPump(threading.Thread):
+    """
+    Copies ffmpeg's fragmented MP4 from stdout to the output file and hands each
+    finished piece to sink(bytes): first the init segment (ftyp+moov), then one
+    moof+mdat fragment at a time. The file is written once and never re-read.
+    """
+
+    def __init__(self, stream, path, sink):
+        super().__init__(name="fragment-pump", daemon=True)
+        self.stream = stream
+        self.path = path
+        self.sink = sink
+        self.error = None
+        self.fragments = 0
+
+    def run(self):
+        try:
+            with open(self.path, "wb") as f:
+                buffer = bytearray()
+                pos = 0
+                for chunk in iter(lambda: self.stream.read1(1 << 16), b""):
+                    f.write(chunk)
+                    buffer += chunk
+                    # Walk complete top-level boxes; a piece ends after moov or mdat
+                    piece_start = 0
+                    while len(buffer) - pos >= 8:
+                        size = int.from_bytes(buffer[pos:pos + 4], "big")
+                        if size == 1 and len(buffer) - pos >= 16:
+                            size = int.from_bytes(buffer[pos + 8:pos + 16], "big")
+                        if size < 8 or len(buffer) - pos < size:
+                            break
+                        kind = bytes(buffer[pos + 4:pos + 8])
+                        pos += size
+                        if kind in (b"moov", b"mdat"):
+                            self.sink(bytes(buffer[piece_start:pos]))
+                            self.fragments += kind == b"mdat"
+                            piece_start = pos
+                    del buffer[:piece_start]
+                    pos -= piece_start
+                if buffer:
+                    # Trailing boxes (mfra) once ffmpeg is done
+                    self.sink(bytes(buffer))
+        except Exception as e:
+            self.error = e
+            # Keep draining so ffmpeg never blocks on a full pipe
+            for _ in iter(lambda: self.stream.read(1 << 16), b""):
+                pass
+
+
+class StdoutSink:
+    """Fragments to this process's stdout (e.g. piped into an uploader)."""
+
+    def __init__(self):
+        # The real stdout, even while print() output is redirected to stderr
+        self.stream = sys.__stdout__.buffer
+
+    def __call__(self, data):
+        self.stream.write(data)
+        self.stream.flush()
+
+    def close(self):
+        self.stream.flush()
+
+
+class CommandSink:
+    """
+    Fragments to the stdin of a command, e.g. `curl -T - <upload url>`. The
+    command line is split with shell quoting rules but never run by a shell.
+    """
+
+    def __init__(self, command):
+        self.proc = subprocess.Popen(shlex.split(command), stdin=subprocess.PIPE)
+
+    def __call__(self, data):
+        self.proc.stdin.write(data)
+
+    def close(self):
+        self.proc.stdin.close()
+        if self.proc.wait() != 0:
+            raise IOError(f"Stream command exited with code {self.proc.returncode}")
+
+
+def open_sink(target):
+    """'-' streams to stdout, anything else is run as a command fed on stdin."""
+    return StdoutSink() if target == "-" else CommandSink(target)
+
+
+class MultiOutputWriter:
+    """
+    One ffmpeg process fed raw RGB frames at a master size. Every output is
+    encoded from the same frames, scaled inside ffmpeg when its size differs,
+    so outputs of the same aspect ratio cost one compositing pass.
+
+    outputs   list of (path, (width, height))
+    """
+
+    def __init__(self, size, fps, outputs, audio_path=None, codec="libx264", preset="medium", threads=None, ffmpeg_params=None, sink=None):
+        self.size = size
+        self.paths = [path for path, _ in outputs]
+        width, height = size
+        cmd = [
+            ffmpeg_binary(), "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-vcodec", "rawvideo", "-s", f"{width}x{height}",
+            "-pix_fmt", "rgb24", "-r", f"{fps:.02f}", "-i", "-",
+        ]
+        if audio_path:
+            cmd += ["-i", audio_path]
+        cmd += output_args(size, outputs, 1 if audio_path else None, codec, preset, threads, ffmpeg_params, stream_first=sink is not None)
+
+        self.cmd = cmd
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE if sink else subprocess.DEVNULL, stderr=subprocess.PIPE)
+        self.pump = None
+        if sink:
+            # The first output is streamed fragment by fragment while frames are still being encoded
+            self.pump = FragmentPump(self.proc.stdout, self.paths[0], sink)
+            self.pump.start()
+
+    def write_frame(self, frame, count=1):
+        """
+        Write a frame `count` times; repeats reuse the same bytes, nothing is
+        recomposited, but ffmpeg still encodes every copy (see VfrWriter).
+        """
+        if frame.dtype != np.uint8:
+            frame = frame.astype(np.uint8)
+        data = frame.tobytes()
+        try:
+            for _ in range(count):
+                self.proc.stdin.write(data)
+        except (BrokenPipeError, OSError):
+            error = self.proc.stderr.read().decode(errors="replace")
+            raise IOError(f"ffmpeg failed while writing frames:\n{error}\nCommand: {' '.join(self.cmd)}")
+
+    def close(self):
+        if self.proc.stdin:
+            self.proc.stdin.close()
+        error = self.proc.stderr.read().decode(errors="replace")
+        if self.proc.wait() != 0:
+            raise IOError(f"ffmpeg exited with code {self.proc.returncode}:\n{error}")
+        finish_pump(self.pump)
+
+
+def finish_pump(pump):
+    if pump is None:
+        return
+    pump.join()
+    if pump.error:
+        raise IOError(f"Streaming {pump.path} failed: {pump.error}")
+    print(f"📡 Streamed {pump.path} in {pump.fragments} fragment(s) while encoding")
+
+
+class VfrWriter:
+    """
+    Variable-frame-rate output: every distinct frame is stored once (a fast PNG
+    in a scratch directory) with its display duration, and ffmpeg reads them
+    through a concat list that carries the real timestamps. Static stretches
+    become a single long frame in the output instead of repeated ones.
+    ffmpeg only starts in close(), so this writer cannot stream while encoding.
+    """
+
+    def __init__(self, size, fps, outputs, audio_path=None, codec="libx264", preset="medium", threads=None, ffmpeg_params=None, scratch_dir=None):
+        self.size = size
+        self.fps = fps
+        self.paths = [path for path, _ in outputs]
+        self.frame_dir = tempfile.mkdtemp(prefix="vfr_frames_", dir=scratch_dir)
+        self.entries = []
+        self.audio_path = audio_path
+        # Timestamps come from the concat list, so ffmpeg must not resample them to CFR
+        params = list(ffmpeg_params or []) + ["-fps_mode", "vfr"]
+        self.output_args = output_args(size, outputs, 1 if audio_path else None, codec, preset, threads, params)
+
+    def write_frame(self, frame, count=1):
+        if frame.dtype != np.uint8:
+            frame = frame.astype(np.uint8)
+        path = os.path.join(self.frame_dir, f"{len(self.entries):05d}.png")
+        Image.fromarray(frame).save(path, format="PNG", compress_level=1)
+        self.entries.append((path, count))
+
+    def close(self):
+        try:
+            list_path = os.path.join(self.frame_dir, "frames.ffconcat")
+            with open(list_path, "w", encoding="utf-8") as f:
+                f.write("ffconcat version 1.0\n")
+                for path, count in self.entries:
+                    f.write(f"file '{os.path.basename(path)}'\nduration {count / self.fps:.6f}\n")
+                if self.entries:
+                    # The concat demuxer ignores the last duration unless the file is repeated
+                    f.write(f"file '{os.path.basename(self.entries[-1][0])}'\n")
+            cmd = [ffmpeg_binary(), "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path]
+            if self.audio_path:
+                cmd += ["-i", self.audio_path]
+            cmd += self.output_args
+            proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            if proc.returncode != 0:
+                raise IOError(f"ffmpeg exited with code {proc.returncode}:\n{proc.stderr.decode(errors='replace')}")
+        finally:
+            shutil.rmtree(self.frame_dir, ignore_errors=True)
+
+
+def mux_streams(video_path, audio_path, output_path):
+    """Put an encoded video-only file and an AAC track into one MP4, both stream-copied."""
+    cmd = [
+        ffmpeg_binary(), "-y", "-loglevel", "error", "-i", video_path, "-i", audio_path,
+        "-map", "0:v:0", "-map", "1:a:0", "-c", "copy", "-movflags", "+faststart", output_path,
+    ]
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise IOError(f"ffmpeg failed to mux {output_path}:\n{proc.stderr.decode(errors='replace')}")
+    return output_path
+
+
+def encode_audio(samples, rate, path, bitrate=None):
+    """Encode a float (n, channels) array to AAC once, so every video output can stream-copy it."""
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+    cmd = [
+        ffmpeg_binary(), "-y", "-loglevel", "error",
+        "-f", "s16le", "-acodec", "pcm_s16le", "-ar", str(rate), "-ac", str(pcm.shape[1]), "-i", "-",
+        "-acodec", "aac",
+    ]
+    if bitrate:
+        cmd += ["-b:a", bitrate]
+    cmd.append(path)
+    proc = subprocess.run(cmd, input=pcm.tobytes(), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise IOError(f"ffmpeg failed to encode audio:\n{proc.stderr.decode(errors='replace')}")
+    return path
@@ -0,0 +1,42 @@
+import numpy as np
+
+SUBTITLE_FADE_SEC = 0.2      # crossfadein / crossfadeout length of each subtitle
+
+
+def subtitle_events(subs, fade=SUBTITLE_FADE_SEC):
+    """
+    Boundaries where a subtitle appears, finishes fading in, starts fading out or
+    disappears, and the fade windows during which every frame differs.
+    """
+    boundaries = []
+    windows = []
+    for sub in subs:
+        start = sub.start.total_seconds()
+        end = sub.end.total_seconds()
+        boundaries += [start, min(start + fade, end), max(end - fade, start), end]
+        windows += [(start, min(start + fade, end)), (max(end - fade, start), end)]
+    return boundaries, windows
+
+
+def frame_runs(duration, fps, boundaries, dense_windows):
+    """
+    Split the CFR frame grid of a timeline into runs of identical frames.
+
+    Between two boundaries nothing on screen changes, so all frames there form
+    one run; inside a dense window (a fade or transition) every frame is its own
+    run. Returns (first_frame_index, frame_count) pairs covering every frame.
+    """
+    n_frames = int(duration * fps)
+    if n_frames == 0:
+        return []
+    t = np.arange(n_frames) / fps
+    interval = np.searchsorted(np.sort(np.asarray(boundaries, dtype=float)), t, side="right")
+    dense = np.zeros(n_frames, dtype=bool)
+    for start, end in dense_windows:
+        dense |= (t >= start) & (t < end)
+
+    new_run = np.ones(n_frames, dtype=bool)
+    new_run[1:] = dense[1:] | (interval[1:] != interval[:-1])
+    starts = np.flatnonzero(new_run)
+    counts = np.diff(np.append(starts, n_frames))
+    return list(zip(starts.tolist(), counts.tolist()))
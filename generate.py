@@ -2,7 +2,7 @@
 # generate.py - Full ThinkTok generation pipeline
 #
 # Usage:
-#   python generate.py --script <script.txt> [--output-dir <dir>] [--generate-images] [--fast] [--mood <mood>] [--skip-tts] [--speed-factor <factor>] [--rate <rate>] [--pitch <pitch>]
+#   python generate.py --script <script.txt> [--output-dir <dir>] [--generate-images] [--fast] [--mood <mood>] [--skip-tts] [--narration-format <mp3|pcm>] [--speed-factor <factor>] [--rate <rate>] [--pitch <pitch>] [--target-lufs <lufs>] [--no-music] [--beat-sync] [--profiles <names>] [--proxy] [--encoding <profile>] [--frame-mode <mode>] [--transition <kind>] [--placeholders] [--scene-threshold <bits>] [--layout <spec.json>] [--ram-scratch] [--memory-budget <MB>] [--stream-to <target>] [--dry-run] [--budget <sec>] [--profile <trace.json>] [--metrics-dir <dir>]
 #
 # Arguments:
 #   --script         Path to the script text file (one sentence per line)
@@ -12,8 +12,51 @@
 #   --mood           Background music mood ("happy" or "angry")
 #   --pitch          Set pitch for TTS voice (e.g., -2.0 or +2.0)
 #   --skip-tts       Use existing audio files without TTS
+#   --narration-format  mp3 (default): one MP3 per line; pcm: LINEAR16 from TTS packed into one
+#                    audio/<name>/narration.wav with a line index, read from a memory map by every
+#                    stage and compressed only in the final encode (see narration.py)
 #   --speed-factor   Apply global speed adjustment (e.g., 0.97 to shorten duration)
 #   --rate           Speaking rate for TTS (e.g., 1.0 = normal speed)
+#   --target-lufs    Integrated loudness of the final mix (default -14 LUFS)
+#   --no-music       Leave out the background music bed (music/<mood>*.mp3)
+#   --beat-sync      Nudge scene cuts and transition SFX onto beats of the music
+#   --profiles       Comma-separated output profiles rendered in one pass: reel, square, portrait, preview
+#                    (the first writes video/<name>.mp4, the others video/<name>_<profile>.mp4)
+#   --proxy          Quick review render at quarter resolution to video/<name>_proxy.mp4 (same timeline)
+#   --encoding       Encoding profile: draft, preview or publish (default; --fast implies draft)
+#   --frame-mode     cfr (composite every frame), dedup (default: composite each distinct frame once;
+#                    the copies are still piped to and encoded by x264, so only compositing is saved)
+#                    or vfr (variable-frame-rate output, one frame per static stretch: repeats are
+#                    neither composited nor encoded)
+#   --transition     Visual transition between scenes: cut (default), crossfade, slide, zoom or random
+#   --placeholders   Show a local scene card for lines without their own image instead of reusing
+#                    an earlier line's image. Implied by --generate-images: rendering starts on cards
+#                    while images are generated, and the reel is rendered again once any card's image
+#                    arrives (the whole video is re-encoded; the audio mix is reused from the cache)
+#   --scene-threshold  Lines whose images are within this many bits (of 64) of the scene's first
+#                    image by perceptual hash share one scene (default 6; -1 merges identical files only)
+#   --layout         Layout spec with the output profiles, header, channel text and subtitle style
+#                    (default layouts/default.json; compiled once into a render plan, see render_plan.py)
+#   --ram-scratch    Keep the render's scratch files (scene WAVs, SFX, AAC, VFR frames) in /dev/shm
+#   --memory-budget  MB of scene rasters kept in memory (default 512, or THINKTOK_MEMORY_BUDGET_MB)
+#   --stream-to      Write the main video as fragmented MP4 and stream each fragment while encoding:
+#                    "-" to stdout (progress output moves to stderr) or a command fed on stdin
+#                    (quoted like a shell command, not run by a shell), e.g. --stream-to "curl -T - <upload url>".
+#                    Interactive runs only: batch and daemon jobs refuse it. With --frame-mode vfr the
+#                    streamed output is encoded as CFR (dedup), since VFR encoding starts only after
+#                    the last frame is drawn
+#   --dry-run        Plan the timeline from the narration and images already on disk without calling
+#                    any service or rendering: scenes, SFX offsets, subtitle cues, total length against
+#                    the budget and a timing check against the subtitles. The planned SRT goes to
+#                    subtitles/<name>.dryrun.srt; exits with 1 when the reel is over budget
+#   --budget         Reel length budget in seconds for --dry-run (default 59)
+#   --profile        Write a Chrome trace of stage, scene and per-frame timings and print a summary table
+#   --metrics-dir    Where API metering goes (default metrics/): <name>.json per reel with latency
+#                    percentiles, retries, tokens, characters and estimated cost, plus a cumulative
+#                    Prometheus textfile thinktok_api.prom
+#
+# Stage backends (TTS, subtitles, images, renderer) are imported only when their
+# stage runs; see backends.py. THINKTOK_<STAGE>_BACKEND selects a non-default one.
 #
 # Examples:
 #   python generate.py --script scripts/test.txt
@@ -22,16 +65,16 @@
 # =============================================================================
 
 import os
+import sys
 import argparse
-from tts_generator import generate_tts_for_script
-from subtitle_generator import generate_subtitles
-from image_generator import generate_images_for_script
-try:
-    from video_builder import build_video
-except ModuleNotFoundError:
-    build_video = None
+import contextlib
+import threading
+import profiler
+from metering import METRICS_DIR, meter, print_report, write_reports
+from backends import get_backend
+from placeholders import line_image
 
-def main():
+def build_parser():
     parser = argparse.ArgumentParser(description="Full ThinkTok generation pipeline.")
     parser.add_argument("--script", required=True, help="Path to the script text file")
     parser.add_argument("--output-dir", default="output", help="Base output directory")
@@ -41,11 +84,46 @@ def main():
     parser.add_argument("--rate", type=float, default=1.2, help="Speaking rate for TTS (1.0 = normal speed)")
     parser.add_argument("--pitch", type=float, default=0.0, help="Set pitch for TTS voice (e.g., -2.0 or +2.0)")
     parser.add_argument("--skip-tts", action="store_true", help="Use existing audio files without TTS generation")
+    parser.add_argument("--narration-format", choices=["mp3", "pcm"], default="mp3", help="TTS output: per-line MP3s or one packed LINEAR16 WAV")
     parser.add_argument("--speed-factor", type=float, default=1.0, help="Apply global speed factor to final video (e.g., 0.97)")
-    args = parser.parse_args()
+    parser.add_argument("--target-lufs", type=float, default=-14.0, help="Integrated loudness target for the final mix (LUFS)")
+    parser.add_argument("--no-music", action="store_true", help="Render without the background music bed")
+    parser.add_argument("--beat-sync", action="store_true", help="Snap scene cuts and transition SFX to music beats")
+    parser.add_argument("--profiles", default="reel", help="Comma-separated output profiles (reel,square,portrait,preview)")
+    parser.add_argument("--proxy", action="store_true", help="Render a quarter-resolution review proxy instead of the final video")
+    parser.add_argument("--encoding", choices=["draft", "preview", "publish"], default="publish", help="Encoding profile (see encoding_profiles.py)")
+    parser.add_argument("--frame-mode", choices=["cfr", "dedup", "vfr"], default="dedup", help="cfr: composite every frame; dedup: composite distinct frames once, still encode every frame; vfr: encode distinct frames once")
+    parser.add_argument("--transition", choices=["cut", "crossfade", "slide", "zoom", "random"], default="cut", help="Visual transition between scenes")
+    parser.add_argument("--placeholders", action="store_true", help="Use scene cards for lines without their own image")
+    parser.add_argument("--scene-threshold", type=int, default=6, help="Perceptual-hash distance for merging lines into one scene")
+    parser.add_argument("--layout", default="layouts/default.json", help="Layout spec: profiles, header, channel text and subtitle style")
+    parser.add_argument("--ram-scratch", action="store_true", help="Put render scratch files in RAM (/dev/shm)")
+    parser.add_argument("--memory-budget", type=int, default=None, help="Memory budget for cached scene rasters (MB)")
+    parser.add_argument("--stream-to", default=None, help="Stream the main video as fragmented MP4 to '-' (stdout) or a command")
+    parser.add_argument("--dry-run", action="store_true", help="Plan the timeline and check the length budget without rendering")
+    parser.add_argument("--budget", type=float, default=59.0, help="Reel length budget in seconds for --dry-run")
+    parser.add_argument("--profile", default=None, help="Write a Chrome trace JSON of the run to this path")
+    parser.add_argument("--metrics-dir", default=METRICS_DIR, help="Directory for API metering reports")
+    return parser
 
+def run_pipeline(args):
+    """Run every stage for one script; returns the path of the main video (None if not built)."""
+    if not args.profile:
+        return run_stages(args)
+    profiler.enable()
+    try:
+        with profiler.span("pipeline", script=args.script):
+            return run_stages(args)
+    finally:
+        recorded = profiler.disable()
+        recorded.write_chrome_trace(args.profile)
+        profiler.print_summary(recorded.summary())
+        print(f"✅ Profile written to {args.profile}")
+
+def run_stages(args):
     script_path = args.script
     name = os.path.splitext(os.path.basename(script_path))[0]
+    meter.reset()
 
     # Always use root-level folders
     audio_dir = os.path.join("audio", name)
@@ -61,37 +139,86 @@ def main():
     os.makedirs(images_dir, exist_ok=True)
     os.makedirs(video_dir, exist_ok=True)
 
+    # Dry run: lay out the reel from what is already on disk, render nothing
+    if args.dry_run:
+        from timeline import dry_run
+        _, overrun, _ = dry_run(
+            script_path, audio_dir, images_dir,
+            os.path.join(subtitles_dir, f"{name}.dryrun.srt"),
+            budget_sec=args.budget,
+            subtitle_path=subtitles_path,
+            placeholders=args.placeholders or args.generate_images,
+            scene_threshold=args.scene_threshold,
+            beat_sync=args.beat_sync,
+            mood=args.mood,
+            music=not args.no_music,
+        )
+        if overrun:
+            raise SystemExit(1)
+        return None
+
     # 1) TTS generation (can be skipped with --skip-tts)
     if args.skip_tts:
         print("▶ Skipping TTS generation (using pre-recorded audio)...")
     else:
         print("▶ Generating TTS...")
-        generate_tts_for_script(
-            script_path,
-            output_dir=audio_dir,
-            mood=args.mood,
-            speaking_rate=args.rate,
-            pitch=args.pitch
-        )
+        with profiler.span("tts"):
+            generate_tts_for_script = get_backend("tts")
+            generate_tts_for_script(
+                script_path,
+                output_dir=audio_dir,
+                mood=args.mood,
+                speaking_rate=args.rate,
+                pitch=args.pitch,
+                audio_format=args.narration_format
+            )
 
     # 2) Subtitle generation
     print("▶ Generating subtitles...")
-    generate_subtitles(script_path, audio_dir=audio_dir, output_path=subtitles_path)
+    with profiler.span("subtitles"):
+        generate_subtitles = get_backend("subtitles")
+        generate_subtitles(script_path, audio_dir=audio_dir, output_path=subtitles_path)
 
-    # 3) Image generation (optional, off by default)
+    # 3) Image generation (optional, off by default). Runs in the background so
+    # the render can start on placeholder scene cards instead of waiting for it.
+    image_thread = None
+    image_errors = []
     if args.generate_images:
-        print("▶ Generating images...")
-        generate_images_for_script(script_path, output_dir=images_dir)
+        print("▶ Generating images in the background...")
+
+        def generate_images():
+            try:
+                with profiler.span("images"):
+                    generate_images_for_script = get_backend("images")
+                    generate_images_for_script(script_path, output_dir=images_dir)
+            except Exception as e:
+                image_errors.append(e)
+
+        image_thread = threading.Thread(target=generate_images, name="images", daemon=True)
+        image_thread.start()
     else:
         print("▶ Skipping image generation.")
 
+    def finish_images():
+        if image_thread is not None:
+            image_thread.join()
+        # API usage of this reel (nothing is written when no service was called)
+        report = write_reports(name, args.metrics_dir, script=script_path)
+        if report:
+            print_report(report)
 
     # 4) Video building
+    try:
+        with profiler.span("import renderer"):
+            build_video = get_backend("renderer")
+    except ModuleNotFoundError:
+        build_video = None
     if build_video is None:
+        finish_images()
         print("⚠️ video_builder module not available. Install moviepy to enable video generation.")
     else:
         print("▶ Building video...")
-        build_video(
+        render_kwargs = dict(
             script_path=script_path,
             audio_dir=audio_dir,
             image_dir=images_dir,
@@ -99,9 +226,66 @@ def main():
             output_path=video_path,
             fast=args.fast,
             mood=args.mood,
-            skip_tts=args.skip_tts
+            skip_tts=args.skip_tts,
+            target_lufs=args.target_lufs,
+            music=not args.no_music,
+            beat_sync=args.beat_sync,
+            output_profiles=[p.strip() for p in args.profiles.split(",") if p.strip()],
+            proxy=args.proxy,
+            encoding=args.encoding,
+            frame_mode=args.frame_mode,
+            transition=args.transition,
+            placeholders=args.placeholders or args.generate_images,
+            scene_threshold=args.scene_threshold,
+            ram_scratch=args.ram_scratch,
+            memory_budget_mb=args.memory_budget,
+            layout=args.layout,
         )
-        print(f"✅ Pipeline completed. Video saved to {video_path}")
+        stream_sink = None
+        if args.stream_to:
+            from ffmpeg_writer import open_sink
+            stream_sink = open_sink(args.stream_to)
+        if stream_sink and image_thread is not None:
+            # A streamed reel cannot be replaced afterwards, so it is rendered with the real images
+            print("▶ Waiting for images before streaming the render...")
+            image_thread.join()
+        try:
+            with profiler.span("render"):
+                summary = build_video(stream_sink=stream_sink, **render_kwargs)
+        finally:
+            if stream_sink:
+                stream_sink.close()
+        finish_images()
+
+        # Re-render once the real images are in. This is a full render: every
+        # frame is composited and the whole video re-encoded. Only the unchanged
+        # scene rasters and the audio mix come from the caches.
+        placeholder_lines = (summary or {}).get("placeholder_lines", [])
+        arrived = [idx for idx in placeholder_lines if line_image(images_dir, idx)]
+        if arrived:
+            print(f"♻️ Images arrived for {len(arrived)} placeholder scene(s), rendering the reel again...")
+            with profiler.span("render", rerender=len(arrived)):
+                summary = build_video(**render_kwargs)
+            placeholder_lines = summary.get("placeholder_lines", [])
+        if placeholder_lines:
+            print(f"⚠️ Lines still on placeholder scene cards: {', '.join(str(idx) for idx in placeholder_lines)}")
+        saved_path = os.path.join(video_dir, f"{name}_proxy.mp4") if args.proxy else video_path
+        print(f"✅ Pipeline completed. Video saved to {saved_path}")
+        if image_errors:
+            raise image_errors[0]
+        return saved_path
+    if image_errors:
+        raise image_errors[0]
+    return None
+
+def main():
+    args = build_parser().parse_args()
+    if args.stream_to == "-":
+        # stdout carries the video, so progress output goes to stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            run_pipeline(args)
+    else:
+        run_pipeline(args)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
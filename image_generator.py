@@ -1,5 +1,4 @@
 import os
-import openai
 from dotenv import load_dotenv
 import time
 import concurrent.futures
@@ -9,17 +8,12 @@ from io import BytesIO
 import io
 import requests
 import base64
+import json
+import config
+from metering import meter
 
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
-if not openai.api_key:
-    raise RuntimeError("OPENAI_API_KEY not set in environment")
-
-STABILITY_API_KEY = os.getenv("STABILITY_API_KEY")
-if not STABILITY_API_KEY:
-    raise RuntimeError("STABILITY_API_KEY not set in environment")
-API_HOST = "https://api.stability.ai"
+API_HOST = config.STABILITY_API_HOST
 ENGINE_ID = "stable-diffusion-v1-6"
 
 # GPT model
@@ -38,7 +32,25 @@ USER_TEMPLATE = (
     "{line} 사진 만들어줘"
 )
 
+def _load_credentials():
+    """Checked when images are actually generated, not at import time."""
+    import openai
+    # The local stand-ins accept any key
+    fake = config.SERVICES == "fake"
+    openai.api_key = os.getenv("OPENAI_API_KEY") or ("fake-key" if fake else None)
+    if not openai.api_key:
+        raise RuntimeError("OPENAI_API_KEY not set in environment")
+    if config.OPENAI_BASE_URL:
+        openai.base_url = config.OPENAI_BASE_URL
+    # Retries happen in process_line, where they are metered and backed off
+    openai.max_retries = 0
+    stability_api_key = os.getenv("STABILITY_API_KEY") or ("fake-key" if fake else None)
+    if not stability_api_key:
+        raise RuntimeError("STABILITY_API_KEY not set in environment")
+    return openai, stability_api_key
+
 def generate_images_for_script(script_path, output_dir="images"):
+    openai, stability_api_key = _load_credentials()
     os.makedirs(output_dir, exist_ok=True)
 
     with open(script_path, "r", encoding="utf-8") as f:
@@ -47,22 +59,24 @@ def generate_images_for_script(script_path, output_dir="images"):
     def process_line(idx, line):
         try:
             # 1) Generate English base prompt from the script line
-            for attempt in range(3):
+            for attempt in range(config.API_MAX_ATTEMPTS):
                 try:
-                    eng_resp = openai.chat.completions.create(
-                        model=MODEL,
-                        messages=[
-                            {"role": "system", "content": "You are an assistant that translates a Korean instruction into an English DALL·E prompt."},
-                            {"role": "user", "content": f'Translate the following into an English prompt for DALL·E: "{line}"'}
-                        ],
-                        temperature=0.3,
-                        max_tokens=60
-                    )
+                    with meter.call("openai_chat", attempt=attempt + 1, request_bytes=len(line.encode("utf-8"))) as call:
+                        eng_resp = openai.chat.completions.create(
+                            model=MODEL,
+                            messages=[
+                                {"role": "system", "content": "You are an assistant that translates a Korean instruction into an English DALL·E prompt."},
+                                {"role": "user", "content": f'Translate the following into an English prompt for DALL·E: "{line}"'}
+                            ],
+                            temperature=0.3,
+                            max_tokens=60
+                        )
+                        call.set_usage(getattr(eng_resp, "usage", None))
                     break
                 except Exception as e:
-                    if attempt == 2:
+                    if attempt == config.API_MAX_ATTEMPTS - 1:
                         raise
-                    time.sleep(1)
+                    time.sleep(config.API_BACKOFF_SEC * 2 ** attempt)
             base_prompt = eng_resp.choices[0].message.content.strip().strip('"')
             # 2) Append Korean style guide
             prompt = f"{base_prompt} simple flat Simpson cartoon style, yellow background, unnecessary elements excluded"
@@ -79,11 +93,21 @@ def generate_images_for_script(script_path, output_dir="images"):
                 "steps": 30,
             }
             headers = {
-                "Authorization": f"Bearer {STABILITY_API_KEY}",
+                "Authorization": f"Bearer {stability_api_key}",
                 "Content-Type": "application/json"
             }
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()
+            for attempt in range(config.API_MAX_ATTEMPTS):
+                try:
+                    with meter.call("stability", attempt=attempt + 1, request_bytes=len(json.dumps(payload))) as call:
+                        response = requests.post(url, headers=headers, json=payload)
+                        call.response_bytes = len(response.content)
+                        response.raise_for_status()
+                        call.generations = 1
+                    break
+                except requests.RequestException:
+                    if attempt == config.API_MAX_ATTEMPTS - 1:
+                        raise
+                    time.sleep(config.API_BACKOFF_SEC * 2 ** attempt)
             data = response.json()
             # The first artifact contains base64 image data
             base64_img = data["artifacts"][0]["base64"]
@@ -104,8 +128,11 @@ def generate_images_for_script(script_path, output_dir="images"):
 
             filename = f"line_{idx:02}.png"
             filepath = os.path.join(output_dir, filename)
-            with open(filepath, "wb") as f:
+            # Write next to the target and rename, so a crash never leaves a truncated line_XX.png
+            tmp_path = f"{filepath}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
                 f.write(final_bytes)
+            os.replace(tmp_path, filepath)
 
         except Exception as e:
             print(f"❌ Failed to generate image for line {idx}: {e}")
@@ -0,0 +1,95 @@
+"""
+Perceptual image hashes for scene grouping. Re-saved, re-encoded or slightly
+regenerated copies of a picture get (nearly) the same hash, so consecutive
+lines showing them are merged into one scene.
+
+Usage:
+    python image_hash.py images/test/line_01.png images/test/line_02.png [--method phash|dhash]
+"""
+
+import argparse
+import numpy as np
+from PIL import Image
+from cache_utils import JsonCache, file_digest
+
+HASH_SIZE = 8                 # 8x8 = 64-bit hashes
+PHASH_SAMPLE = 32             # pHash takes the DCT of a 32x32 thumbnail
+DEFAULT_METHOD = "phash"
+# Largest Hamming distance (out of 64 bits) at which two images count as the same scene
+DEFAULT_THRESHOLD = 6
+
+_hashes = JsonCache("image_hashes")
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m
+
+
+_DCT = _dct_matrix(PHASH_SAMPLE)
+
+
+def _thumbnail(path, size):
+    """Greyscale float thumbnail of size (width, height)."""
+    with Image.open(path) as img:
+        return np.asarray(img.convert("L").resize(size, Image.LANCZOS), dtype=np.float32)
+
+
+def _pack(bits):
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def dhash(path):
+    """Difference hash: sign of the horizontal gradient of a 9x8 thumbnail."""
+    pixels = _thumbnail(path, (HASH_SIZE + 1, HASH_SIZE))
+    return _pack(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(path):
+    """DCT hash: low-frequency coefficients of a 32x32 thumbnail against their median."""
+    pixels = _thumbnail(path, (PHASH_SAMPLE, PHASH_SAMPLE))
+    low = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    # The DC term only carries overall brightness; leave it out of the median
+    return _pack(low > np.median(low.ravel()[1:]))
+
+
+METHODS = {"phash": phash, "dhash": dhash}
+
+
+def image_hash(path, method=DEFAULT_METHOD):
+    """Perceptual hash of an image file, cached by content hash."""
+    key = f"{method}:{file_digest(path)}"
+    cached = _hashes.get(key)
+    if cached is None:
+        cached = f"{METHODS[method](path):016x}"
+        _hashes.set(key, cached)
+    return int(cached, 16)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def same_scene(path_a, path_b, threshold=DEFAULT_THRESHOLD, method=DEFAULT_METHOD):
+    """True if two images are close enough to be shown as one scene."""
+    if path_a == path_b or file_digest(path_a) == file_digest(path_b):
+        return True
+    if threshold < 0:
+        return False
+    return hamming(image_hash(path_a, method), image_hash(path_b, method)) <= threshold
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print perceptual hashes and pairwise distances of images")
+    parser.add_argument("paths", nargs="+", help="Image files")
+    parser.add_argument("--method", choices=sorted(METHODS), default=DEFAULT_METHOD, help="Hash to compute")
+    args = parser.parse_args()
+    hashes = [image_hash(path, args.method) for path in args.paths]
+    for path, h in zip(args.paths, hashes):
+        print(f"{h:016x}  {path}")
+    for i in range(len(args.paths)):
+        for j in range(i + 1, len(args.paths)):
+            print(f"{hamming(hashes[i], hashes[j]):2d}  {args.paths[i]} <-> {args.paths[j]}")
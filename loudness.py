@@ -0,0 +1,223 @@
+"""
+Loudness measurement and normalization (ITU-R BS.1770 / EBU R128).
+
+Usage:
+    python loudness.py sound_effect/intro.mp3 audio/test/line_01.mp3
+"""
+
+import argparse
+import numpy as np
+from pydub import AudioSegment
+from scipy.ndimage import minimum_filter1d, uniform_filter1d
+from scipy.signal import lfilter, resample_poly
+from cache_utils import JsonCache, file_digest
+
+AUDIO_FPS = 44100
+
+TARGET_LUFS = -14.0          # integrated loudness the shorts platforms normalize to
+TRUE_PEAK_CEILING = -1.0     # dBTP ceiling after the limiter
+SFX_RELATIVE_LU = -12.0      # SFX sit this far below the narration loudness
+
+BLOCK_SEC = 0.4              # BS.1770 gating block
+BLOCK_STEP_SEC = 0.1         # 75% block overlap
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+LIMITER_LOOKAHEAD_SEC = 0.005
+
+_measurements = JsonCache("loudness")
+
+
+def segment_to_array(seg):
+    """Convert a pydub AudioSegment to a float32 (n_samples, n_channels) array in [-1, 1]."""
+    samples = np.array(seg.get_array_of_samples(), dtype=np.float32)
+    samples = samples.reshape(-1, seg.channels)
+    return samples / float(1 << (8 * seg.sample_width - 1))
+
+
+def _biquad(kind, rate, gain_db, q, fc):
+    a = 10 ** (gain_db / 40.0)
+    w0 = 2.0 * np.pi * (fc / rate)
+    alpha = np.sin(w0) / (2.0 * q)
+    cos_w0 = np.cos(w0)
+    if kind == "high_shelf":
+        b = [a * ((a + 1) + (a - 1) * cos_w0 + 2 * np.sqrt(a) * alpha),
+             -2 * a * ((a - 1) + (a + 1) * cos_w0),
+             a * ((a + 1) + (a - 1) * cos_w0 - 2 * np.sqrt(a) * alpha)]
+        den = [(a + 1) - (a - 1) * cos_w0 + 2 * np.sqrt(a) * alpha,
+               2 * ((a - 1) - (a + 1) * cos_w0),
+               (a + 1) - (a - 1) * cos_w0 - 2 * np.sqrt(a) * alpha]
+    else:  # high_pass
+        b = [(1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2]
+        den = [1 + alpha, -2 * cos_w0, 1 - alpha]
+    return np.array(b) / den[0], np.array(den) / den[0]
+
+
+def _k_weighting_filters(rate):
+    return [_biquad("high_shelf", rate, 4.0, 1 / np.sqrt(2), 1500.0),
+            _biquad("high_pass", rate, 0.0, 0.5, 38.0)]
+
+
+def k_weight(samples, rate):
+    """Apply the BS.1770 K-weighting pre-filter to every channel at once."""
+    for b, a in _k_weighting_filters(rate):
+        samples = lfilter(b, a, samples, axis=0)
+    return samples
+
+
+def _gated_loudness(powers):
+    """Apply the absolute and relative gates to per-block mean-square powers."""
+    powers = np.asarray(powers, dtype=np.float64)
+    with np.errstate(divide="ignore"):
+        block_lufs = -0.691 + 10 * np.log10(powers)
+    gated = powers[block_lufs > ABSOLUTE_GATE]
+    if gated.size == 0:
+        return float("-inf")
+    relative_gate = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE
+    gated = powers[(block_lufs > ABSOLUTE_GATE) & (block_lufs > relative_gate)]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def integrated_loudness(samples, rate):
+    """Gated integrated loudness in LUFS of a (n_samples, n_channels) array."""
+    weighted = k_weight(np.asarray(samples, dtype=np.float64), rate)
+    n = weighted.shape[0]
+    block = int(BLOCK_SEC * rate)
+    if n == 0:
+        return float("-inf")
+    if n < block:
+        # Shorter than one gating block (short SFX): measure the whole signal
+        powers = np.mean(weighted ** 2, axis=0, keepdims=True)
+    else:
+        # Mean square of every overlapping 400ms block from one cumulative sum
+        cumulative = np.concatenate([np.zeros((1, weighted.shape[1])), np.cumsum(weighted ** 2, axis=0)])
+        starts = np.arange(0, n - block + 1, int(BLOCK_STEP_SEC * rate))
+        powers = (cumulative[starts + block] - cumulative[starts]) / block
+    return _gated_loudness(powers.sum(axis=1))
+
+
+def integrated_loudness_stream(blocks, rate):
+    """
+    integrated_loudness() over an iterator of sample blocks in constant memory:
+    filter state is carried between blocks and only one power value per 100ms
+    step is kept, from which the overlapping 400ms gating blocks are rebuilt.
+    """
+    filters = _k_weighting_filters(rate)
+    step = int(BLOCK_STEP_SEC * rate)
+    states = None
+    carry = np.zeros(0)
+    step_powers = []
+    for block in blocks:
+        x = np.asarray(block, dtype=np.float64)
+        if states is None:
+            states = [np.zeros((2, x.shape[1])) for _ in filters]
+        for i, (b, a) in enumerate(filters):
+            x, states[i] = lfilter(b, a, x, axis=0, zi=states[i])
+        energy = np.concatenate([carry, (x ** 2).sum(axis=1)])
+        n_full = len(energy) // step * step
+        step_powers.append(energy[:n_full].reshape(-1, step).mean(axis=1))
+        carry = energy[n_full:]
+    if not step_powers:
+        return float("-inf")
+    steps = np.concatenate(step_powers)
+    steps_per_block = int(round(BLOCK_SEC / BLOCK_STEP_SEC))
+    if len(steps) < steps_per_block:
+        return _gated_loudness([steps.mean()] if len(steps) else [])
+    powers = np.convolve(steps, np.ones(steps_per_block) / steps_per_block, mode="valid")
+    return _gated_loudness(powers)
+
+
+def true_peak(samples, rate, chunk_sec=10.0):
+    """True peak in dBTP using 4x polyphase oversampling, processed in chunks to bound memory."""
+    samples = np.asarray(samples, dtype=np.float64)
+    chunk = int(chunk_sec * rate)
+    pad = 64
+    peak = 0.0
+    for start in range(0, samples.shape[0], chunk):
+        lo = max(0, start - pad)
+        hi = min(samples.shape[0], start + chunk + pad)
+        upsampled = resample_poly(samples[lo:hi], 4, 1, axis=0)
+        peak = max(peak, float(np.max(np.abs(upsampled), initial=0.0)))
+    return float(20 * np.log10(peak)) if peak > 0 else float("-inf")
+
+
+def measure(samples, rate):
+    return {
+        "integrated": integrated_loudness(samples, rate),
+        "true_peak": true_peak(samples, rate),
+    }
+
+
+def measure_cached(key, load_segment):
+    """Loudness of the audio with content hash `key`; load_segment() is only called on a cache miss."""
+    cached = _measurements.get(key)
+    if cached is None:
+        seg = load_segment()
+        cached = measure(segment_to_array(seg), seg.frame_rate)
+        _measurements.set(key, cached)
+    return cached
+
+
+def measure_file(path):
+    """Loudness of a source file, cached by content hash so batch renders analyse each file once."""
+    return measure_cached(file_digest(path), lambda: AudioSegment.from_file(path))
+
+
+def narration_loudness(paths, measurements=()):
+    """
+    Median loudness of the narration lines; the reference SFX levels are placed
+    against. Lines are files, or measurements already taken (packed PCM narration).
+    """
+    values = [measure_file(p)["integrated"] for p in paths] + [m["integrated"] for m in measurements]
+    values = [v for v in values if np.isfinite(v)]
+    return float(np.median(values)) if values else TARGET_LUFS
+
+
+def db_to_gain(db):
+    return 10 ** (db / 20.0)
+
+
+def limit(samples, rate, ceiling_db=TRUE_PEAK_CEILING):
+    """
+    Look-ahead peak limiter computed as one gain curve: the per-sample gain needed
+    to stay under the ceiling is spread over the look-ahead window with a sliding
+    minimum, then smoothed with a moving average (which can only lower it further).
+    """
+    # Leave headroom for inter-sample peaks that the sample-domain gain cannot see
+    ceiling = 10 ** ((ceiling_db - 0.5) / 20.0)
+    peaks = np.max(np.abs(samples), axis=1)
+    needed = np.minimum(1.0, ceiling / np.maximum(peaks, 1e-9))
+    window = max(1, int(LIMITER_LOOKAHEAD_SEC * rate))
+    gain = minimum_filter1d(needed, size=2 * window + 1)
+    gain = uniform_filter1d(gain, size=window)
+    return samples * gain[:, None]
+
+
+def normalize_mix(samples, rate, target_lufs=TARGET_LUFS, ceiling_db=TRUE_PEAK_CEILING):
+    """
+    Measure the whole mixed timeline once, apply a single gain to reach the
+    target integrated loudness, and limit whatever would exceed the ceiling.
+    """
+    stats = measure(samples, rate)
+    if not np.isfinite(stats["integrated"]):
+        print("⚠️ Mix is silent; skipping loudness normalization.")
+        return samples
+    gain_db = target_lufs - stats["integrated"]
+    samples = samples * db_to_gain(gain_db)
+    peak_after_gain = stats["true_peak"] + gain_db
+    if peak_after_gain > ceiling_db:
+        samples = limit(samples, rate, ceiling_db)
+    print(
+        f"🔊 Loudness: {stats['integrated']:.1f} LUFS → {target_lufs:.1f} LUFS "
+        f"(gain {gain_db:+.1f} dB, peak {peak_after_gain:.1f} dBTP"
+        f"{', limited' if peak_after_gain > ceiling_db else ''})"
+    )
+    return samples.astype(np.float32)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure integrated loudness and true peak of audio files")
+    parser.add_argument("paths", nargs="+", help="Audio files to measure")
+    args = parser.parse_args()
+    for path in args.paths:
+        stats = measure_file(path)
+        print(f"{path}: {stats['integrated']:.1f} LUFS, {stats['true_peak']:.1f} dBTP")
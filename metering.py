@@ -0,0 +1,258 @@
+"""
+Metering for outbound API calls (Google TTS, OpenAI chat, Stability): latency
+percentiles, retries, throttling, bytes, characters, tokens and an estimated
+cost, per reel and cumulatively. Billed units (characters, tokens, generations)
+count successful calls only; characters sent in failed attempts are reported
+separately as failed_characters.
+
+generate.py resets the meter per script and writes
+    metrics/<name>.json         per-reel report
+    metrics/thinktok_api.prom   Prometheus textfile (cumulative, for node_exporter's textfile collector)
+
+Usage:
+    python metering.py metrics/test.json     # print a saved per-reel report
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import profiler
+
+try:
+    import fcntl
+except ImportError:  # Windows: cumulative totals are updated without a file lock
+    fcntl = None
+
+METRICS_DIR = os.getenv("THINKTOK_METRICS_DIR", "metrics")
+PROM_FILENAME = "thinktok_api.prom"
+
+# Estimated list prices in USD; update when the plan changes
+PRICES = {
+    "google_tts": {"per_million_characters": 30.0},          # Chirp 3 HD voices
+    "openai_chat": {"per_million_prompt_tokens": 0.15, "per_million_completion_tokens": 0.60},  # gpt-4o-mini
+    "stability": {"per_generation": 0.009},                  # SD 1.6, ~0.9 credits per 1024px image
+}
+
+COUNTER_FIELDS = ("calls", "errors", "retries", "throttled", "request_bytes", "response_bytes",
+                  "characters", "prompt_tokens", "completion_tokens", "generations", "failed_characters")
+# Units the cost estimate is based on; a failed attempt is not billed for them
+BILLED_FIELDS = ("characters", "prompt_tokens", "completion_tokens", "generations")
+
+
+def estimate_cost(service, stats):
+    price = PRICES.get(service, {})
+    return (
+        stats.get("characters", 0) / 1e6 * price.get("per_million_characters", 0.0)
+        + stats.get("prompt_tokens", 0) / 1e6 * price.get("per_million_prompt_tokens", 0.0)
+        + stats.get("completion_tokens", 0) / 1e6 * price.get("per_million_completion_tokens", 0.0)
+        + stats.get("generations", 0) * price.get("per_generation", 0.0)
+    )
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else None
+
+
+class ApiCall:
+    """Filled in by the caller inside `with meter.call(...)`; recorded on exit."""
+
+    def __init__(self, service, attempt, request_bytes, characters):
+        self.service = service
+        self.attempt = attempt
+        self.request_bytes = request_bytes
+        self.response_bytes = 0
+        self.characters = characters
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.generations = 0
+        self.status = "ok"
+
+    def set_usage(self, usage):
+        """OpenAI `usage` object (or None)."""
+        if usage is not None:
+            self.prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+            self.completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+
+
+def _status_of(error):
+    # status_code: openai/fake_services errors; code: google.api_core errors
+    code = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if not isinstance(code, int):
+        code = None
+    response = getattr(error, "response", None)
+    if code is None and response is not None:
+        code = getattr(response, "status_code", None)
+    return str(code) if code else type(error).__name__
+
+
+class Meter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.services = {}
+            self.in_flight = {}
+
+    def _stats(self, service):
+        if service not in self.services:
+            self.services[service] = {**{field: 0 for field in COUNTER_FIELDS}, "latencies": [], "statuses": {}, "max_in_flight": 0}
+        return self.services[service]
+
+    @contextmanager
+    def call(self, service, attempt=1, request_bytes=0, characters=0):
+        """
+        Meter one outbound request: `with meter.call("openai_chat", attempt=2) as c: ...`.
+        Exceptions are recorded with their HTTP status (429 counts as throttled) and re-raised.
+        """
+        record = ApiCall(service, attempt, request_bytes, characters)
+        with self.lock:
+            stats = self._stats(service)
+            self.in_flight[service] = self.in_flight.get(service, 0) + 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], self.in_flight[service])
+        t0 = time.perf_counter()
+        try:
+            with profiler.span(f"api.{service}", cat="api", attempt=attempt):
+                yield record
+        except Exception as e:
+            record.status = _status_of(e)
+            raise
+        finally:
+            latency = time.perf_counter() - t0
+            with self.lock:
+                self.in_flight[service] -= 1
+                stats["calls"] += 1
+                stats["retries"] += 1 if attempt > 1 else 0
+                stats["errors"] += 0 if record.status == "ok" else 1
+                stats["throttled"] += 1 if record.status == "429" else 0
+                stats["request_bytes"] += record.request_bytes
+                stats["response_bytes"] += record.response_bytes
+                if record.status == "ok":
+                    for field in BILLED_FIELDS:
+                        stats[field] += getattr(record, field)
+                else:
+                    stats["failed_characters"] += record.characters
+                stats["latencies"].append(latency)
+                stats["statuses"][record.status] = stats["statuses"].get(record.status, 0) + 1
+
+    def report(self, script=None):
+        with self.lock:
+            elapsed = time.time() - self.started
+            services = {}
+            for service, stats in self.services.items():
+                ordered = sorted(stats["latencies"])
+                services[service] = {
+                    **{field: stats[field] for field in COUNTER_FIELDS},
+                    "statuses": dict(stats["statuses"]),
+                    "max_in_flight": stats["max_in_flight"],
+                    "latency_sec": {
+                        "p50": _percentile(ordered, 0.50), "p90": _percentile(ordered, 0.90),
+                        "p99": _percentile(ordered, 0.99), "max": ordered[-1] if ordered else None,
+                        "sum": sum(ordered),
+                    },
+                    "calls_per_minute": round(stats["calls"] / elapsed * 60, 2) if elapsed > 0 else None,
+                    "cost_usd": round(estimate_cost(service, stats), 6),
+                }
+        return {
+            "script": script,
+            "started_at": self.started,
+            "elapsed_sec": round(elapsed, 3),
+            "services": services,
+            "cost_usd": round(sum(s["cost_usd"] for s in services.values()), 6),
+        }
+
+
+meter = Meter()
+
+
+def _prometheus_text(totals, last_report):
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP thinktok_api_{name} {help_text}")
+        lines.append(f"# TYPE thinktok_api_{name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            lines.append(f"thinktok_api_{name}{{{label_text}}} {value}" if label_text else f"thinktok_api_{name} {value}")
+
+    for field in COUNTER_FIELDS:
+        metric(f"{field}_total", "counter", f"Cumulative {field.replace('_', ' ')}",
+               [({"service": s}, t[field]) for s, t in totals["services"].items()])
+    metric("latency_seconds_sum", "counter", "Cumulative request latency",
+           [({"service": s}, round(t["latency_sum"], 6)) for s, t in totals["services"].items()])
+    metric("cost_usd_total", "counter", "Cumulative estimated cost",
+           [({"service": s}, round(t["cost_usd"], 6)) for s, t in totals["services"].items()])
+    metric("reels_total", "counter", "Reels that made metered calls", [({}, totals["reels"])])
+    quantiles = []
+    for service, s in last_report["services"].items():
+        for q, label in (("p50", "0.5"), ("p90", "0.9"), ("p99", "0.99")):
+            if s["latency_sec"][q] is not None:
+                quantiles.append(({"service": service, "quantile": label}, round(s["latency_sec"][q], 6)))
+    metric("last_reel_latency_seconds", "gauge", "Latency quantiles of the most recent reel", quantiles)
+    metric("last_reel_max_in_flight", "gauge", "Peak concurrent requests in the most recent reel",
+           [({"service": s}, r["max_in_flight"]) for s, r in last_report["services"].items()])
+    metric("last_reel_cost_usd", "gauge", "Estimated cost of the most recent reel", [({}, last_report["cost_usd"])])
+    return "\n".join(lines) + "\n"
+
+
+def write_reports(name, metrics_dir=METRICS_DIR, script=None):
+    """
+    Write metrics/<name>.json for this reel and fold it into the cumulative
+    totals behind the Prometheus textfile. Returns the report, or None if no
+    API call was made.
+    """
+    report = meter.report(script)
+    if not report["services"]:
+        return None
+    os.makedirs(metrics_dir, exist_ok=True)
+    with open(os.path.join(metrics_dir, f"{name}.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    # Batch workers finish reels concurrently: serialize the read-modify-write of the totals
+    totals_path = os.path.join(metrics_dir, "totals.json")
+    with open(os.path.join(metrics_dir, ".totals.lock"), "w") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        totals = {"reels": 0, "services": {}}
+        if os.path.exists(totals_path):
+            with open(totals_path, "r", encoding="utf-8") as f:
+                totals = json.load(f)
+        totals["reels"] += 1
+        for service, s in report["services"].items():
+            t = totals["services"].setdefault(service, {**{field: 0 for field in COUNTER_FIELDS}, "latency_sum": 0.0, "cost_usd": 0.0})
+            for field in COUNTER_FIELDS:
+                # Totals written before a counter existed lack it
+                t[field] = t.get(field, 0) + s[field]
+            t["latency_sum"] += s["latency_sec"]["sum"]
+            t["cost_usd"] += s["cost_usd"]
+        for path, text in ((totals_path, json.dumps(totals, indent=2)),
+                           (os.path.join(metrics_dir, PROM_FILENAME), _prometheus_text(totals, report))):
+            # node_exporter may read at any moment: write a temp file and rename it into place
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+    return report
+
+
+def print_report(report):
+    print(f"\n{'service':<14}{'calls':>6}{'err':>5}{'429':>5}{'retry':>6}{'p50 s':>8}{'p90 s':>8}{'p99 s':>8}{'inflight':>9}{'cost $':>10}")
+    for service, s in report["services"].items():
+        lat = s["latency_sec"]
+        print(f"{service:<14}{s['calls']:>6}{s['errors']:>5}{s['throttled']:>5}{s['retries']:>6}"
+              f"{lat['p50']:>8.2f}{lat['p90']:>8.2f}{lat['p99']:>8.2f}{s['max_in_flight']:>9}{s['cost_usd']:>10.4f}")
+    print(f"💰 Estimated API cost for this reel: ${report['cost_usd']:.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print a per-reel API metering report")
+    parser.add_argument("report", help="metrics/<name>.json written by generate.py")
+    args = parser.parse_args()
+    with open(args.report, "r", encoding="utf-8") as f:
+        print_report(json.load(f))
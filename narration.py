@@ -0,0 +1,213 @@
+"""
+Narration audio of a script, in one of two layouts of its audio directory:
+
+    mp3   line_01.mp3, line_02.mp3, ...: one compressed file per line, decoded
+          again by every stage that reads it
+    pcm   narration.wav with every line's LINEAR16 samples back to back, and
+          narration.json with the sample format and each line's frame offset,
+          length and content hash
+
+With pcm narration the audio is compressed once, in the final AAC encode.
+Line durations come from the index (exact, without MP3 encoder padding) and
+lines are read as slices of a memory map of narration.wav, not decoded.
+Stages open the directory with open_narration and work with either layout.
+
+Usage:
+    python narration.py audio/test
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import mmap
+import os
+import wave
+
+from cache_utils import file_digest
+
+NARRATION_FORMATS = ("mp3", "pcm")
+DEFAULT_FORMAT = "mp3"
+PCM_SAMPLE_RATE = 24000          # Chirp3-HD voices synthesize at 24 kHz
+PACKED_WAV = "narration.wav"
+PACKED_INDEX = "narration.json"
+
+
+def line_mp3_path(audio_dir, idx):
+    return os.path.join(audio_dir, f"line_{idx:02}.mp3")
+
+
+def _data_offset(path):
+    """Byte offset of the sample data in a RIFF/WAVE file."""
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise ValueError(f"{path} is not a WAV file")
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            size = int.from_bytes(chunk[4:], "little")
+            if chunk[:4] == b"data":
+                return f.tell()
+            f.seek(size + (size & 1), os.SEEK_CUR)
+
+
+class NarrationWriter:
+    """
+    Appends TTS LINEAR16 responses (WAV bytes) to narration.wav and records
+    where each line sits. Both files are replaced only when the writer closes
+    without an error, so a failed TTS run leaves the previous narration intact.
+    """
+
+    def __init__(self, audio_dir):
+        self.audio_dir = audio_dir
+        self.wav_path = os.path.join(audio_dir, PACKED_WAV)
+        self.index_path = os.path.join(audio_dir, PACKED_INDEX)
+        self._tmp_path = f"{self.wav_path}.{os.getpid()}.tmp"
+        self._wav = None
+        self._frames = 0
+        self.index = None
+
+    def add(self, idx, wav_bytes):
+        """Append one line's audio; returns its duration in milliseconds."""
+        with wave.open(io.BytesIO(wav_bytes), "rb") as src:
+            params = (src.getnchannels(), src.getsampwidth(), src.getframerate())
+            frames = src.readframes(src.getnframes())
+        if self._wav is None:
+            os.makedirs(self.audio_dir, exist_ok=True)
+            self._wav = wave.open(self._tmp_path, "wb")
+            self._wav.setnchannels(params[0])
+            self._wav.setsampwidth(params[1])
+            self._wav.setframerate(params[2])
+            self.index = {"channels": params[0], "sample_width": params[1], "sample_rate": params[2], "lines": {}}
+        elif params != (self.index["channels"], self.index["sample_width"], self.index["sample_rate"]):
+            raise ValueError(f"Line {idx} audio format {params} differs from the earlier lines")
+        n_frames = len(frames) // (params[0] * params[1])
+        self._wav.writeframes(frames)
+        self.index["lines"][str(idx)] = {
+            "offset": self._frames, "frames": n_frames, "digest": hashlib.sha256(frames).hexdigest(),
+        }
+        self._frames += n_frames
+        return round(n_frames * 1000 / params[2])
+
+    def close(self, commit=True):
+        if self._wav is None:
+            return
+        self._wav.close()
+        self._wav = None
+        if not commit:
+            os.remove(self._tmp_path)
+            return
+        os.replace(self._tmp_path, self.wav_path)
+        tmp_index = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_index, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmp_index, self.index_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        self.close(commit=exc_type is None)
+        return False
+
+
+def remove_packed(audio_dir):
+    """Drop a packed narration so per-line MP3s written after it are the ones read."""
+    for name in (PACKED_INDEX, PACKED_WAV):
+        path = os.path.join(audio_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class Narration:
+    """Read access to a script's narration lines, whichever layout is on disk."""
+
+    def __init__(self, audio_dir):
+        self.audio_dir = audio_dir
+        self.index = None
+        self._file = None
+        self._map = None
+        self._data_offset = 0
+        index_path = os.path.join(audio_dir, PACKED_INDEX)
+        if os.path.exists(index_path):
+            with open(index_path, "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+
+    @property
+    def format(self):
+        return "pcm" if self.index is not None else "mp3"
+
+    def has(self, idx):
+        if self.index is not None:
+            return str(idx) in self.index["lines"]
+        return os.path.exists(line_mp3_path(self.audio_dir, idx))
+
+    def duration_ms(self, idx):
+        if self.index is not None:
+            return round(self.index["lines"][str(idx)]["frames"] * 1000 / self.index["sample_rate"])
+        from timeline import probe_duration_ms
+        return probe_duration_ms(line_mp3_path(self.audio_dir, idx))
+
+    def digest(self, idx):
+        """Content hash of a line's audio, for cache keys."""
+        if self.index is not None:
+            return self.index["lines"][str(idx)]["digest"]
+        return file_digest(line_mp3_path(self.audio_dir, idx))
+
+    def pcm(self, idx):
+        """A line's raw sample bytes: a slice of the memory-mapped narration.wav."""
+        if self._map is None:
+            wav_path = os.path.join(self.audio_dir, PACKED_WAV)
+            self._data_offset = _data_offset(wav_path)
+            self._file = open(wav_path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        line = self.index["lines"][str(idx)]
+        frame_bytes = self.index["channels"] * self.index["sample_width"]
+        start = self._data_offset + line["offset"] * frame_bytes
+        return self._map[start:start + line["frames"] * frame_bytes]
+
+    def segment(self, idx):
+        """A line as a pydub AudioSegment (decoded only for the mp3 layout)."""
+        from pydub import AudioSegment
+        if self.index is None:
+            return AudioSegment.from_file(line_mp3_path(self.audio_dir, idx))
+        return AudioSegment(
+            data=self.pcm(idx), sample_width=self.index["sample_width"],
+            frame_rate=self.index["sample_rate"], channels=self.index["channels"],
+        )
+
+    def loudness(self, idx):
+        """Loudness measurement of a line, cached by its content hash."""
+        from loudness import measure_cached
+        return measure_cached(self.digest(idx), lambda: self.segment(idx))
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+def open_narration(audio_dir):
+    return Narration(audio_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the narration layout and line durations of an audio directory")
+    parser.add_argument("audio_dir", help="Audio directory of a script, e.g. audio/test")
+    parser.add_argument("--lines", type=int, default=99, help="Highest line number to look for")
+    args = parser.parse_args()
+    with open_narration(args.audio_dir) as narration:
+        print(f"{args.audio_dir}: {narration.format}")
+        for idx in range(1, args.lines + 1):
+            if narration.has(idx):
+                print(f"  line {idx:02}: {narration.duration_ms(idx)} ms")
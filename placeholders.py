@@ -0,0 +1,84 @@
+import hashlib
+import os
+
+# Local scene cards for lines whose real image is missing or still being
+# generated. A card depends only on the line number and text, so it is drawn
+# once and reused until the line changes.
+PLACEHOLDER_SUBDIR = "placeholders"
+PLACEHOLDER_SIZE = 1024
+PLACEHOLDER_FONT = "fonts/title_2.otf"
+# (background, text) pairs; the first matches image_generator's yellow background
+PALETTE = [
+    ((255, 224, 189), (60, 40, 20)),
+    ((189, 224, 255), (20, 40, 70)),
+    ((214, 255, 189), (30, 60, 20)),
+    ((255, 199, 214), (70, 20, 40)),
+]
+
+
+def line_image(image_dir, idx):
+    """The real image for line idx, if there is one."""
+    for ext in (".png", ".jpg", ".jpeg"):
+        candidate = os.path.join(image_dir, f"line_{idx:02}{ext}")
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def placeholder_path(image_dir, idx, text):
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(image_dir, PLACEHOLDER_SUBDIR, f"line_{idx:02}_{digest}.png")
+
+
+def _wrap(draw, text, font, max_width):
+    """Greedy wrap by measured width; works for Korean text without spaces too."""
+    lines = []
+    for paragraph in text.replace("\\n", "\n").split("\n"):
+        current = ""
+        for char in paragraph:
+            if current and draw.textlength(current + char, font=font) > max_width:
+                # Prefer breaking at the last space on the line
+                cut = current.rfind(" ")
+                if cut > 0:
+                    lines.append(current[:cut])
+                    current = current[cut + 1:] + char
+                else:
+                    lines.append(current)
+                    current = char
+            else:
+                current += char
+        lines.append(current)
+    return lines
+
+
+def placeholder_image(image_dir, idx, text):
+    """Path of the scene card for line idx, drawn with Pillow if it does not exist yet."""
+    path = placeholder_path(image_dir, idx, text)
+    if os.path.exists(path):
+        return path
+    # Pillow is only needed to draw a card; generate.py imports line_image at startup
+    from PIL import Image, ImageDraw, ImageFont
+    background, color = PALETTE[(idx - 1) % len(PALETTE)]
+    image = Image.new("RGB", (PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), background)
+    draw = ImageDraw.Draw(image)
+    try:
+        font = ImageFont.truetype(PLACEHOLDER_FONT, 72)
+        small = ImageFont.truetype(PLACEHOLDER_FONT, 40)
+    except OSError:
+        font = small = ImageFont.load_default()
+
+    margin = PLACEHOLDER_SIZE // 10
+    lines = _wrap(draw, text, font, PLACEHOLDER_SIZE - 2 * margin)
+    line_height = int(font.size * 1.3) if hasattr(font, "size") else 20
+    y = (PLACEHOLDER_SIZE - line_height * len(lines)) // 2
+    for line in lines:
+        width = draw.textlength(line, font=font)
+        draw.text(((PLACEHOLDER_SIZE - width) / 2, y), line, font=font, fill=color)
+        y += line_height
+    draw.text((margin, margin // 2), f"#{idx:02}", font=small, fill=color)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    image.save(tmp_path, format="PNG")
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,195 @@
+"""
+Opt-in profiling for the generation pipeline: stage spans, per-scene timings,
+per-frame compose/encode histograms and subprocess counts, written as a Chrome
+trace (open in chrome://tracing or https://ui.perfetto.dev) plus a summary table.
+
+When profiling is off, span() returns one shared no-op context manager and
+sample()/count() return after a single check, so instrumented code costs
+next to nothing.
+
+Usage:
+    python generate.py --script scripts/test.txt --skip-tts --profile traces/test.json
+    python profiler.py traces/test.json      # print the summary of a saved trace
+"""
+
+import argparse
+import bisect
+import collections
+import contextlib
+import json
+import os
+import subprocess
+import threading
+import time
+
+# Upper bounds (ms) of the per-frame histogram buckets; the last bucket is open-ended
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500]
+
+_active = None
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class Profiler:
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.events = []
+        self.samples = collections.defaultdict(list)
+        self.counters = collections.Counter()
+        self.thread_names = {}
+        self.lock = threading.Lock()
+
+    def _us(self, t):
+        return round((t - self.origin) * 1e6, 1)
+
+    def add_event(self, name, cat, t0, t1, args=None):
+        thread = threading.current_thread()
+        event = {
+            "name": name, "cat": cat, "ph": "X", "pid": self.pid, "tid": thread.ident,
+            "ts": self._us(t0), "dur": round((t1 - t0) * 1e6, 1),
+        }
+        if args:
+            event["args"] = args
+        with self.lock:
+            self.thread_names.setdefault(thread.ident, thread.name)
+            self.events.append(event)
+
+    def spans_by_name(self):
+        totals = collections.OrderedDict()
+        for event in self.events:
+            if event["cat"] == "frame":
+                continue
+            entry = totals.setdefault(event["name"], [0, 0.0])
+            entry[0] += 1
+            entry[1] += event["dur"] / 1e6
+        return totals
+
+    def histograms(self):
+        result = {}
+        for name, values in self.samples.items():
+            ordered = sorted(values)
+            buckets = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+            for v in ordered:
+                buckets[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, v * 1000)] += 1
+            result[name] = {
+                "count": len(ordered),
+                "total_sec": sum(ordered),
+                "mean_ms": 1000 * sum(ordered) / len(ordered),
+                "p50_ms": 1000 * ordered[len(ordered) // 2],
+                "p95_ms": 1000 * ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "max_ms": 1000 * ordered[-1],
+                "buckets_ms": dict(zip([f"<{b}" for b in HISTOGRAM_BUCKETS_MS] + [f">={HISTOGRAM_BUCKETS_MS[-1]}"], buckets)),
+            }
+        return result
+
+    def summary(self):
+        return {
+            "spans": {name: {"count": n, "total_sec": round(total, 4)} for name, (n, total) in self.spans_by_name().items()},
+            "histograms": self.histograms(),
+            "subprocesses": dict(self.counters),
+        }
+
+    def write_chrome_trace(self, path):
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+            for tid, name in self.thread_names.items()
+        ]
+        trace = {"traceEvents": metadata + self.events, "displayTimeUnit": "ms", "otherData": self.summary()}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(trace, f)
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "cat", "args", "t0")
+
+    def __init__(self, profiler, name, cat, args):
+        self.profiler = profiler
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add_event(self.name, self.cat, self.t0, time.perf_counter(), self.args)
+        return False
+
+
+def enabled():
+    return _active is not None
+
+
+def span(name, cat="stage", **args):
+    """Time a block: `with profiler.span("tts", lines=12): ...`."""
+    if _active is None:
+        return _NULL_SPAN
+    return _Span(_active, name, cat, args)
+
+
+def sample(name, t0, t1):
+    """Record one per-frame measurement (perf_counter start/end) for the histograms and the trace."""
+    if _active is None:
+        return
+    _active.samples[name].append(t1 - t0)
+    _active.add_event(name, "frame", t0, t1)
+
+
+def count(name, n=1):
+    if _active is None:
+        return
+    with _active.lock:
+        _active.counters[name] += n
+
+
+_original_popen_init = subprocess.Popen.__init__
+
+
+def _counting_popen_init(self, args, *a, **kw):
+    program = args if isinstance(args, (str, bytes)) else args[0]
+    program = os.fsdecode(program).split()[0] if isinstance(program, (str, bytes)) else str(program)
+    count(os.path.basename(program))
+    _original_popen_init(self, args, *a, **kw)
+
+
+def enable():
+    """Start collecting. Subprocess launches (ffmpeg, ImageMagick for TextClip, ...) are counted by program name."""
+    global _active
+    _active = Profiler()
+    subprocess.Popen.__init__ = _counting_popen_init
+    return _active
+
+
+def disable():
+    """Stop collecting and return the profiler with everything recorded."""
+    global _active
+    profiler, _active = _active, None
+    subprocess.Popen.__init__ = _original_popen_init
+    return profiler
+
+
+def print_summary(summary):
+    spans = summary["spans"]
+    if spans:
+        print(f"\n{'span':<28}{'count':>7}{'total s':>10}{'mean ms':>10}")
+        for name, s in sorted(spans.items(), key=lambda item: -item[1]["total_sec"]):
+            print(f"{name:<28}{s['count']:>7}{s['total_sec']:>10.3f}{1000 * s['total_sec'] / s['count']:>10.1f}")
+    if summary["histograms"]:
+        print(f"\n{'per frame':<28}{'count':>7}{'mean ms':>10}{'p50':>8}{'p95':>8}{'max':>8}")
+        for name, h in summary["histograms"].items():
+            print(f"{name:<28}{h['count']:>7}{h['mean_ms']:>10.2f}{h['p50_ms']:>8.2f}{h['p95_ms']:>8.2f}{h['max_ms']:>8.2f}")
+            print("    " + "  ".join(f"{bucket}ms:{n}" for bucket, n in h["buckets_ms"].items() if n))
+    if summary["subprocesses"]:
+        print(f"\n{'subprocess':<28}{'launches':>9}")
+        for program, n in sorted(summary["subprocesses"].items(), key=lambda item: -item[1]):
+            print(f"{program:<28}{n:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the summary table of a saved Chrome trace")
+    parser.add_argument("trace", help="Trace JSON written by generate.py --profile")
+    args = parser.parse_args()
+    with open(args.trace, "r", encoding="utf-8") as f:
+        print_summary(json.load(f)["otherData"])
@@ -0,0 +1,319 @@
+"""
+Render daemon: a long-running service that keeps warm worker processes
+(moviepy, fonts, SFX bank, scene-raster caches) and renders jobs sent over a
+small JSON API on localhost HTTP or a Unix socket.
+
+Usage:
+    python render_daemon.py [--host 127.0.0.1] [--port 8765] [--socket /tmp/thinktok.sock] [--workers 1]
+
+API:
+    POST   /jobs          {"script": "scripts/test.txt", "skip_tts": true, "encoding": "preview"}
+                          (Content-Type: application/json; keys are the generate.py options
+                          in JOB_OPTIONS) -> {"id": 3, "status": "queued"}
+    GET    /jobs          every job
+    GET    /jobs/<id>     status, output path, error, timings
+    DELETE /jobs/<id>     cancel: a queued job is dropped, a running job's worker is killed and respawned
+    GET    /health        workers and queue length
+
+Examples:
+    curl -s -X POST localhost:8765/jobs -H 'Content-Type: application/json' -d '{"script": "scripts/test.txt", "skip_tts": true, "proxy": true}'
+    curl -s localhost:8765/jobs/1
+    curl -s --unix-socket /tmp/thinktok.sock http://daemon/jobs/1
+"""
+
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import re
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.connection import wait
+
+from batch_render import Worker
+
+DEFAULT_PORT = 8765
+# Workers are started while HTTP handler threads are running; forking then could
+# copy a lock some thread holds, so workers start from a clean interpreter
+WORKER_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# generate.py options a job may set. Anything that runs a command or picks
+# where files are written (argv, stream_to, profile, metrics_dir, ...) is refused:
+# the API has no authentication, so a job must not be able to do more than render.
+JOB_OPTIONS = {
+    "script", "mood", "skip_tts", "rate", "pitch", "speed_factor", "fast", "generate_images",
+    "narration_format", "target_lufs", "no_music", "beat_sync", "profiles", "proxy", "encoding",
+    "frame_mode", "transition", "placeholders", "scene_threshold", "ram_scratch", "memory_budget",
+}
+
+
+def job_argv(payload):
+    """generate.py argv for a JSON job with JOB_OPTIONS names as keys."""
+    if not isinstance(payload, dict):
+        raise ValueError("job must be a JSON object")
+    refused = sorted(set(payload) - JOB_OPTIONS)
+    if refused:
+        raise ValueError(f"options not allowed in jobs: {', '.join(refused)}")
+    if "script" not in payload:
+        raise ValueError("job needs a 'script'")
+    argv = []
+    for key, value in payload.items():
+        flag = "--" + key.replace("_", "-")
+        if value is True:
+            argv.append(flag)
+        elif value not in (False, None):
+            # --flag=value, so a value can never be read as another option
+            argv.append(f"{flag}={','.join(map(str, value)) if isinstance(value, list) else value}")
+    return argv
+
+
+class RenderService:
+    """
+    Job table plus a dispatcher thread that owns the warm workers. HTTP handler
+    threads only touch the table under the lock; workers are started, fed and
+    killed from the dispatcher thread alone, which changes the worker list and
+    worker state under the lock too, since health() reads them.
+    """
+
+    def __init__(self, n_workers=1):
+        self.n_workers = n_workers
+        self.jobs = collections.OrderedDict()
+        self.pending = collections.deque()
+        self.lock = threading.Lock()
+        self.next_id = 1
+        self.workers = []
+        self.stopping = False
+        self.startup_error = None
+        self.thread = threading.Thread(target=self._dispatch, daemon=True)
+        self.context = multiprocessing.get_context(WORKER_START_METHOD)
+
+    def start(self):
+        workers = [Worker(self.context) for _ in range(self.n_workers)]
+        with self.lock:
+            self.workers = workers
+        self.thread.start()
+
+    def stop(self):
+        self.stopping = True
+        self.thread.join(timeout=5)
+        for worker in self.workers:
+            worker.stop(kill=worker.job is not None)
+
+    def submit(self, argv):
+        with self.lock:
+            job_id = self.next_id
+            self.next_id += 1
+            self.jobs[job_id] = {
+                "id": job_id, "argv": argv, "status": "queued", "submitted_at": time.time(),
+                "started_at": None, "finished_at": None, "output": None, "error": None,
+            }
+            self.pending.append(job_id)
+            return self._public(self.jobs[job_id])
+
+    def status(self, job_id=None):
+        with self.lock:
+            if job_id is None:
+                return [self._public(job) for job in self.jobs.values()]
+            job = self.jobs.get(job_id)
+            return self._public(job) if job else None
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] == "queued":
+                self.pending.remove(job_id)
+                job.update(status="cancelled", finished_at=time.time())
+            elif job["status"] == "running":
+                # The dispatcher kills the worker on its next pass
+                job["status"] = "cancelling"
+            return self._public(job)
+
+    def health(self):
+        with self.lock:
+            return {
+                "workers": len(self.workers),
+                "ready": sum(1 for w in self.workers if w.ready),
+                "busy": sum(1 for w in self.workers if w.job is not None),
+                "queued": len(self.pending),
+                "startup_error": self.startup_error,
+            }
+
+    @staticmethod
+    def _public(job):
+        view = dict(job)
+        if job["started_at"] and job["finished_at"]:
+            view["render_sec"] = round(job["finished_at"] - job["started_at"], 2)
+        return view
+
+    def _finish(self, worker, status, output=None, error=None):
+        with self.lock:
+            job = self.jobs[worker.job]
+            job.update(status=status, output=output, error=error, finished_at=time.time())
+            worker.job = None
+        print(f"{'✅' if status == 'done' else '❌'} [{job['id']}] {status} {output or ''}")
+
+    def _replace(self, worker):
+        """Respawn a worker outside the lock (it kills and starts processes), then swap it in."""
+        replacement = worker.respawn()
+        with self.lock:
+            self.workers[self.workers.index(worker)] = replacement
+
+    def _dispatch(self):
+        while not self.stopping:
+            if not self.workers:
+                with self.lock:
+                    while self.pending:
+                        job = self.jobs[self.pending.popleft()]
+                        job.update(status="failed", error=self.startup_error, finished_at=time.time())
+                time.sleep(0.2)
+                continue
+            # Start queued jobs on ready, idle workers
+            gone = []
+            with self.lock:
+                for worker in self.workers:
+                    if worker.ready and worker.job is None and self.pending:
+                        job = self.jobs[self.pending[0]]
+                        if not worker.start_job(job["id"], job["argv"]):
+                            # The worker died while idle; the job waits for its replacement
+                            gone.append(worker)
+                            continue
+                        self.pending.popleft()
+                        job.update(status="running", started_at=time.time())
+                        worker.job = job["id"]
+                        print(f"▶ [{job['id']}] {' '.join(job['argv'])} → worker {worker.process.pid}")
+            for worker in gone:
+                print(f"⚠️ Worker {worker.process.pid} is gone, starting a new one")
+                self._replace(worker)
+
+            for conn in wait([w.conn for w in self.workers], timeout=0.2):
+                worker = next(w for w in self.workers if w.conn is conn)
+                died = False
+                try:
+                    status, _, output, error = conn.recv()
+                except EOFError:
+                    died = True
+                    status, output, error = "failed", None, "worker process died"
+                if status == "ready":
+                    with self.lock:
+                        worker.ready = True
+                    continue
+                if not worker.ready:
+                    # Respawning would fail the same way; keep serving status and report it
+                    with self.lock:
+                        self.startup_error = "worker died while warming up; run generate.py once to see the error"
+                        self.workers.remove(worker)
+                    print(f"❌ {self.startup_error}")
+                    continue
+                if worker.job is not None:
+                    self._finish(worker, status, output, error)
+                # After EOF the process may not be reaped yet, so is_alive() alone is not enough
+                if died or not worker.process.is_alive():
+                    self._replace(worker)
+
+            # Cancellation: a render cannot be interrupted cleanly mid-encode, so the
+            # worker is killed and a fresh warm one takes its place
+            with self.lock:
+                cancelling = [w for w in self.workers if w.job is not None and self.jobs[w.job]["status"] == "cancelling"]
+            for worker in cancelling:
+                self._finish(worker, "cancelled")
+                self._replace(worker)
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    service = None           # set by serve()
+
+    def _send(self, code, body):
+        data = json.dumps(body, ensure_ascii=False, indent=2).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _job_id(self):
+        match = re.fullmatch(r"/jobs/(\d+)", self.path.rstrip("/"))
+        return int(match.group(1)) if match else None
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/health":
+            return self._send(200, self.service.health())
+        if self.path.rstrip("/") == "/jobs":
+            return self._send(200, self.service.status())
+        job_id = self._job_id()
+        job = self.service.status(job_id) if job_id is not None else None
+        if job is None:
+            return self._send(404, {"error": "no such job"})
+        self._send(200, job)
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            return self._send(404, {"error": "unknown endpoint"})
+        # Browsers cannot send this type cross-site without a CORS preflight, which is never granted
+        if self.headers.get_content_type() != "application/json":
+            return self._send(415, {"error": "Content-Type must be application/json"})
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            argv = job_argv(payload)
+        except (ValueError, AttributeError) as e:
+            return self._send(400, {"error": str(e)})
+        self._send(202, self.service.submit(argv))
+
+    def do_DELETE(self):
+        job_id = self._job_id()
+        job = self.service.cancel(job_id) if job_id is not None else None
+        if job is None:
+            return self._send(404, {"error": "no such job"})
+        self._send(200, job)
+
+    def address_string(self):
+        # Unix-socket peers have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        socketserver.UnixStreamServer.server_bind(self)
+        # BaseHTTPRequestHandler reads these for the Server header
+        self.server_name, self.server_port = "localhost", 0
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, socket_path=None, n_workers=1):
+    service = RenderService(n_workers)
+    RenderRequestHandler.service = service
+    if socket_path:
+        server = UnixHTTPServer(socket_path, RenderRequestHandler)
+        where = f"unix:{socket_path}"
+    else:
+        server = ThreadingHTTPServer((host, port), RenderRequestHandler)
+        where = f"http://{host}:{port}"
+    service.start()
+    print(f"🎬 Render daemon listening on {where} with {n_workers} warm worker(s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n⏹ Shutting down render daemon...")
+    finally:
+        server.server_close()
+        service.stop()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm render daemon with a local JSON API")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address (keep it local: there is no authentication)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="HTTP port")
+    parser.add_argument("--socket", default=None, help="Serve on this Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=1, help="Warm worker processes")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.socket, args.workers)
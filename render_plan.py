@@ -0,0 +1,182 @@
+"""
+Declarative layout. A JSON spec (layouts/default.json) describes the output
+profiles, the header, channel text and subtitle style; compile_plan turns it
+into a RenderPlan: read-only, with every position and font size worked out
+per profile and header text, and the font files checked once. One plan can be
+shared by any number of builds, in threads or one after another in a warm
+worker, because nothing in it changes after compilation.
+
+Usage:
+    python render_plan.py [--layout layouts/default.json] [--header "THINKTOK\\n뇌 깨우기"] [--profiles reel,square]
+"""
+
+import argparse
+import json
+import math
+import os
+import threading
+from types import MappingProxyType
+
+from cache_utils import recipe_key
+
+DEFAULT_LAYOUT = "layouts/default.json"
+
+_plans = {}
+_plans_lock = threading.Lock()
+
+
+def freeze(value):
+    """Read-only copy: dicts become mappingproxies and lists tuples, recursively."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    """Plain dict/list copy of a frozen value (for JSON and cache keys)."""
+    if isinstance(value, MappingProxyType):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    return value
+
+
+def load_spec(path=DEFAULT_LAYOUT):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compute_layout(spec, profile, header_text):
+    """
+    Positions and font sizes for one output profile. Sizes in the spec are for
+    a reference_width-wide image box and scale with the profile's image box;
+    subtitles never go below the spec's min_fontsize, so small review renders
+    (proxy) stay readable.
+    """
+    width, height = profile["size"]
+    crop_frac = spec["crop_frac"]
+    header, channel, subtitle = spec["header"], spec["channel"], spec["subtitle"]
+    image_w = min(width, round(height * profile["image_frac"] / (1 - 2 * crop_frac)))
+    scale = image_w / spec["reference_width"]
+    crop = int(image_w * crop_frac)
+    image_h = image_w - 2 * crop
+    image_top = (height - image_h) // 2
+    # Top of the uncropped square image; the title ends there
+    square_top = (height - image_w) // 2
+
+    title_fontsize = int(header["fontsize"] * scale)
+    title_y = square_top - title_fontsize * (header_text.count("\n") + 1) + title_fontsize
+
+    # The channel text sits a few font sizes from the top, unless the title would overlap it
+    top_fontsize = int(channel["fontsize"] * scale)
+    top_text_y = top_fontsize * channel["top_fontsizes"]
+    if top_text_y + top_fontsize > title_y:
+        top_text_y = max(0, title_y - int(top_fontsize * 1.5))
+
+    return {
+        "size": (width, height),
+        "scale": scale,
+        "header_text": header_text,
+        "header_font": header["font"],
+        "header_color": header["color"],
+        "image_box": ((width - image_w) // 2, image_top, image_w, image_h),
+        "image_crop": crop,
+        "title_fontsize": title_fontsize,
+        "title_y": title_y,
+        "title_width": width - int(2 * header["side_margin"] * scale),
+        "channel_text": channel["text"],
+        "channel_font": channel["font"],
+        "channel_color": channel["color"],
+        "top_fontsize": top_fontsize,
+        "top_text_y": top_text_y,
+        "subtitle_font": subtitle["font"],
+        "subtitle_color": subtitle["color"],
+        "subtitle_stroke_color": subtitle["stroke_color"],
+        "subtitle_stroke_width": subtitle["stroke_width"],
+        "subtitle_fontsize": max(int(subtitle["fontsize"] * scale), subtitle.get("min_fontsize", 0)),
+        "subtitle_y": image_top + image_h + int(subtitle["offset"] * scale),
+    }
+
+
+class RenderPlan:
+    """
+    A compiled layout spec. Layouts are frozen mappings, memoized per
+    (profile, header text); the default header's layouts are computed up front.
+    """
+
+    __slots__ = ("spec", "key", "profiles", "header_text", "fonts", "_layouts", "_lock")
+
+    def __init__(self, spec):
+        fonts = tuple(sorted({spec[part]["font"] for part in ("header", "channel", "subtitle")}))
+        missing = [font for font in fonts if not os.path.exists(font)]
+        if missing:
+            print(f"⚠️ Layout fonts not found: {', '.join(missing)}")
+        init = super().__setattr__
+        init("spec", freeze(spec))
+        init("key", recipe_key(spec))
+        init("profiles", self.spec["profiles"])
+        init("header_text", spec["header"]["text"])
+        init("fonts", fonts)
+        init("_layouts", {})
+        init("_lock", threading.Lock())
+        for name in self.profiles:
+            self.layout(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RenderPlan is read-only; compile a new one from a changed spec")
+
+    def layout(self, profile_name, header_text=None):
+        """Frozen layout of one profile; header_text defaults to the spec's header."""
+        header_text = self.header_text if header_text is None else header_text
+        key = (profile_name, header_text)
+        layout = self._layouts.get(key)
+        if layout is None:
+            computed = compute_layout(self.spec, self.profiles[profile_name], header_text)
+            computed["plan"] = self.key
+            layout = freeze(computed)
+            with self._lock:
+                layout = self._layouts.setdefault(key, layout)
+        return layout
+
+    def groups(self, profile_names):
+        """
+        Group profiles that share a layout up to scale. Each group is composited
+        at its largest size and encoded by one ffmpeg process.
+        """
+        groups = {}
+        for name in profile_names:
+            profile = self.profiles[name]
+            width, height = profile["size"]
+            ratio = math.gcd(width, height)
+            groups.setdefault((width // ratio, height // ratio, profile["image_frac"]), []).append(name)
+        return [sorted(names, key=lambda n: -self.profiles[n]["size"][0]) for names in groups.values()]
+
+
+def compile_plan(spec):
+    return RenderPlan(spec)
+
+
+def get_plan(path=DEFAULT_LAYOUT):
+    """The compiled plan of a spec file, compiled once per process and file version."""
+    key = (os.path.abspath(path), os.stat(path).st_mtime_ns)
+    plan = _plans.get(key)
+    if plan is None:
+        compiled = compile_plan(load_spec(path))
+        with _plans_lock:
+            plan = _plans.setdefault(key, compiled)
+    return plan
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile a layout spec and print the layout of each profile")
+    parser.add_argument("--layout", default=DEFAULT_LAYOUT, help="Layout spec (JSON)")
+    parser.add_argument("--header", default=None, help="Header text (default: the spec's)")
+    parser.add_argument("--profiles", default=None, help="Comma-separated profiles (default: all)")
+    args = parser.parse_args()
+    plan = get_plan(args.layout)
+    names = [p.strip() for p in args.profiles.split(",")] if args.profiles else list(plan.profiles)
+    header = args.header.replace("\\n", "\n") if args.header is not None else None
+    for name in names:
+        print(f"{name}: {json.dumps(thaw(plan.layout(name, header)), ensure_ascii=False)}")
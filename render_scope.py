@@ -0,0 +1,60 @@
+"""
+Scoped lifetime for everything a render opens: moviepy clips (each backed by
+an ffmpeg reader process) and scratch files. Leaving the scope closes the
+clips and deletes the scratch directory, also when the render fails, so batch
+workers keep flat descriptor counts and /tmp usage.
+
+Scratch files go to THINKTOK_SCRATCH_DIR (default: the system temp dir), or to
+/dev/shm when a RAM-backed scratch directory is asked for and available.
+"""
+
+import os
+import shutil
+import tempfile
+
+SCRATCH_ROOT = os.getenv("THINKTOK_SCRATCH_DIR") or None
+RAM_SCRATCH_ROOT = "/dev/shm"
+# Upper bound for in-memory scene rasters and text overlays kept between frames and renders
+MEMORY_BUDGET_MB = int(os.getenv("THINKTOK_MEMORY_BUDGET_MB", "512"))
+
+
+def scratch_root(ram=False):
+    if ram and os.path.isdir(RAM_SCRATCH_ROOT) and os.access(RAM_SCRATCH_ROOT, os.W_OK):
+        return RAM_SCRATCH_ROOT
+    if ram:
+        print(f"⚠️ {RAM_SCRATCH_ROOT} is not available, using the disk for scratch files.")
+    return SCRATCH_ROOT
+
+
+class RenderScope:
+    def __init__(self, ram=False, prefix="thinktok_"):
+        self.dir = tempfile.mkdtemp(prefix=prefix, dir=scratch_root(ram))
+        self._clips = []
+        self._count = 0
+
+    def temp_path(self, suffix=""):
+        """A fresh path inside the scratch directory; removed when the scope closes."""
+        self._count += 1
+        return os.path.join(self.dir, f"{self._count:05d}{suffix}")
+
+    def clip(self, clip):
+        """Register a clip (or anything with close()) to be closed with the scope."""
+        self._clips.append(clip)
+        return clip
+
+    def close(self):
+        # Newest first: composites are closed before the clips they were built from
+        while self._clips:
+            clip = self._clips.pop()
+            try:
+                clip.close()
+            except Exception as e:
+                print(f"⚠️ Could not close {type(clip).__name__}: {e}")
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
@@ -0,0 +1,148 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+from moviepy.editor import TextClip
+from cache_utils import CACHE_DIR, file_digest
+from render_scope import MEMORY_BUDGET_MB
+
+# Scene images fitted to the image box on disk, one PNG per (image, box size).
+# Proxy renders load these tiny files instead of decoding and resampling 1024px sources.
+RASTER_CACHE_DIR = os.path.join(CACHE_DIR, "rasters")
+
+# Flattened scene frames, keyed by ("raster", image hash, layout size, header
+# text, render plan), and rendered static text overlays, keyed by ("overlay",
+# text, position, TextClip arguments). A scene is static for its whole duration,
+# so it is composited exactly once; overlays are shared by the renders of a
+# warm worker. Least recently used entries are dropped beyond the byte budget;
+# frames are drawn in time order, so a render only needs the current scenes.
+_raster_cache = OrderedDict()
+_raster_budget = [MEMORY_BUDGET_MB << 20]
+# Builds sharing a render plan may run in threads; the LRU order is guarded
+_raster_lock = threading.Lock()
+
+
+def set_raster_budget(nbytes):
+    """Set the cache's byte budget; returns the previous one so a render can restore it."""
+    with _raster_lock:
+        previous, _raster_budget[0] = _raster_budget[0], nbytes
+        _evict()
+    return previous
+
+
+def _nbytes(entry):
+    return entry.nbytes if isinstance(entry, np.ndarray) else entry["rgb"].nbytes + entry["alpha"].nbytes
+
+
+def _evict():
+    total = sum(_nbytes(entry) for entry in _raster_cache.values())
+    # The newest entry always stays, whatever the budget
+    while len(_raster_cache) > 1 and total > _raster_budget[0]:
+        _, entry = _raster_cache.popitem(last=False)
+        total -= _nbytes(entry)
+
+
+def _cached(key):
+    with _raster_lock:
+        entry = _raster_cache.get(key)
+        if entry is not None:
+            _raster_cache.move_to_end(key)
+        return entry
+
+
+def _store(key, entry):
+    with _raster_lock:
+        _raster_cache[key] = entry
+        _raster_cache.move_to_end(key)
+        _evict()
+
+
+def load_scene_image(path, width, crop):
+    """
+    Scene image fitted to the layout's image box: resized to `width` and cut to
+    `width - 2 * crop` rows around its centre (a square source loses `crop` rows
+    top and bottom; a wider one is padded with black), flattened onto black
+    (the frame background) as an RGB uint8 array.
+    Cached on disk per source hash and size.
+    """
+    box_h = width - 2 * crop
+    cache_path = os.path.join(RASTER_CACHE_DIR, f"{file_digest(path)}_{width}x{box_h}.png")
+    if os.path.exists(cache_path):
+        with Image.open(cache_path) as cached:
+            return np.asarray(cached.convert("RGB"))
+
+    with Image.open(path) as im:
+        im = im.convert("RGBA")
+        height = max(1, round(im.height * width / im.width))
+        im = im.resize((width, height), Image.LANCZOS)
+        rgba = np.asarray(im, dtype=np.float32)
+    rgb = (rgba[..., :3] * (rgba[..., 3:] / 255.0)).astype(np.uint8)
+    if height >= box_h:
+        top = (height - box_h) // 2
+        rgb = rgb[top:top + box_h]
+    else:
+        boxed = np.zeros((box_h, width, 3), dtype=np.uint8)
+        top = (box_h - height) // 2
+        boxed[top:top + height] = rgb
+        rgb = boxed
+
+    os.makedirs(RASTER_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    Image.fromarray(rgb).save(tmp_path, format="PNG", compress_level=1)
+    os.replace(tmp_path, cache_path)
+    return rgb
+
+
+def text_overlay(text, x, y, **textclip_kwargs):
+    """
+    Render a TextClip once and keep its pixels and mask for blitting.
+    x may be "center" (resolved against the frame width at blit time).
+    Overlays stay in the bounded scene cache, so the parts of a series
+    rendered by one warm worker share the static header and channel text.
+    """
+    key = ("overlay", text, x, y, tuple(sorted(textclip_kwargs.items())))
+    overlay = _cached(key)
+    if overlay is None:
+        clip = TextClip(text, **textclip_kwargs)
+        rgb = clip.get_frame(0).astype(np.float32)
+        alpha = clip.mask.get_frame(0).astype(np.float32) if clip.mask is not None else np.ones(rgb.shape[:2], np.float32)
+        overlay = {"rgb": rgb, "alpha": alpha, "x": x, "y": y}
+        _store(key, overlay)
+    return overlay
+
+
+def blit(canvas, overlay):
+    """Alpha-blend an overlay onto a float canvas in place, clipping at the frame edges."""
+    frame_h, frame_w = canvas.shape[:2]
+    h, w = overlay["alpha"].shape
+    x = int((frame_w - w) / 2) if overlay["x"] == "center" else int(overlay["x"])
+    y = int(overlay["y"])
+    x1, y1 = max(x, 0), max(y, 0)
+    x2, y2 = min(x + w, frame_w), min(y + h, frame_h)
+    if x1 >= x2 or y1 >= y2:
+        return canvas
+    rgb = overlay["rgb"][y1 - y:y2 - y, x1 - x:x2 - x]
+    alpha = overlay["alpha"][y1 - y:y2 - y, x1 - x:x2 - x, None]
+    region = canvas[y1:y2, x1:x2]
+    canvas[y1:y2, x1:x2] = rgb * alpha + region * (1 - alpha)
+    return canvas
+
+
+def render_scene_raster(image_path, layout, overlays=()):
+    """
+    Full frame for one scene: black background, the cropped image in the
+    layout's image box and the static text overlays on top.
+    """
+    key = ("raster", file_digest(image_path), layout["size"], layout["header_text"], layout["plan"])
+    raster = _cached(key)
+    if raster is None:
+        width, height = layout["size"]
+        x, y, image_w, image_h = layout["image_box"]
+        canvas = np.zeros((height, width, 3), dtype=np.float32)
+        canvas[y:y + image_h, x:x + image_w] = load_scene_image(image_path, image_w, layout["image_crop"])
+        for overlay in overlays:
+            blit(canvas, overlay)
+        raster = canvas.astype(np.uint8)
+        _store(key, raster)
+    return raster
@@ -0,0 +1,152 @@
+"""
+Series mode: renders the parts of a multi-part script (korea_part1/2/3,
+bond + bond_part2, ...) in parallel on warm batch workers, then joins them
+into one full-length compilation by stream copy, without a second encode.
+
+The workers load the SFX bank, fonts and TTS client once and keep the
+rendered header/channel overlays. Every part reads and fills the same
+on-disk caches (rasters, loudness, beats, image hashes), so shared assets
+are prepared once for the whole series.
+
+Usage:
+    python series.py korea [--workers 3] [--db batch.sqlite] [--force] [--output video/korea_full.mp4]
+        [-- <generate.py options, e.g. --skip-tts --encoding preview>]
+    python series.py scripts/bond.txt scripts/bond_part2.txt --name bond -- --skip-tts
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+from batch_render import DEFAULT_DB, JobQueue, run_batch
+
+SCRIPTS_DIR = "scripts"
+VIDEO_DIR = "video"
+_PART_RE = re.compile(r"^(?P<name>.+?)(?:_part(?P<number>\d+))?$")
+
+
+def split_part(script_path):
+    """("korea", 2) for scripts/korea_part2.txt, ("bond", 1) for scripts/bond.txt."""
+    stem = os.path.splitext(os.path.basename(script_path))[0]
+    match = _PART_RE.match(stem)
+    return match.group("name"), int(match.group("number") or 1)
+
+
+def series_parts(name, scripts_dir=SCRIPTS_DIR):
+    """
+    Scripts of a series in part order: <name>_part<N>.txt, with a bare <name>.txt
+    as part 1 unless there is an explicit <name>_part1.txt (korea.txt is its own reel).
+    """
+    parts = {}
+    for filename in sorted(os.listdir(scripts_dir)):
+        if not filename.endswith(".txt"):
+            continue
+        path = os.path.join(scripts_dir, filename)
+        part_name, number = split_part(path)
+        if part_name == name and (number not in parts or "_part" in filename):
+            parts[number] = path
+    return [parts[number] for number in sorted(parts)]
+
+
+def stream_signature(path):
+    """Codec, size and sample-rate parts of ffmpeg's stream description; parts must match to be joined."""
+    from audio_stream import ffmpeg_binary
+    proc = subprocess.run([ffmpeg_binary(), "-hide_banner", "-i", path], capture_output=True)
+    signature = []
+    for line in proc.stderr.decode(errors="replace").splitlines():
+        match = re.search(r"Stream #\S+: (Video|Audio): (\w+)", line)
+        if match:
+            detail = re.search(r"\d{2,5}x\d{2,5}|\d+ Hz", line)
+            signature.append((match.group(1), match.group(2), detail.group(0) if detail else None))
+    return signature
+
+
+def compile_series(videos, output_path):
+    """Concatenate rendered parts with the concat demuxer and -c copy: no decoding, no encoding."""
+    from audio_stream import ffmpeg_binary
+    signatures = {video: stream_signature(video) for video in videos}
+    reference = signatures[videos[0]]
+    mismatched = [video for video, signature in signatures.items() if signature != reference]
+    if mismatched:
+        raise ValueError(
+            f"Parts were encoded differently and cannot be stream-copied: {', '.join(mismatched)} "
+            "(render every part with the same generate.py options)"
+        )
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", suffix=".ffconcat", delete=False, encoding="utf-8") as f:
+        f.write("ffconcat version 1.0\n")
+        for video in videos:
+            escaped = os.path.abspath(video).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+        list_path = f.name
+    try:
+        cmd = [
+            ffmpeg_binary(), "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path,
+            "-map", "0", "-c", "copy", "-movflags", "+faststart", output_path,
+        ]
+        proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if proc.returncode != 0:
+            raise IOError(f"ffmpeg could not join the parts:\n{proc.stderr.decode(errors='replace')}")
+    finally:
+        os.remove(list_path)
+    return output_path
+
+
+def run_series(scripts, name, generate_argv=(), workers=None, timeout=900, db=DEFAULT_DB, force=False, output_path=None):
+    """Render every part (skipping parts already rendered unless force) and compile them; returns the compilation path."""
+    queue = JobQueue(db)
+    queue.recover()
+    for script in scripts:
+        queue.enqueue(script, ["--script", script, *generate_argv], force=force)
+    print(f"📚 Series {name}: {len(scripts)} part(s)")
+    run_batch(queue, workers or min(len(scripts), max(1, (os.cpu_count() or 2) // 2)), timeout)
+
+    results = queue.results(scripts)
+    missing = [script for script in scripts if results.get(script, (None, None))[0] != "done" or not results[script][1]]
+    if missing:
+        raise RuntimeError(f"Parts not rendered, compilation skipped: {', '.join(missing)}")
+    videos = [results[script][1] for script in scripts]
+
+    output_path = output_path or os.path.join(VIDEO_DIR, f"{name}_full.mp4")
+    print(f"🔗 Joining {len(videos)} parts → {output_path}")
+    compile_series(videos, output_path)
+    print(f"✅ Series compilation saved to {output_path}")
+    return output_path
+
+
+def main():
+    argv = sys.argv[1:]
+    # Everything after "--" is passed to generate.py for every part
+    generate_argv = []
+    if "--" in argv:
+        split = argv.index("--")
+        argv, generate_argv = argv[:split], argv[split + 1:]
+
+    parser = argparse.ArgumentParser(description="Render a multi-part series and join it into one compilation")
+    parser.add_argument("parts", nargs="+", help="A series name (parts found in scripts/) or the part scripts in order")
+    parser.add_argument("--name", default=None, help="Series name for the compilation (default: from the scripts)")
+    parser.add_argument("--output", default=None, help="Compilation path (default video/<name>_full.mp4)")
+    parser.add_argument("--db", default=DEFAULT_DB, help="SQLite job database")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per part, up to half the CPUs)")
+    parser.add_argument("--timeout", type=float, default=900, help="Seconds before a part is killed")
+    parser.add_argument("--force", action="store_true", help="Re-render parts that already rendered")
+    args = parser.parse_args(argv)
+
+    if len(args.parts) == 1 and not os.path.isfile(args.parts[0]):
+        name = args.name or args.parts[0]
+        scripts = series_parts(args.parts[0])
+        if not scripts:
+            parser.error(f"no scripts for series {args.parts[0]!r} in {SCRIPTS_DIR}/")
+    else:
+        scripts = args.parts
+        name = args.name or split_part(scripts[0])[0]
+    if any(opt in generate_argv for opt in ("--stream-to", "--dry-run")):
+        parser.error("--stream-to and --dry-run are per-reel options, not for series renders")
+    run_series(scripts, name, generate_argv, args.workers, args.timeout, args.db, args.force, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
-import os
-from moviepy.editor import AudioFileClip
 import argparse
+import profiler
+from narration import open_narration
+from timeline import line_cues, read_script, write_srt
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -10,39 +11,17 @@ Usage examples:
 """
 
 def generate_subtitles(script_path, audio_dir="audio", output_path="subtitles/output.srt"):
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-    with open(script_path, "r", encoding="utf-8") as f:
-        lines = [line.strip() for line in f.readlines() if line.strip()]
-    if lines and lines[0].startswith("#"):
-        lines = lines[1:]  # Skip title line
-
-    srt_entries = []
-    current_time = 0.0
-
-    def format_time(t):
-        h = int(t // 3600)
-        m = int((t % 3600) // 60)
-        s = int(t % 60)
-        ms = int((t - int(t)) * 1000)
-        return f"{h:02}:{m:02}:{s:02},{ms:03}"
+    # Title line is skipped; timing is kept in whole milliseconds (see timeline.py)
+    _, lines = read_script(script_path)
 
+    # Durations come from the packed PCM index, or are probed from each MP3's header
+    narration = open_narration(audio_dir)
+    durations = []
     for idx, line in enumerate(lines, start=1):
-        line = line.replace("\n", "\n")  # Ensure line breaks are respected directly
-
-        audio_file = os.path.join(audio_dir, f"line_{idx:02}.mp3")
-        audio = AudioFileClip(audio_file)
-        duration_sec = audio.duration
-
-        start_time = current_time
-        end_time = current_time + duration_sec
-        current_time = end_time
-
-        srt_entry = f"{idx}\n{format_time(start_time)} --> {format_time(end_time)}\n{line}\n"
-        srt_entries.append(srt_entry)
+        with profiler.span("subtitles.probe", line=idx):
+            durations.append(narration.duration_ms(idx))
 
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write("\n".join(srt_entries))
+    write_srt(line_cues(lines, durations), output_path)
 
     print(f"✅ Subtitles written to {output_path}")
 
@@ -50,7 +29,7 @@ def generate_subtitles(script_path, audio_dir="audio", output_path="subtitles/ou
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate SRT subtitles from script and audio files")
     parser.add_argument("--script", default="scripts/hotel_economics.txt", help="Path to the script file")
-    parser.add_argument("--audio-dir", default="audio", help="Directory containing mp3 files")
+    parser.add_argument("--audio-dir", default="audio", help="Directory with the narration (line_NN.mp3 or narration.wav)")
     parser.add_argument("--output-path", default="subtitles/hotel_economics.srt", help="Path to save the SRT file")
     args = parser.parse_args()
     generate_subtitles(args.script, audio_dir=args.audio_dir, output_path=args.output_path)
\ No newline at end of file
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Read by cache_utils on import: keep test runs out of the working tree's .cache
+os.environ.setdefault("THINKTOK_CACHE_DIR", tempfile.mkdtemp(prefix="thinktok_test_cache_"))
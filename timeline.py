@@ -0,0 +1,338 @@
+"""
+Render-free timeline: scene groups, SFX offsets and subtitle cues worked out
+from probed durations (container headers or the packed PCM narration index,
+nothing is decoded) and the scene images, the same way build_video lays them out. All times are integer
+milliseconds so cumulative sums do not drift.
+
+Usage:
+    python timeline.py --script scripts/test.txt [--audio-dir audio/test] [--image-dir images/test]
+        [--budget 59] [--srt subtitles/test.dryrun.srt] [--beat-sync] [--mood angry] [--placeholders]
+"""
+
+import argparse
+import os
+import re
+import subprocess
+from cache_utils import JsonCache, file_digest, recipe_key, seeded_choice
+from placeholders import line_image
+from narration import open_narration
+
+BUDGET_SEC = 59.0
+INTRO_SFX = "sound_effect/intro.mp3"
+TRANSITION_SFX = [
+    "sound_effect/trans_1.mp3",
+    "sound_effect/trans_2.mp3",
+    "sound_effect/trans_3.mp3",
+    "sound_effect/trans_4.mp3",
+    "sound_effect/trans_5.mp3"
+]
+# Cues further apart than this count as a timing disagreement
+AGREEMENT_TOLERANCE_MS = 1
+
+_durations = JsonCache("durations")
+_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+
+
+def probe_duration_ms(path):
+    """Duration from the container header, as ffmpeg (and moviepy's AudioFileClip) reports it."""
+    key = file_digest(path)
+    cached = _durations.get(key)
+    if cached is None:
+        from audio_stream import ffmpeg_binary
+        # Without an output ffmpeg only prints the input header and exits
+        proc = subprocess.run([ffmpeg_binary(), "-hide_banner", "-i", path], capture_output=True)
+        match = _DURATION_RE.search(proc.stderr.decode(errors="replace"))
+        if not match:
+            raise ValueError(f"Could not read the duration of {path}")
+        h, m, s = match.groups()
+        cached = round((int(h) * 3600 + int(m) * 60 + float(s)) * 1000)
+        _durations.set(key, cached)
+    return cached
+
+
+def script_seed(lines):
+    """
+    Seed of a script's music, transition SFX and random transitions: its lines.
+    Re-renders of the same script (placeholder passes, series parts, batch
+    retries) pick the same assets, and build_video and the dry run agree.
+    """
+    return recipe_key(lines)
+
+
+def choose_music(mood, seed):
+    from bgm import choose_music as choose_track
+    return choose_track(mood, seed)
+
+
+def choose_transition_sfx(seed, scene_index):
+    """SFX played on the cut after scene scene_index (1-based), or None without an SFX bank."""
+    return seeded_choice(seed, f"transition:{scene_index}", [p for p in TRANSITION_SFX if os.path.exists(p)])
+
+
+def srt_time(ms):
+    h, rest = divmod(int(ms), 3600000)
+    m, rest = divmod(rest, 60000)
+    s, ms = divmod(rest, 1000)
+    return f"{h:02}:{m:02}:{s:02},{ms:03}"
+
+
+def read_script(script_path):
+    """(header, lines) of a script; the header is the optional first '#' line."""
+    with open(script_path, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f.readlines() if line.strip()]
+    header = None
+    if lines and lines[0].startswith("#"):
+        header = lines[0][1:].strip().replace("\\n", "\n")
+        lines = lines[1:]
+    return header, lines
+
+
+def line_cues(lines, durations_ms):
+    """One cue per script line, back to back (how subtitle_generator times the SRT)."""
+    cues = []
+    t = 0
+    for idx, (text, duration) in enumerate(zip(lines, durations_ms), start=1):
+        cues.append({"index": idx, "start": t, "end": t + duration, "text": text})
+        t += duration
+    return cues
+
+
+def scene_cues(scenes, durations_ms, lines):
+    """
+    One cue per line of each scene ({"lines", "start", "duration"} in ms). A
+    scene's time, including any hold to a beat, is split in proportion to its
+    lines' narration and the last cue ends on the cut, so cues never cross cuts.
+    """
+    cues = []
+    for scene in scenes:
+        narration = sum(durations_ms[idx] for idx in scene["lines"])
+        cut = scene["start"] + scene["duration"]
+        cue_start = scene["start"]
+        for idx in scene["lines"]:
+            end = cue_start + round(durations_ms[idx] * scene["duration"] / narration) if narration else cut
+            if idx == scene["lines"][-1]:
+                end = cut
+            cues.append({"index": idx, "start": cue_start, "end": end, "text": lines[idx - 1]})
+            cue_start = end
+    return cues
+
+
+def write_srt(cues, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    entries = [f"{i}\n{srt_time(c['start'])} --> {srt_time(c['end'])}\n{c['text']}\n" for i, c in enumerate(cues, start=1)]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(entries))
+
+
+def read_srt_ms(path):
+    """Cues of an SRT file with times in milliseconds."""
+    import srt
+    with open(path, "r", encoding="utf-8") as f:
+        subs = list(srt.parse(f.read()))
+    return [{"index": s.index, "start": round(s.start.total_seconds() * 1000),
+             "end": round(s.end.total_seconds() * 1000), "text": s.content} for s in subs]
+
+
+def group_scenes(lines, image_dir, narration, placeholders=False, scene_threshold=None, card=None):
+    """
+    Lines grouped into scenes as the reel shows them (build_video and the dry
+    run both use this). A line without its own image reuses the closest earlier
+    line's image, or with placeholders gets a scene card: card(idx, text) makes
+    it, and without card (the dry run) the scene has no image. Consecutive lines
+    whose image is within scene_threshold bits of the scene's first image by
+    perceptual hash share a scene; a scene card is always a scene of its own.
+
+    Returns (scenes, skipped): scenes are {"index", "lines", "image", "placeholder"}
+    with the image of the scene's last line, skipped are {"line", "missing"}.
+    """
+    from image_hash import DEFAULT_THRESHOLD, same_scene
+    if scene_threshold is None:
+        scene_threshold = DEFAULT_THRESHOLD
+    scenes, skipped = [], []
+    scene_image = None
+    for idx, text in enumerate(lines, start=1):
+        img_file = line_image(image_dir, idx)
+        is_placeholder = placeholders and img_file is None
+        if not placeholders:
+            for fallback_idx in reversed(range(1, idx)):
+                if img_file:
+                    break
+                img_file = line_image(image_dir, fallback_idx)
+        missing = []
+        if img_file is None and not is_placeholder:
+            missing.append("image")
+        if not narration.has(idx):
+            missing.append("audio")
+        if missing:
+            skipped.append({"line": idx, "missing": missing})
+            continue
+        if is_placeholder and card is not None:
+            img_file = card(idx, text)
+
+        new_scene = not scenes or is_placeholder or scenes[-1]["placeholder"]
+        if not new_scene:
+            new_scene = not same_scene(scene_image, img_file, scene_threshold)
+        if new_scene:
+            scenes.append({"index": len(scenes) + 1, "lines": [], "image": img_file, "placeholder": is_placeholder})
+            scene_image = img_file
+        scenes[-1]["lines"].append(idx)
+        scenes[-1]["image"] = img_file
+    return scenes, skipped
+
+
+def plan_timeline(script_path, audio_dir, image_dir, placeholders=False, scene_threshold=None,
+                  beat_sync=False, mood="angry", music=True):
+    """
+    Scene groups, SFX offsets and subtitle cues of the reel build_video would
+    render from these inputs, without decoding audio or compositing frames.
+    """
+    _, lines = read_script(script_path)
+    seed = script_seed(lines)
+
+    music_path = choose_music(mood, seed) if music else None
+    beats = []
+    if beat_sync and music_path:
+        # Cached beat grid of the track (analysed once per file)
+        from beat_detector import analyze_music, timeline_beats
+        beats = [round(b * 1000) for b in timeline_beats(analyze_music(music_path), 600)]
+
+    def snap(t, forward):
+        if not beats:
+            return t
+        from beat_detector import BEAT_SNAP_MAX_SEC
+        max_shift = round(BEAT_SNAP_MAX_SEC * 1000)
+        candidates = [b for b in beats if (0 <= b - t <= max_shift if forward else abs(b - t) <= max_shift)]
+        return min(candidates, key=lambda b: abs(b - t)) if candidates else t
+
+    audio = open_narration(audio_dir)
+    scenes, skipped = group_scenes(lines, image_dir, audio, placeholders, scene_threshold)
+    durations = {idx: audio.duration_ms(idx) for scene in scenes for idx in scene["lines"]}
+
+    # Scene cuts: narration end, held to the next beat except after the last scene
+    sfx = []
+    if scenes and os.path.exists(INTRO_SFX):
+        sfx.append({"kind": "intro", "at": 0})
+    t = 0
+    for i, scene in enumerate(scenes):
+        cut = t + sum(durations[idx] for idx in scene["lines"])
+        if i < len(scenes) - 1:
+            cut = snap(cut, forward=True)
+        scene["start"], scene["duration"] = t, cut - t
+        trans_sfx = choose_transition_sfx(seed, scene["index"]) if i < len(scenes) - 1 else None
+        if trans_sfx:
+            # build_video also pulls each SFX forward by its leading silence
+            sfx.append({"kind": "transition", "at": snap(cut, forward=False), "path": trans_sfx})
+        t = cut
+
+    return {
+        "lines": lines,
+        "durations": durations,
+        "scenes": scenes,
+        "sfx": sfx,
+        # The same split build_video writes into the SRT
+        "cues": scene_cues(scenes, durations, lines),
+        "skipped": skipped,
+        "music": music_path,
+        "total": t,
+    }
+
+
+def check_agreement(timeline, srt_path=None):
+    """
+    Differences between the line-by-line subtitle timing (subtitle_generator,
+    or the SRT it wrote to srt_path) and the cues of the planned scenes.
+    """
+    lines, durations = timeline["lines"], timeline["durations"]
+    if srt_path and os.path.exists(srt_path):
+        reference = read_srt_ms(srt_path)
+        source = srt_path
+    else:
+        # Lines build_video skips still get a cue from subtitle_generator
+        all_durations = [durations.get(idx, 0) for idx in range(1, len(lines) + 1)]
+        reference = line_cues(lines, all_durations)
+        source = "subtitle_generator"
+    by_text = {}
+    for cue in reference:
+        by_text.setdefault(cue["text"].replace("\\n", "\n"), []).append(cue)
+    problems = []
+    for cue in timeline["cues"]:
+        matches = by_text.get(cue["text"].replace("\\n", "\n"))
+        if not matches:
+            problems.append(f"line {cue['index']}: no cue in {source}")
+            continue
+        ref = matches.pop(0)
+        drift = max(abs(ref["start"] - cue["start"]), abs(ref["end"] - cue["end"]))
+        if drift > AGREEMENT_TOLERANCE_MS:
+            problems.append(f"line {cue['index']}: {source} has {srt_time(ref['start'])} --> {srt_time(ref['end'])}, "
+                            f"build_video {srt_time(cue['start'])} --> {srt_time(cue['end'])} ({drift} ms)")
+    return problems
+
+
+def print_timeline(timeline, budget_sec=BUDGET_SEC):
+    """Print the plan; returns the overrun in milliseconds (0 when within budget)."""
+    for skip in timeline["skipped"]:
+        print(f"⚠️ Line {skip['line']} would be skipped: missing {', '.join(skip['missing'])}")
+    print(f"🎬 {len(timeline['scenes'])} scene(s) from {len(timeline['durations'])} line(s)")
+    for scene in timeline["scenes"]:
+        image = "placeholder card" if scene["placeholder"] else os.path.basename(scene["image"])
+        lines = ", ".join(str(idx) for idx in scene["lines"])
+        print(f"   #{scene['index']:02} {srt_time(scene['start'])}  {scene['duration'] / 1000:6.2f}s  lines {lines}  ({image})")
+    for effect in timeline["sfx"]:
+        source = f" ({os.path.basename(effect['path'])})" if effect.get("path") else ""
+        print(f"   🔊 {effect['kind']} SFX at {srt_time(effect['at'])}{source}")
+    if timeline["music"]:
+        print(f"   🎵 {timeline['music']}")
+
+    budget_ms = round(budget_sec * 1000)
+    overrun = max(0, timeline["total"] - budget_ms)
+    if overrun:
+        print(f"❌ Total {timeline['total'] / 1000:.3f}s is {overrun / 1000:.3f}s over the {budget_sec:g}s budget")
+        # Which lines to cut or tighten: the ones that end past the budget
+        late = [cue["index"] for cue in timeline["cues"] if cue["end"] > budget_ms]
+        print(f"   Lines ending past {budget_sec:g}s: {', '.join(str(idx) for idx in late)}")
+    else:
+        print(f"✅ Total {timeline['total'] / 1000:.3f}s, {(budget_ms - timeline['total']) / 1000:.3f}s under the {budget_sec:g}s budget")
+    return overrun
+
+
+def dry_run(script_path, audio_dir, image_dir, srt_path, budget_sec=BUDGET_SEC, subtitle_path=None, **plan_kwargs):
+    """Plan, report and write the planned SRT; returns (timeline, overrun_ms, agreement problems)."""
+    timeline = plan_timeline(script_path, audio_dir, image_dir, **plan_kwargs)
+    overrun = print_timeline(timeline, budget_sec)
+    write_srt(timeline["cues"], srt_path)
+    print(f"✅ Planned subtitles written to {srt_path}")
+    problems = check_agreement(timeline, subtitle_path)
+    if problems:
+        print(f"⚠️ Subtitle and scene timing disagree on {len(problems)} cue(s):")
+        for problem in problems:
+            print(f"   - {problem}")
+    else:
+        print("✅ Subtitle timing matches the scene timeline")
+    return timeline, overrun, problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plan a reel's timeline without rendering it")
+    parser.add_argument("--script", required=True, help="Path to the script text file")
+    parser.add_argument("--audio-dir", default=None, help="Narration directory (default audio/<name>)")
+    parser.add_argument("--image-dir", default=None, help="Image directory (default images/<name>)")
+    parser.add_argument("--srt", default=None, help="Where to write the planned SRT (default subtitles/<name>.dryrun.srt)")
+    parser.add_argument("--budget", type=float, default=BUDGET_SEC, help="Maximum reel length in seconds")
+    parser.add_argument("--beat-sync", action="store_true", help="Hold scene cuts to the next music beat")
+    parser.add_argument("--mood", choices=["happy", "angry"], default="angry", help="Background music mood")
+    parser.add_argument("--placeholders", action="store_true", help="Lines without their own image get a scene card")
+    args = parser.parse_args()
+
+    name = os.path.splitext(os.path.basename(args.script))[0]
+    _, overrun, _ = dry_run(
+        args.script,
+        args.audio_dir or os.path.join("audio", name),
+        args.image_dir or os.path.join("images", name),
+        args.srt or os.path.join("subtitles", f"{name}.dryrun.srt"),
+        budget_sec=args.budget,
+        subtitle_path=os.path.join("subtitles", f"{name}.srt"),
+        placeholders=args.placeholders,
+        beat_sync=args.beat_sync,
+        mood=args.mood,
+    )
+    raise SystemExit(1 if overrun else 0)
@@ -0,0 +1,84 @@
+import numpy as np
+from moviepy.editor import VideoClip
+from cache_utils import seeded_choice
+
+# Visual transitions between scene groups. Only the short overlap window around
+# each cut is rendered frame by frame, as a NumPy blend of the two cached scene
+# rasters; the rest of both scenes stays on the static raster path.
+TRANSITIONS = ("crossfade", "slide", "zoom")
+TRANSITION_SEC = 0.4
+ZOOM_AMOUNT = 0.15           # outgoing image grows by this much while fading out
+
+
+def plan_transitions(scenes, kind, duration=TRANSITION_SEC, seed=""):
+    """
+    One transition per cut, centred on it. The window is shortened so it never
+    takes more than half of either neighbouring scene. kind="random" picks per cut,
+    the same way for the same seed; the plan is made once and shared by every
+    output layout.
+    """
+    if kind in (None, "cut"):
+        return []
+    plan = []
+    for i in range(1, len(scenes)):
+        d = min(duration, scenes[i - 1]["duration"], scenes[i]["duration"])
+        if d <= 0:
+            continue
+        plan.append({
+            "index": i,
+            "start": scenes[i]["start"] - d / 2,
+            "duration": d,
+            "kind": seeded_choice(seed, f"visual:{i}", TRANSITIONS) if kind == "random" else kind,
+        })
+    return plan
+
+
+def _ease(p):
+    return p * p * (3 - 2 * p)
+
+
+def _zoom(region, factor):
+    """Centre crop by `factor` and scale back up with nearest-neighbour index arrays."""
+    h, w = region.shape[:2]
+    ys = (np.arange(h) / factor + (h - h / factor) / 2).astype(int)
+    xs = (np.arange(w) / factor + (w - w / factor) / 2).astype(int)
+    return region[ys[:, None], xs[None, :]]
+
+
+def blend_rasters(kind, a, b, box, progress):
+    """
+    Transition frame between rasters a and b at progress 0..1. Only the image box
+    is blended: the header and background are identical in every scene raster.
+    """
+    p = _ease(min(max(progress, 0.0), 1.0))
+    frame = (a if p < 0.5 else b).copy()
+    x, y, w, h = box
+    region_a = a[y:y + h, x:x + w].astype(np.float32)
+    region_b = b[y:y + h, x:x + w].astype(np.float32)
+    if kind == "slide":
+        # b pushes a out to the left
+        shift = int(round(w * p))
+        region = np.concatenate([region_a[:, shift:], region_b[:, :shift]], axis=1)
+    elif kind == "zoom":
+        zoomed = _zoom(region_a, 1 + ZOOM_AMOUNT * p)
+        region = zoomed + (region_b - zoomed) * p
+    else:  # crossfade
+        region = region_a + (region_b - region_a) * p
+    frame[y:y + h, x:x + w] = region.astype(np.uint8)
+    return frame
+
+
+def transition_clip(transition, raster_a, raster_b, box):
+    """
+    A moviepy clip covering the transition window, drawn from the two rasters.
+    raster_a and raster_b are callables, so the rasters are only fetched while
+    the window is being drawn.
+    """
+    d = transition["duration"]
+    clip = VideoClip(lambda t: blend_rasters(transition["kind"], raster_a(), raster_b(), box, t / d), duration=d)
+    return clip.set_start(transition["start"])
+
+
+def transition_windows(plan):
+    """Windows in which every frame differs (for the frame schedule)."""
+    return [(tr["start"], tr["start"] + tr["duration"]) for tr in plan]
@@ -1,14 +1,41 @@
+import contextlib
 import os
-from google.cloud import texttospeech
 import argparse
+import time
+import config
+from metering import meter
+from narration import DEFAULT_FORMAT, PCM_SAMPLE_RATE, NarrationWriter, line_mp3_path, remove_packed
+from timeline import probe_duration_ms
 from dotenv import load_dotenv
-from mutagen.mp3 import MP3
 load_dotenv()
 
-def generate_tts_for_script(script_path, output_dir="audio", speaking_rate=1.2, pitch=0.0, mood="happy"):
+_client = None
+
+def texttospeech_module():
+    """google.cloud.texttospeech, or the local stand-in when THINKTOK_SERVICES=fake."""
+    if config.SERVICES == "fake":
+        from fake_services import texttospeech
+    else:
+        from google.cloud import texttospeech
+    return texttospeech
+
+def get_tts_client():
+    """One TextToSpeech client per process; batch workers reuse it across scripts."""
+    global _client
+    if _client is None:
+        _client = texttospeech_module().TextToSpeechClient()
+    return _client
+
+def generate_tts_for_script(script_path, output_dir="audio", speaking_rate=1.2, pitch=0.0, mood="happy", audio_format=DEFAULT_FORMAT):
+    """
+    Synthesize every script line. audio_format "mp3" writes line_NN.mp3 files;
+    "pcm" asks for LINEAR16 and packs all lines into one narration.wav with an
+    index (see narration.py), so nothing is compressed before the final encode.
+    """
+    texttospeech = texttospeech_module()
     os.makedirs(output_dir, exist_ok=True)
 
-    client = texttospeech.TextToSpeechClient()
+    client = get_tts_client()
 
     if mood == "happy":
         voice_name = "ko-KR-Chirp3-HD-Achird"
@@ -22,50 +49,74 @@ def generate_tts_for_script(script_path, output_dir="audio", speaking_rate=1.2,
     if lines and lines[0].startswith("#"):
         lines = lines[1:]  # Skip the first line if it's a title
 
-    for idx, line in enumerate(lines, start=1):
-        line = line.replace("\\n", " ").replace("\n", " ")  # remove both literal and actual line breaks for TTS
-        print(f"🎤 Generating TTS for line {idx}: {line[:30]}...")
-
-        synthesis_input = texttospeech.SynthesisInput(text=line)
+    if audio_format == "pcm":
+        # The writer commits narration.wav and its index only if every line was synthesized
+        writer = NarrationWriter(output_dir)
+        audio_config_kwargs = dict(audio_encoding=texttospeech.AudioEncoding.LINEAR16, sample_rate_hertz=PCM_SAMPLE_RATE)
+    else:
+        # Packed narration would shadow the new MP3s
+        remove_packed(output_dir)
+        writer = None
+        audio_config_kwargs = dict(audio_encoding=texttospeech.AudioEncoding.MP3)
 
-        voice = texttospeech.VoiceSelectionParams(
-            language_code="ko-KR",
-            name=voice_name,
-            ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL
-        )
+    with writer or contextlib.nullcontext():
+        for idx, line in enumerate(lines, start=1):
+            line = line.replace("\\n", " ").replace("\n", " ")  # remove both literal and actual line breaks for TTS
+            print(f"🎤 Generating TTS for line {idx}: {line[:30]}...")
 
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3,
-            speaking_rate=speaking_rate,
-            pitch=pitch
-        )
+            synthesis_input = texttospeech.SynthesisInput(text=line)
 
-        response = client.synthesize_speech(
-            input=synthesis_input, voice=voice, audio_config=audio_config
-        )
+            voice = texttospeech.VoiceSelectionParams(
+                language_code="ko-KR",
+                name=voice_name,
+                ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL
+            )
 
-        filename = f"line_{idx:02}.mp3"
-        filepath = os.path.join(output_dir, filename)
+            audio_config = texttospeech.AudioConfig(
+                speaking_rate=speaking_rate,
+                pitch=pitch,
+                **audio_config_kwargs
+            )
 
-        with open(filepath, "wb") as out:
-            out.write(response.audio_content)
+            for attempt in range(config.API_MAX_ATTEMPTS):
+                try:
+                    with meter.call("google_tts", attempt=attempt + 1, request_bytes=len(line.encode("utf-8")), characters=len(line)) as call:
+                        response = client.synthesize_speech(
+                            input=synthesis_input, voice=voice, audio_config=audio_config
+                        )
+                        call.response_bytes = len(response.audio_content)
+                    break
+                except Exception as e:
+                    if attempt == config.API_MAX_ATTEMPTS - 1:
+                        raise
+                    print(f"⚠️ TTS line {idx} attempt {attempt + 1} failed ({e}), retrying...")
+                    time.sleep(config.API_BACKOFF_SEC * 2 ** attempt)
 
-        audio = MP3(filepath)
-        print(f"📏 Duration of line {idx}: {audio.info.length:.2f} seconds")
+            if writer is not None:
+                duration = writer.add(idx, response.audio_content) / 1000
+            else:
+                filepath = line_mp3_path(output_dir, idx)
+                with open(filepath, "wb") as out:
+                    out.write(response.audio_content)
+                # Probed as every later stage probes it, and cached for them
+                duration = probe_duration_ms(filepath) / 1000
+            print(f"📏 Duration of line {idx}: {duration:.2f} seconds")
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Generate TTS mp3 files for a script")
+    parser = argparse.ArgumentParser(description="Generate TTS narration for a script")
     parser.add_argument("--script", default="scripts/hotel_economics.txt", help="Path to the script file")
-    parser.add_argument("--output-dir", default="audio", help="Directory to save mp3 files")
+    parser.add_argument("--output-dir", default="audio", help="Directory to save the narration in")
     parser.add_argument("--rate", type=float, default=1.2, help="Speaking rate, e.g. 1.1 for 10% faster")
     parser.add_argument("--pitch", type=float, default=0.0, help="Pitch offset for TTS voice (e.g. +2.0 or -2.0)")
     parser.add_argument("--mood", default="happy", help="Mood for voice selection, e.g. happy or angry")
+    parser.add_argument("--audio-format", choices=["mp3", "pcm"], default=DEFAULT_FORMAT, help="Per-line MP3s or one packed LINEAR16 WAV")
     args = parser.parse_args()
     generate_tts_for_script(
         args.script,
         output_dir=args.output_dir,
         mood=args.mood,
         speaking_rate=args.rate,
-        pitch=args.pitch
+        pitch=args.pitch,
+        audio_format=args.audio_format
     )
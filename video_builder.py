@@ -1,3 +1,10 @@
+"""
+Renders a reel from narration, scene images and subtitles with build_video.
+This module has no command line of its own: run it through generate.py (its
+usage header lists the rendering options, which map onto build_video's
+keyword arguments).
+"""
+
 def detect_leading_silence(sound, silence_threshold=-40.0, chunk_size=10):
     trim_ms = 0
     while trim_ms < len(sound):
@@ -5,18 +12,6 @@ def detect_leading_silence(sound, silence_threshold=-40.0, chunk_size=10):
             break
         trim_ms += chunk_size
     return trim_ms
-"""
-Usage:
-    python video_builder.py 
-        --script-path scripts/hotel_economics.txt 
-        --audio-dir audio/hotel_economics 
-        --image-dir images/hotel_economics 
-        --subtitle-path subtitles/hotel_economics.srt 
-        --output-path video/hotel_economics.mp4
-        [--mood happy|angry]
-        [--fast]
-        [--skip-tts]
-"""
 
 # Pillow 10 compatibility: add ANTIALIAS alias if missing
 from PIL import Image as PILImage
@@ -26,46 +21,47 @@ if not hasattr(PILImage, "ANTIALIAS"):
 import moviepy.config as mpc
 mpc.IMAGEMAGICK_BINARY = "convert"   # macOS에선 "magick" 대신 "convert"일 수 있음
 
-# --- Add import for hashing ---
-import hashlib
+import functools
 import os
-# import librosa  # disabled beat detection
-import argparse
-import random
 from datetime import timedelta
-from moviepy.editor import AudioFileClip, CompositeAudioClip, ImageClip, concatenate_videoclips, CompositeVideoClip, TextClip
-from moviepy.editor import VideoFileClip
+from moviepy.editor import AudioFileClip, CompositeAudioClip, CompositeVideoClip, TextClip
 from pydub import AudioSegment
-import noisereduce as nr
-import numpy as np
-import tempfile
+import time
 import srt
-from moviepy.video.VideoClip import ColorClip
+from moviepy.video.VideoClip import VideoClip
 import math
-from moviepy.video.fx.all import resize, fadein, fadeout, speedx
-from moviepy.video.fx.all import loop
-import textwrap
-
-VIDEO_WIDTH = 1080
-VIDEO_HEIGHT = 1920
-FOOTER_Y_FRAC = 0.89
-FOOTER_X_FRAC = 0.65  # fraction across from left for footer center position
-LOGO_X_FRAC = 0.2
-LOGO_Y_FRAC = 0.89
-
-# Header text box hyperparameters
-HEADER_TEXT       = "THINKTOK\n뇌 깨우기"
-HEADER_FONT_SIZE  = 100                     # font size for header text
-HEADER_X_FRAC     = 0.50       # horizontal center fraction for header text
-HEADER_Y_FRAC     = 0.07       # vertical fraction down from top for header text
-HEADER_MARGIN     = 50                      # horizontal margin from edges
-SUBTITLE_FONT_SIZE = 60       # consistent font size for all subtitles
-
-# Offsets for title and subtitle relative to image area
-IMAGE_SIZE = VIDEO_WIDTH  # since image resized to height=VIDEO_WIDTH
-IMAGE_TOP = (VIDEO_HEIGHT - IMAGE_SIZE) // 2
-TITLE_OFFSET = 20        # pixels above image for title
-SUBTITLE_OFFSET = 20     # pixels below image for subtitle
+from bisect import bisect_right
+from ffmpeg_writer import MultiOutputWriter, VfrWriter, encode_audio, mux_streams
+from cache_utils import CACHE_DIR, file_digest, publish, recipe_key
+from concurrent.futures import ThreadPoolExecutor
+from frame_schedule import frame_runs, subtitle_events
+from transitions import plan_transitions, transition_clip, transition_windows
+from encoding_profiles import DEFAULT_ENCODING, ENCODING_PROFILES, video_params
+from scene_raster import render_scene_raster, set_raster_budget, text_overlay
+from render_scope import RenderScope
+from render_plan import DEFAULT_LAYOUT, RenderPlan, get_plan, thaw
+from timeline import INTRO_SFX, TRANSITION_SFX, choose_music, choose_transition_sfx, group_scenes, scene_cues, script_seed
+from image_hash import DEFAULT_THRESHOLD
+from placeholders import placeholder_image
+from narration import open_narration
+import profiler
+from bgm import ENVELOPE_SOURCE_FPS, add_music_bed, ducking_curve
+from beat_detector import analyze_music, nearest_beat, next_beat, timeline_beats
+from loudness import AUDIO_FPS, TARGET_LUFS, SFX_RELATIVE_LU, measure_file, narration_loudness, normalize_mix, db_to_gain
+
+MAX_TIMELINE_SEC = 600   # beat grid horizon when snapping cuts to the music
+
+# Encoded audio and video-only streams, keyed by what went into them, so a
+# layout change keeps the audio and a re-mix keeps the video. Bump the version
+# when the compositor or mixer changes output for the same inputs.
+AUDIO_CACHE_DIR = os.path.join(CACHE_DIR, "audio")
+VIDEO_CACHE_DIR = os.path.join(CACHE_DIR, "video")
+AV_CACHE_VERSION = 2
+
+# cfr: composite every frame; dedup: composite each distinct frame once and repeat
+# it into the CFR stream (x264 still encodes every copy, only compositing is
+# saved); vfr: emit each distinct frame once with its duration
+FRAME_MODES = ("cfr", "dedup", "vfr")
 
 def get_top_left(center_x, center_y, width, height):
     """
@@ -76,358 +72,434 @@ def get_top_left(center_x, center_y, width, height):
     y = int(center_y - height / 2)
     return (x, y)
 
-def compute_image_hash(path):
-    with open(path, "rb") as f:
-        return hashlib.sha256(f.read()).hexdigest()
 
-def build_video(script_path, audio_dir, image_dir, subtitle_path, output_path, fast=False, mood="angry", skip_tts=False):
+@functools.lru_cache(maxsize=None)
+def load_sfx(path):
+    """Decoded SFX, kept for the life of the process (AudioSegments are immutable)."""
+    return AudioSegment.from_file(path)
+
+def preload_sfx():
+    """Decode and measure the whole SFX bank up front (used by warm batch workers)."""
+    for path in [INTRO_SFX, *TRANSITION_SFX]:
+        if os.path.exists(path):
+            load_sfx(path)
+            measure_file(path)
+
+def output_path_for(output_path, profile_name, primary):
+    """The first requested profile writes output_path; the others get a _<profile> suffix."""
+    if profile_name == primary:
+        return output_path
+    root, ext = os.path.splitext(output_path)
+    return f"{root}_{profile_name}{ext}"
+
+def static_overlays(layout):
+    """Header title and channel text, rendered once per layout and baked into every scene raster."""
+    overlays = [text_overlay(
+        layout["channel_text"], "center", layout["top_text_y"],
+        font=layout["channel_font"],
+        fontsize=layout["top_fontsize"],
+        color=layout["channel_color"],
+        method="caption",
+        size=(layout["size"][0], None)
+    )]
+    if layout["header_text"]:
+        overlays.append(text_overlay(
+            layout["header_text"], "center", layout["title_y"],
+            font=layout["header_font"],
+            fontsize=layout["title_fontsize"],
+            color=layout["header_color"],
+            method="caption",
+            size=(layout["title_width"], None)
+        ))
+    return overlays
+
+def subtitle_clips(subs, layout):
+    """Subtitle style from the layout (yellow text, thin black stroke by default), directly below the cropped image."""
+    clips = []
+    for sub in subs:
+        start = sub.start.total_seconds()
+        end = sub.end.total_seconds()
+        # Use explicit line breaks from script
+        wrapped = sub.content.replace("\\n", "\n")
+        txt_clip = (
+            TextClip(
+                wrapped,
+                font=layout["subtitle_font"],
+                fontsize=layout["subtitle_fontsize"],
+                bg_color='rgba(0,0,0,0.0)',  # transparent background
+                color=layout["subtitle_color"],
+                stroke_width=layout["subtitle_stroke_width"],
+                stroke_color=layout["subtitle_stroke_color"],
+                method='label'
+            )
+            .set_start(start)
+            .set_duration(end - start)
+            .set_position(('center', layout["subtitle_y"]))
+            .crossfadein(0.2)
+            .crossfadeout(0.2)
+        )
+        clips.append(txt_clip)
+    return clips
+
+def compose_layout(scenes, subs, layout, duration, transitions=()):
+    """
+    Static scene rasters concatenated, with transition windows and subtitles
+    as the only per-frame layers.
+    """
+    overlays = static_overlays(layout)
+    starts = [scene["start"] for scene in scenes]
+
+    def raster(index):
+        # Rasters come from the bounded cache, so only the current scenes stay in memory
+        return lambda: render_scene_raster(scenes[index]["image"], layout, overlays)
+
+    def scene_frame(t):
+        return raster(max(bisect_right(starts, t) - 1, 0))()
+
+    track = VideoClip(scene_frame, duration=duration)
+    transition_clips = [
+        transition_clip(tr, raster(tr["index"] - 1), raster(tr["index"]), layout["image_box"])
+        for tr in transitions
+    ]
+    # The scene track is the background clip, so frames are not blitted onto an extra canvas
+    return CompositeVideoClip(
+        [track, *transition_clips, *subtitle_clips(subs, layout)], size=layout["size"], use_bgclip=True
+    ).set_duration(duration)
+
+def sfx_gain_db(sfx_path, narration_lufs):
+    """
+    Gain that places an SFX SFX_RELATIVE_LU below the narration,
+    using the cached per-file loudness measurements.
+    """
+    sfx_lufs = measure_file(sfx_path)["integrated"]
+    if not math.isfinite(sfx_lufs):
+        return 0.0
+    return narration_lufs + SFX_RELATIVE_LU - sfx_lufs
+
+
+def build_video(script_path, audio_dir, image_dir, subtitle_path, output_path, fast=False, mood="angry", skip_tts=False, target_lufs=TARGET_LUFS, music=True, beat_sync=False, output_profiles=None, proxy=False, encoding=DEFAULT_ENCODING, frame_mode="dedup", transition="cut", placeholders=False, scene_threshold=DEFAULT_THRESHOLD, ram_scratch=False, memory_budget_mb=None, stream_sink=None, layout=DEFAULT_LAYOUT):
+    """
+    Render the reel. Every clip and scratch file of the render belongs to one
+    RenderScope and is released when it returns or fails. With stream_sink the
+    main output is written as fragmented MP4 and each finished fragment is
+    passed to stream_sink(bytes) while encoding continues. layout is a layout
+    spec path or a compiled RenderPlan, shared read-only between renders.
+    """
+    plan = layout if isinstance(layout, RenderPlan) else get_plan(layout)
+    # The raster budget is per process: a warm worker's next job must not inherit this one's
+    previous_budget = set_raster_budget(int(memory_budget_mb) << 20) if memory_budget_mb is not None else None
+    try:
+        with RenderScope(ram=ram_scratch) as scope:
+            return _build_video(
+                scope, plan, script_path, audio_dir, image_dir, subtitle_path, output_path,
+                fast=fast, mood=mood, skip_tts=skip_tts, target_lufs=target_lufs, music=music,
+                beat_sync=beat_sync, output_profiles=output_profiles, proxy=proxy, encoding=encoding,
+                frame_mode=frame_mode, transition=transition, placeholders=placeholders,
+                scene_threshold=scene_threshold, stream_sink=stream_sink,
+            )
+    finally:
+        if previous_budget is not None:
+            set_raster_budget(previous_budget)
+
+def _build_video(scope, plan, script_path, audio_dir, image_dir, subtitle_path, output_path, fast=False, mood="angry", skip_tts=False, target_lufs=TARGET_LUFS, music=True, beat_sync=False, output_profiles=None, proxy=False, encoding=DEFAULT_ENCODING, frame_mode="dedup", transition="cut", placeholders=False, scene_threshold=DEFAULT_THRESHOLD, stream_sink=None):
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    output_profiles = list(output_profiles or ["reel"])
+    if proxy:
+        # Proxy renders only the small profile, next to (not over) the final video
+        output_profiles = ["proxy"]
+        output_path = output_path_for(output_path, "proxy", None)
+    unknown = [name for name in output_profiles if name not in plan.profiles]
+    if unknown:
+        raise ValueError(f"Unknown output profile(s): {', '.join(unknown)}")
+    if fast or proxy:
+        # --fast and proxy renders keep the old ultrafast/12 fps behaviour
+        encoding = "draft"
+    if encoding not in ENCODING_PROFILES:
+        raise ValueError(f"Unknown encoding profile: {encoding}")
+    enc = ENCODING_PROFILES[encoding]
+    if frame_mode not in FRAME_MODES:
+        raise ValueError(f"Unknown frame mode: {frame_mode}")
 
     with open(script_path, "r", encoding="utf-8") as f:
         lines = [line.strip() for line in f.readlines() if line.strip()]
     # Extract title as header if first line starts with "#"
-    global HEADER_TEXT
+    header_text = plan.header_text
     if lines and lines[0].startswith("#"):
-        HEADER_TEXT = lines[0][1:].strip().replace("\\n", "\n")
+        header_text = lines[0][1:].strip().replace("\\n", "\n")
         lines = lines[1:]  # remove title from lines to avoid using as subtitle
 
-    clips = []
+    # Scenes are shared by every output profile: image, narration and timing
+    scenes = []
+    narration_clips = []
 
-    # Track start and end times for each video clip segment
-    clip_times = []
     current_time = 0.0
-    from moviepy.editor import concatenate_audioclips
 
     # Prepare list to hold all SFX clips
     sfx_clips = []
-
-    # --- Image hash-based merging logic ---
-    current_hash = None
-    audio_segments = []
-    current_audio_paths = []
-    prev_img_file = None
-
-    # Load background music and detect beat times
-    # bg_music_path = "music/hiphop_angry.mp3"
-    # beat_times = []
-    # if os.path.exists(bg_music_path) and librosa:
-    #     print("🔊 Loading background music for analysis...")
-    #     y, sr = librosa.load(bg_music_path, sr=None)
-    #     print("⏳ Performing beat detection (this may take a moment)...")
-    #     _, beat_frames = librosa.beat.beat_track(y=y, sr=sr, tightness=100)
-    #     beat_times = librosa.frames_to_time(beat_frames, sr=sr)
-    #     print(f"✅ Beat detection completed: {len(beat_times)} beats found.")
-    # else:
-    #     beat_times = []
-    beat_times = []  # beat effect disabled
+    # Everything the mix depends on, for the audio cache key
+    audio_recipe = []
+
+    # Music, transition SFX and random transitions are picked from the script's
+    # seed, so re-renders reuse the cached mix and match the dry run
+    seed = script_seed(lines)
+    # Background music is picked up front so scene cuts can be placed on its beats
+    music_path = choose_music(mood, seed) if music else None
+    beat_times = []
+    if beat_sync and music_path:
+        # Cached per track; beats repeat as the bed loops under the timeline
+        beat_times = timeline_beats(analyze_music(music_path), MAX_TIMELINE_SEC)
+
+    # Per-line MP3s or packed PCM narration (read from a memory map, never decoded)
+    narration = scope.clip(open_narration(audio_dir))
+    # Reference level for SFX: narration loudness from cached per-line measurements
+    narration_lufs = narration_loudness((), [narration.loudness(i) for i in range(1, len(lines) + 1) if narration.has(i)])
+    # Length of each line's audio as decoded for the mix; the subtitle cues are split by it
+    line_seconds = {}
 
     PADDING_AFTER_AUDIO = 0.0  # Add a slight pause after each TTS line
-    for idx, line in enumerate(lines, start=1):
-        # Support multiple image extensions
-        img_file = None
-        # Try current and previous lines down to line 1
-        for fallback_idx in reversed(range(1, idx + 1)):
-            for ext in (".png", ".jpg", ".jpeg"):
-                candidate = os.path.join(image_dir, f"line_{fallback_idx:02}{ext}")
-                if os.path.exists(candidate):
-                    img_file = candidate
-                    break
-            if img_file:
-                break
-        audio_file = os.path.join(audio_dir, f"line_{idx:02}.mp3")
-
-        missing_items = []
-        if not os.path.exists(img_file):
-            missing_items.append("image")
-        if not os.path.exists(audio_file):
-            missing_items.append("audio")
-        if missing_items:
-            print(f"⚠️ Skipping line {idx}: missing {', '.join(missing_items)}.")
-            continue
-
-        # --- Compute image hash and merge logic ---
-        img_hash = compute_image_hash(img_file)
-        if current_hash is None:
-            current_hash = img_hash
-            # --- Insert intro SFX before adding very first clip ---
-            intro_sfx_path = "sound_effect/intro.mp3"
-            if os.path.exists(intro_sfx_path):
-                intro_sfx = AudioFileClip(intro_sfx_path).set_start(0).volumex(0.32)
-                sfx_clips.append(intro_sfx)
-
-        # If image changed, flush previous group
-        if img_hash != current_hash:
-            if current_audio_paths:
-                merged = sum([AudioSegment.from_file(p) for p in current_audio_paths])
-                temp_audio_path = tempfile.NamedTemporaryFile(delete=False, suffix=".wav").name
-                merged.export(temp_audio_path, format="wav")
-                audio = AudioFileClip(temp_audio_path)
-
-                duration = audio.duration + PADDING_AFTER_AUDIO
-                clip_times.append((current_time, current_time + duration))
-                current_time += duration
-
-                bg_clip = ColorClip(size=(1080, 1920), color=(0, 0, 0)).set_duration(duration)
-                # Load the square image and resize so its width matches VIDEO_WIDTH (1080)
-                fg = ImageClip(prev_img_file).set_duration(duration).resize(width=VIDEO_WIDTH)
-                w, h = fg.size
-
-                # Crop 10% from top and 10% from bottom
-                crop_top = int(h * 0.10)
-                crop_bottom = h - crop_top
-                fg = fg.crop(x1=0, y1=crop_top, x2=w, y2=crop_bottom)
-                h = crop_bottom - crop_top
-                # Center the cropped image both horizontally and vertically
-                fg_clip = fg.set_position(("center", "center"))
-
-                shadow = ColorClip(size=fg_clip.size, color=(0, 0, 0)).set_opacity(0.5).set_duration(duration)
-                shadow = shadow.set_position((15, 15))
-                moving_fg = CompositeVideoClip([shadow, fg_clip], size=fg_clip.size)
-                # No fade-in/out applied to avoid audio artifacts
-
-                clip = CompositeVideoClip(
-                    [bg_clip, moving_fg.set_position(("center", "center"))],
-                    size=(1080, 1920)
-                ).set_audio(audio).set_fps(24)
-                clips.append(clip)
-
-                # Add transition SFX between clips, after every scene group except the very last
-                if len(clips) >= 1:
-                    trans_candidates = [
-                        "sound_effect/trans_1.mp3",
-                        "sound_effect/trans_2.mp3",
-                        "sound_effect/trans_3.mp3",
-                        "sound_effect/trans_4.mp3",
-                        "sound_effect/trans_5.mp3"
-                    ]
-                    import random
-                    trans_sfx = random.choice([p for p in trans_candidates if os.path.exists(p)])
-                    if trans_sfx:
-                        sfx_seg = AudioSegment.from_file(trans_sfx)
-                        # Normalize to target dBFS
-                        target_dBFS = -20.0
-                        change_in_dBFS = target_dBFS - sfx_seg.dBFS
-                        sfx_seg = sfx_seg.apply_gain(change_in_dBFS)
-                        leading_silence = detect_leading_silence(sfx_seg) / 1000.0
-                        temp_sfx_path = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3").name
-                        sfx_seg.export(temp_sfx_path, format="mp3")
-                        sfx = AudioFileClip(temp_sfx_path).set_start(current_time - leading_silence).volumex(0.32)
-                        sfx_clips.append(sfx)
-
-            current_audio_paths = []
-            current_hash = img_hash
-
-        current_audio_paths.append(audio_file)
-        prev_img_file = img_file
-
-    # --- After loop, flush remaining group if any ---
-    if current_audio_paths:
-        merged = sum([AudioSegment.from_file(p) for p in current_audio_paths])
-        temp_audio_path = tempfile.NamedTemporaryFile(delete=False, suffix=".wav").name
-        merged.export(temp_audio_path, format="wav")
-        audio = AudioFileClip(temp_audio_path)
-
-        duration = audio.duration + PADDING_AFTER_AUDIO
-        clip_times.append((current_time, current_time + duration))
-        current_time += duration
-
-        bg_clip = ColorClip(size=(1080, 1920), color=(0, 0, 0)).set_duration(duration)
-        # Load the square image and resize so its width matches VIDEO_WIDTH (1080)
-        fg = ImageClip(prev_img_file).set_duration(duration).resize(width=VIDEO_WIDTH)
-        w, h = fg.size
-
-        # Crop 10% from top and 10% from bottom
-        crop_top = int(h * 0.10)
-        crop_bottom = h - crop_top
-        fg = fg.crop(x1=0, y1=crop_top, x2=w, y2=crop_bottom)
-        h = crop_bottom - crop_top
-        # Center the cropped image both horizontally and vertically
-        fg_clip = fg.set_position(("center", "center"))
-
-        shadow = ColorClip(size=fg_clip.size, color=(0, 0, 0)).set_opacity(0.5).set_duration(duration)
-        shadow = shadow.set_position((15, 15))
-        moving_fg = CompositeVideoClip([shadow, fg_clip], size=fg_clip.size)
-        # No fade-in/out applied to avoid audio artifacts
-
-        clip = CompositeVideoClip(
-            [bg_clip, moving_fg.set_position(("center", "center"))],
-            size=(1080, 1920)
-        ).set_audio(audio).set_fps(24)
-        clips.append(clip)
-
-        # (Transition SFX before outro REMOVED as requested)
-        # Transition SFX logic removed as requested
-
-    # Treat outro.mov as a regular scene clip
-    # outro_path = "video/outro.mov"
-    # if os.path.exists(outro_path):
-    #     raw_outro = VideoFileClip(outro_path)
-    #     raw_outro = raw_outro.resize(width=VIDEO_WIDTH)  # make square fill width
-    #     duration_outro = raw_outro.duration
-    #     # Background for outro
-    #     outro_bg = ColorClip(size=(VIDEO_WIDTH, VIDEO_HEIGHT), color=(0, 0, 0)).set_duration(duration_outro)
-    #     # Composite outro on background, centered
-    #     outro_clip = CompositeVideoClip(
-    #         [outro_bg, raw_outro.set_position("center")],
-    #         size=(VIDEO_WIDTH, VIDEO_HEIGHT)
-    #     ).set_audio(raw_outro.audio).set_fps(24)
-    #     clips.append(outro_clip)
-
-
-    # Concatenate clips without padding
-    final = concatenate_videoclips(clips, method="compose")
-
-    # After concatenation, overwrite the subtitle file with new SRT based on actual video clip structure
-    # Only do this if there are lines (to avoid empty SRT)
-
-    subs = []
-    line_idx = 0
-    for start, end in clip_times:
-        group_duration = end - start
-
-        # Collect all audio files in this group
-        group_audio_paths = []
-        total_audio_duration = 0.0
-        current_idx = line_idx
-        while current_idx < len(lines):
-            audio_path = os.path.join(audio_dir, f"line_{current_idx+1:02}.mp3")
-            if not os.path.exists(audio_path):
-                break
-            group_audio_paths.append(audio_path)
-            total_audio_duration += AudioSegment.from_file(audio_path).duration_seconds
-            current_idx += 1
-            # Break early if accumulated audio duration exceeds group_duration with small buffer
-            if total_audio_duration >= group_duration - 0.05:
-                break
-
-        accumulated_time = start
-        for i, audio_path in enumerate(group_audio_paths):
-            dur = AudioSegment.from_file(audio_path).duration_seconds
-            portion = (dur / total_audio_duration) * group_duration if total_audio_duration > 0 else group_duration / len(group_audio_paths)
-            seg_start = accumulated_time
-            seg_end = seg_start + portion
-            content = lines[line_idx + i]
-            subs.append(srt.Subtitle(
-                index=len(subs) + 1,
-                start=timedelta(seconds=seg_start),
-                end=timedelta(seconds=seg_end),
-                content=content
-            ))
-            accumulated_time = seg_end
-
-        line_idx += len(group_audio_paths)
+
+    def flush_scene(group, snap_to_beat):
+        """Merge a scene group's narration into one scene starting at current_time."""
+        nonlocal current_time
+        with profiler.span("scene", cat="scene", index=group["index"], lines=len(group["lines"])):
+            segments = [narration.segment(i) for i in group["lines"]]
+            for i, seg in zip(group["lines"], segments):
+                line_seconds[i] = seg.duration_seconds
+            merged = sum(segments)
+            temp_audio_path = scope.temp_path(".wav")
+            merged.export(temp_audio_path, format="wav")
+            audio = scope.clip(AudioFileClip(temp_audio_path))
+
+            # Hold the scene until the next beat if one is close enough
+            cut_time = current_time + audio.duration + PADDING_AFTER_AUDIO
+            if snap_to_beat and len(beat_times):
+                cut_time = next_beat(cut_time, beat_times)
+            duration = cut_time - current_time
+            scenes.append({"image": group["image"], "start": current_time, "duration": duration, "lines": group["lines"]})
+            narration_clips.append(audio.set_start(current_time))
+            audio_recipe.append(("narration", [narration.digest(i) for i in group["lines"]], round(current_time, 6)))
+            current_time = cut_time
+
+    # Lines whose image looks like the scene's first image (perceptual hash
+    # within scene_threshold bits) share a scene; grouped as the dry run does
+    scene_groups, skipped = group_scenes(
+        lines, image_dir, narration, placeholders, scene_threshold,
+        card=lambda idx, text: placeholder_image(image_dir, idx, text),
+    )
+    for skip in skipped:
+        print(f"⚠️ Skipping line {skip['line']}: missing {', '.join(skip['missing'])}.")
+    placeholder_lines = [idx for group in scene_groups if group["placeholder"] for idx in group["lines"]]
+
+    # --- Insert intro SFX before adding very first clip ---
+    if scene_groups and os.path.exists(INTRO_SFX):
+        intro_gain = db_to_gain(sfx_gain_db(INTRO_SFX, narration_lufs))
+        intro_sfx = scope.clip(AudioFileClip(INTRO_SFX)).set_start(0).volumex(intro_gain)
+        sfx_clips.append(intro_sfx)
+        audio_recipe.append(("sfx", file_digest(INTRO_SFX), 0.0, round(intro_gain, 6)))
+
+    for i, group in enumerate(scene_groups):
+        last = i == len(scene_groups) - 1
+        # The last scene is not held to a beat
+        flush_scene(group, snap_to_beat=not last)
+        if last:
+            break
+
+        # Add transition SFX between clips, after every scene group except the very last
+        trans_sfx = choose_transition_sfx(seed, group["index"])
+        if trans_sfx:
+            sfx_seg = load_sfx(trans_sfx)
+            # Level relative to the narration (loudness cached per SFX file)
+            sfx_seg = sfx_seg.apply_gain(sfx_gain_db(trans_sfx, narration_lufs))
+            leading_silence = detect_leading_silence(sfx_seg) / 1000.0
+            # Kept as PCM: the mix is compressed once, in the final AAC encode
+            temp_sfx_path = scope.temp_path(".wav")
+            sfx_seg.export(temp_sfx_path, format="wav")
+            sfx_time = nearest_beat(current_time, beat_times) if len(beat_times) else current_time
+            sfx = scope.clip(AudioFileClip(temp_sfx_path)).set_start(sfx_time - leading_silence)
+            sfx_clips.append(sfx)
+            audio_recipe.append(("sfx", file_digest(trans_sfx), round(sfx_time - leading_silence, 6), round(sfx_gain_db(trans_sfx, narration_lufs), 6)))
+
+    if not scenes:
+        raise RuntimeError("No scenes to render: every line is missing its image or audio.")
+
+    # After grouping, overwrite the subtitle file with cues of each scene's own lines,
+    # splitting the scene (beat hold included) in proportion to their narration
+    cue_scenes = []
+    for scene in scenes:
+        start_ms = round(scene["start"] * 1000)
+        cue_scenes.append({
+            "lines": scene["lines"], "start": start_ms,
+            "duration": round((scene["start"] + scene["duration"]) * 1000) - start_ms,
+        })
+    line_ms = {idx: round(seconds * 1000) for idx, seconds in line_seconds.items()}
+    subs = [
+        srt.Subtitle(index=i, start=timedelta(milliseconds=cue["start"]), end=timedelta(milliseconds=cue["end"]), content=cue["text"])
+        for i, cue in enumerate(scene_cues(cue_scenes, line_ms, lines), start=1)
+    ]
 
     with open(subtitle_path, "w", encoding="utf-8") as f:
         f.write(srt.compose(subs))
 
-    # Enforce vertical 9:16 aspect ratio and center images
-    final = final.on_color(size=(1080, 1920), color=(0, 0, 0), pos=('center', 'center'))
-
-    def choose_random_music(mood):
-        music_dir = "music"
-        if mood not in ("happy", "angry"):
-            return None
-        candidates = [os.path.join(music_dir, f) for f in os.listdir(music_dir) if f.startswith(mood) and f.endswith(".mp3")]
-        if not candidates:
-            return None
-        return random.choice(candidates)
-
-    # Skip background music, use only main audio and SFX
-    if sfx_clips:
-        if final.audio:
-            all_audio = [final.audio, *sfx_clips]
-        else:
-            all_audio = sfx_clips
-        final = final.set_audio(CompositeAudioClip(all_audio))
-
-    # Add subtitles
-    if os.path.exists(subtitle_path):
-        with open(subtitle_path, "r", encoding="utf-8") as f:
-            srt_text = f.read()
-            subs = list(srt.parse(srt_text))
-
-            subtitles = []
-            for sub in subs:
-                start = sub.start.total_seconds()
-                end = sub.end.total_seconds()
-                duration_sub = end - start
-                content = sub.content
-
-                # Use explicit line breaks from script
-                wrapped = content.replace("\\n", "\n")
-
-                # Subtitle style: transparent bg, yellow text, thinner stroke, positioned directly below cropped image
-                # Compute actual cropped image height (1:0.8 of IMAGE_SIZE)
-                h_img = int(IMAGE_SIZE * 0.8)
-                image_top = int((VIDEO_HEIGHT - h_img) / 2)
-                subtitle_fontsize = int((SUBTITLE_FONT_SIZE / 2) * 1.69)
-                subtitle_y = image_top + h_img + SUBTITLE_OFFSET
-                txt_clip = (
-                    TextClip(
-                        wrapped,
-                        font="fonts/title_2.otf",
-                        fontsize=subtitle_fontsize,
-                        bg_color='rgba(0,0,0,0.0)',  # transparent background
-                        color='yellow',
-                        stroke_width=1,
-                        stroke_color='black',
-                        method='label'
-                    )
-                    .set_start(start)
-                    .set_duration(duration_sub)
-                    .set_position(('center', subtitle_y))
-                    .crossfadein(0.2)
-                    .crossfadeout(0.2)
-                )
-                subtitles.append(txt_clip)
-
-            final = CompositeVideoClip([final, *subtitles], size=(1080, 1920))
-
-    # Overlay fixed text "야무진 동생" at Y = 4 * font size from the top
-    top_fontsize = 50
-    # Move “야무진 동생” down by four times its font size from the top
-    top_text_y = top_fontsize * 4
-    top_text_clip = TextClip(
-        "야무진 동생",
-        font="fonts/design.otf",
-        fontsize=top_fontsize,
-        color="white",
-        method="caption",
-        size=(VIDEO_WIDTH, None)
-    ).set_duration(final.duration).set_position(("center", top_text_y))
-    final = CompositeVideoClip([final, top_text_clip], size=(VIDEO_WIDTH, VIDEO_HEIGHT))
-
-    # Overlay title above the image, calculating height from line count
-    if HEADER_TEXT:
-        title_fontsize = int((IMAGE_TOP * 0.2) * 0.7 * 1.3)
-        # Calculate number of lines in HEADER_TEXT
-        lines = HEADER_TEXT.count("\n") + 1
-        title_height = title_fontsize * lines
-        title_y = IMAGE_TOP - title_height + title_fontsize
-        title_clip = TextClip(
-            HEADER_TEXT,
-            font="fonts/title_2.otf",
-            fontsize=title_fontsize,
-            color="white",
-            method="caption",
-            size=(VIDEO_WIDTH - 40, None)
-        ).set_duration(current_time).set_position(("center", title_y))
-        final = CompositeVideoClip([final, title_clip], size=(VIDEO_WIDTH, VIDEO_HEIGHT))
-
-    if fast:
-        # faster build: lower fps and use ultrafast preset
-        final.write_videofile(
-            output_path,
-            fps=12,
-            codec="libx264",
-            audio_codec="aac",
-            preset="ultrafast",
-            threads=8
-        )
+    # --- Audio: narration + SFX + music, mixed once for every output ---
+    # Rendered and encoded on its own thread while the frames are encoded, and
+    # cached, so only a change to the audio itself mixes it again
+    audio_bitrate = "48k" if proxy else enc["audio_bitrate"]
+    audio_key = recipe_key({
+        "version": AV_CACHE_VERSION, "clips": audio_recipe, "duration": round(current_time, 6),
+        "music": file_digest(music_path) if music_path else None, "narration_lufs": narration_lufs,
+        "target_lufs": target_lufs, "bitrate": audio_bitrate,
+    })
+    aac_path = os.path.join(AUDIO_CACHE_DIR, f"{audio_key}.m4a")
+    temp_aac_path = scope.temp_path(".m4a")
+
+    def render_audio():
+        narration = CompositeAudioClip(narration_clips).set_duration(current_time)
+
+        # Background music bed, ducked under the narration (SFX are not part of the sidechain)
+        duck_db = None
+        if music_path:
+            with profiler.span("audio.ducking"):
+                duck_db = ducking_curve(narration.to_soundarray(fps=ENVELOPE_SOURCE_FPS, quantize=False), ENVELOPE_SOURCE_FPS)
+
+        audio = CompositeAudioClip([narration, *sfx_clips]).set_duration(current_time) if sfx_clips else narration
+
+        # Master loudness: render the mixed timeline once, apply one gain and a limiter
+        with profiler.span("audio.mix"):
+            mix = audio.to_soundarray(fps=AUDIO_FPS, quantize=False)
+            if duck_db is not None:
+                mix = add_music_bed(mix, AUDIO_FPS, music_path, duck_db, narration_lufs)
+        with profiler.span("audio.normalize"):
+            mix = normalize_mix(mix, AUDIO_FPS, target_lufs=target_lufs)
+        with profiler.span("audio.encode"):
+            encode_audio(mix, AUDIO_FPS, temp_aac_path, bitrate=audio_bitrate)
+        return publish(temp_aac_path, aac_path)
+
+    audio_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio")
+    if os.path.exists(aac_path):
+        print("🔊 Audio unchanged, reusing the encoded mix")
+        audio_job = None
     else:
-        final.write_videofile(
-            output_path,
-            fps=30,
-            codec="libx264",
-            audio_codec="aac"
-        )
+        audio_job = audio_pool.submit(render_audio)
+
+    # Subtitles come from the rewritten SRT
+    with open(subtitle_path, "r", encoding="utf-8") as f:
+        subs = list(srt.parse(f.read()))
+
+    # --- Video: one composite per layout group, all written in a single pass over time ---
+    # Keyframes land exactly on the scene cuts
+    scene_cuts = [scene["start"] for scene in scenes[1:]]
+    fps = enc["fps"]
+    ffmpeg_params = video_params(enc, scene_cuts)
+    # Transitions are planned once so every layout shows the same ones
+    transition_plan = plan_transitions(scenes, transition, seed=seed)
+
+    # Video-only streams are keyed by everything drawn into the frames
+    fonts = {font: file_digest(font) for font in plan.fonts if os.path.exists(font)}
+    video_recipe = {
+        "version": AV_CACHE_VERSION, "encoding": enc, "frame_mode": frame_mode, "fps": fps, "params": ffmpeg_params,
+        "scenes": [(file_digest(scene["image"]), round(scene["start"], 6), round(scene["duration"], 6)) for scene in scenes],
+        "subs": [(sub.content, str(sub.start), str(sub.end)) for sub in subs],
+        "transitions": transition_plan, "duration": round(current_time, 6), "fonts": fonts,
+    }
+
+    with profiler.span("compose.setup"):
+        composites = []
+        writers = []
+        outputs_done = []       # final output paths
+        pending_mux = []        # (video-only path, final output path)
+        finished_video = []     # (temp path, cache path) moved into the cache after encoding
+        for group_index, names in enumerate(plan.groups(output_profiles)):
+            layout = plan.layout(names[0], header_text)
+            final_paths = [output_path_for(output_path, name, output_profiles[0]) for name in names]
+            sizes = [plan.profiles[name]["size"] for name in names]
+            writer_kwargs = dict(preset=enc["preset"], threads=enc.get("threads"), ffmpeg_params=ffmpeg_params)
+            outputs_done += final_paths
+
+            if stream_sink is not None and group_index == 0:
+                # The streamed output is muxed inside its writer so fragments leave while encoding:
+                # it waits for the audio instead of running alongside it
+                writer_kwargs.update(audio_path=audio_job.result() if audio_job else aac_path, sink=stream_sink)
+                outputs = list(zip(final_paths, sizes))
+            else:
+                key = recipe_key({**video_recipe, "layout": thaw(layout), "names": names})
+                cached = [os.path.join(VIDEO_CACHE_DIR, f"{key}_{name}.mp4") for name in names]
+                pending_mux += list(zip(cached, final_paths))
+                if all(os.path.exists(path) for path in cached):
+                    print(f"🎬 {', '.join(names)} unchanged, reusing the encoded video")
+                    continue
+                temp_paths = [scope.temp_path(f"_{name}.mp4") for name in names]
+                finished_video += list(zip(temp_paths, cached))
+                outputs = list(zip(temp_paths, sizes))
+
+            composites.append(scope.clip(compose_layout(scenes, subs, layout, current_time, transition_plan)))
+            # VFR frames reach ffmpeg through a concat list it reads in full only once
+            # every frame is drawn, so the streamed output is piped as CFR instead
+            if frame_mode == "vfr" and "sink" not in writer_kwargs:
+                writers.append(VfrWriter(layout["size"], fps, outputs, scratch_dir=scope.dir, **writer_kwargs))
+            else:
+                writers.append(MultiOutputWriter(layout["size"], fps, outputs, **writer_kwargs))
+            print(f"🎬 Rendering {', '.join(names)} → {', '.join(final_paths)}")
+
+    # Frames only change at scene cuts, subtitle fades and transitions; everything between is one run
+    if frame_mode == "cfr":
+        runs = [(i, 1) for i in range(int(current_time * fps))]
+    else:
+        boundaries, dense_windows = subtitle_events(subs)
+        boundaries += [scene["start"] for scene in scenes]
+        dense_windows += transition_windows(transition_plan)
+        boundaries += [t for window in transition_windows(transition_plan) for t in window]
+        runs = frame_runs(current_time, fps, boundaries, dense_windows)
+    try:
+        if writers:
+            render_outputs(composites, writers, runs, fps)
+        for temp_path, cache_path in finished_video:
+            publish(temp_path, cache_path)
+
+        # Both streams are ready: join them without touching either encode
+        if audio_job is not None:
+            with profiler.span("audio.wait"):
+                audio_job.result()
+        with profiler.span("mux"):
+            for video_path, final_path in pending_mux:
+                mux_streams(video_path, aac_path, final_path)
+    finally:
+        audio_pool.shutdown(wait=True)
+    return {
+        "duration": current_time,
+        "scene_cuts": scene_cuts,
+        "placeholder_lines": placeholder_lines,
+        "outputs": outputs_done,
+    }
+
+def render_outputs(composites, writers, runs, fps):
+    """
+    Walk the timeline once. Each run of identical frames is composited once per
+    layout and handed to the writer with its length, which repeats it (CFR) or
+    stores it with its duration (VFR).
+    """
+    n_frames = sum(count for _, count in runs)
+    print(f"🎞️ Compositing {len(runs)} distinct frames for {n_frames} output frames")
+    report_every = max(1, len(runs) // 10)
+    # Checked once: the unprofiled loop stays exactly as cheap as before
+    profiling = profiler.enabled()
+    try:
+        with profiler.span("frames", frames=len(runs)):
+            for done, (first, count) in enumerate(runs, start=1):
+                t = first / fps
+                for clip, writer in zip(composites, writers):
+                    if profiling:
+                        # "encode" is the time ffmpeg takes to accept the frame (pipe back-pressure)
+                        t0 = time.perf_counter()
+                        frame = clip.get_frame(t)
+                        t1 = time.perf_counter()
+                        writer.write_frame(frame, count)
+                        profiler.sample("frame.compose", t0, t1)
+                        profiler.sample("frame.encode", t1, time.perf_counter())
+                    else:
+                        writer.write_frame(clip.get_frame(t), count)
+                if done % report_every == 0:
+                    print(f"   {100 * done // len(runs)}% ({done}/{len(runs)} frames)")
+    finally:
+        with profiler.span("encode.finalize"):
+            for writer in writers:
+                writer.close()